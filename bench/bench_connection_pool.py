@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from DaydreamExt import DaydreamAPI  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(self.server.rtt)
+        body = json.dumps({'id': 'stub', 'whip_url': 'https://localhost/whip', 'params': {}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = _reply
+    do_PATCH = _reply
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, ssl_ctx, rtt):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.ssl_ctx = ssl_ctx
+        self.rtt = rtt
+        self.connections = 0
+
+    def finish_request(self, request, client_address):
+        self.connections += 1
+        time.sleep(self.rtt * 2 if self.ssl_ctx else self.rtt)
+        if self.ssl_ctx:
+            try:
+                request = self.ssl_ctx.wrap_socket(request, server_side=True)
+            except (ssl.SSLError, OSError):
+                return
+        super().finish_request(request, client_address)
+
+
+def make_server_context(workdir):
+    if not shutil.which('openssl'):
+        return None
+    cert = os.path.join(workdir, 'cert.pem')
+    key = os.path.join(workdir, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+        check=True, capture_output=True,
+    )
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+def run_case(base_url, use_pool, requests):
+    api = DaydreamAPI(token='bench', use_pool=use_pool)
+    api.BASE_URL = base_url
+    samples = []
+    try:
+        for i in range(requests):
+            start = time.perf_counter()
+            ok = api.update_stream('stub', 'stabilityai/sdxl-turbo', prompt=f'frame {i}', delta=0.5)
+            samples.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                raise RuntimeError('update_stream failed against stub server')
+    finally:
+        api.close()
+    return samples
+
+
+def summarize(label, samples, connections):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<12} mean {statistics.mean(samples):7.2f} ms  p50 {statistics.median(samples):7.2f} ms  "
+          f"p95 {p95:7.2f} ms  max {ordered[-1]:7.2f} ms  connections {connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-request latency of DaydreamAPI with and without the connection pool.')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--rtt-ms', type=float, default=10.0, help='simulated network round trip per exchange')
+    parser.add_argument('--plain', action='store_true', help='use plain HTTP instead of TLS')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        ssl_ctx = None if args.plain else make_server_context(workdir)
+        if not args.plain and ssl_ctx is None:
+            print('openssl not found, falling back to plain HTTP')
+        server = StubServer(ssl_ctx, args.rtt_ms / 1000.0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        scheme = 'https' if ssl_ctx else 'http'
+        base_url = f"{scheme}://localhost:{server.server_address[1]}/v1"
+        print(f"Stub server: {base_url}  requests: {args.requests}  simulated rtt: {args.rtt_ms} ms")
+        try:
+            for label, use_pool in (('no pool', False), ('pool', True)):
+                before = server.connections
+                samples = run_case(base_url, use_pool, args.requests)
+                summarize(label, samples, server.connections - before)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    socket.setdefaulttimeout(30)
+    main()
@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+os.environ['HOME'] = tempfile.mkdtemp(prefix='daydream-bench-')
+
+import td_shim  # noqa: E402
+
+td_shim.install()
+
+import DaydreamExt  # noqa: E402
+
+CASES = []
+
+
+def case(name):
+    def register(factory):
+        CASES.append((name, factory))
+        return factory
+    return register
+
+
+class InlineExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class DeferredExecutor:
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.tasks.append((fn, args, kwargs))
+
+    def drain(self):
+        while self.tasks:
+            fn, args, kwargs = self.tasks.pop(0)
+            fn(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class StubAPI:
+    def exchange_sdp(self, url, offer_sdp, token=None, timeout=None):
+        return 'v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\n', {'Livepeer-Playback-Url': 'https://stub/whep'}
+
+    def update_stream(self, stream_id, model_id, **params):
+        return self.update_stream_body(stream_id, json.dumps({
+            'pipeline': 'streamdiffusion',
+            'params': {'model_id': model_id, **params},
+        }).encode('utf-8'))
+
+    def update_stream_body(self, stream_id, data):
+        return len(data) > 0
+
+    def close(self):
+        pass
+
+
+class Context:
+    def __init__(self):
+        self.comp, self.ext = td_shim.create_extension(DaydreamExt.DaydreamExt, 'daydream_bench')
+        self.web_server = self.comp.op('web_server')
+        self.source = self.comp.op('stream_source')
+        self.offer = ('v=0\r\n' + 'a=candidate:1 1 udp 2122260223 10.0.0.1 50000 typ host\r\n' * 20).encode()
+
+    def streaming(self, clients):
+        ext = self.ext
+        ext.state = "STREAMING"
+        ext.stream_id = 'bench'
+        ext.whip_url = 'https://stub/whip'
+        ext.whep_url = 'https://stub/whep'
+        ext._stream_source = self.source
+        ext._web_server = self.web_server
+        ext._frame_encoder = None
+        ext._resetFrameChangeTracking()
+        ext._applyFrameSettings()
+        with ext._ws_lock:
+            ext.ws_clients = set(range(clients))
+        return ext
+
+    def close(self):
+        self.ext.state = "IDLE"
+        self.ext.Destroy()
+        td_shim.reset()
+
+
+@case('params.build_params.create')
+def bench_build_params_create(ctx):
+    params = ctx.ext.params
+    return lambda: params.build_params(for_update=False)
+
+
+@case('params.build_params.update')
+def bench_build_params_update(ctx):
+    params = ctx.ext.params
+    return lambda: params.build_params(for_update=True)
+
+
+@case('params.build_changed_params.prompt')
+def bench_build_changed_prompt(ctx):
+    params = ctx.ext.params
+    changed = {'Prompt'}
+    return lambda: params.build_changed_params(changed)
+
+
+@case('params.build_changed_params.controlnet')
+def bench_build_changed_controlnet(ctx):
+    params = ctx.ext.params
+    changed = {'Depth', 'Tile', 'Guidance', 'Stepschedule0step'}
+    return lambda: params.build_changed_params(changed)
+
+
+def route(ctx, uri, method='GET', data=b''):
+    handle = ctx.ext.OnHTTPRequest
+    base, _, query = uri.partition('?')
+    pars = dict(p.split('=', 1) for p in query.split('&') if '=' in p)
+
+    def call():
+        handle({'uri': uri, 'method': method, 'pars': pars, 'data': data}, {})
+    return call
+
+
+def param_update(ctx, name, values):
+    ext = ctx.streaming(clients=0)
+    ext.api = StubAPI()
+    executor = DeferredExecutor()
+    ext._updates = DaydreamExt.ParamsUpdatePipeline(ext.api, executor, ext._onParamsUpdateComplete, ext._payloads)
+    ext.SetParamPolicy(name, None)
+    par = getattr(ctx.comp.par, name)
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        par.val = values[state['i'] % len(values)]
+        ext.OnParameterChange(par)
+        ext._doParamsUpdate()
+        executor.drain()
+        td_shim.clear()
+    return call
+
+
+@case('params.update.prompt')
+def bench_update_prompt(ctx):
+    return param_update(ctx, 'Prompt', ['strawberry', 'blueberry'])
+
+
+@case('params.update.controlnet')
+def bench_update_controlnet(ctx):
+    return param_update(ctx, 'Depth', [0.45, 0.5])
+
+
+@case('params.update.stepschedule')
+def bench_update_stepschedule(ctx):
+    return param_update(ctx, 'Stepschedule0step', [11, 12])
+
+
+def cue_fire(ctx, prepared):
+    ext = ctx.streaming(clients=0)
+    ext.api = StubAPI()
+    ext.model_id = ext.params.Model
+    executor = DeferredExecutor()
+    ext._updates = DaydreamExt.ParamsUpdatePipeline(ext.api, executor, ext._onParamsUpdateComplete, ext._payloads)
+    ext.SaveCue('a', Prompt='strawberry', Depth=0.45, Guidance=1.0)
+    ext.SaveCue('b', Prompt='blueberry', Depth=0.5, Guidance=1.2)
+    names = ['a', 'b']
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        if not prepared:
+            ext._cues.invalidate()
+        ext.FireCue(names[state['i'] % 2])
+        executor.drain()
+        ext._cues.reset()
+        td_shim.clear()
+    return call
+
+
+@case('cues.fire.prepared')
+def bench_cue_fire_prepared(ctx):
+    return cue_fire(ctx, True)
+
+
+@case('cues.fire.cold')
+def bench_cue_fire_cold(ctx):
+    return cue_fire(ctx, False)
+
+
+def style_image_update(ctx, payloads):
+    ext = ctx.streaming(clients=0)
+    style = td_shim.TOP('style', ctx.comp, payload=b'\xff\xd8' + bytes(range(256)) * 6000)
+    par = ctx.comp.par
+    par.Styleimage.val = style.path
+    ext.OnParameterChange(par.Styleimage)
+    while ext.params.get_style_image_source() is None:
+        time.sleep(0.01)
+    api = StubAPI()
+    model_id = ext.params.Model
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        par.Ipadapterscale.val = 0.5 + (state['i'] % 2) * 0.1
+        ext.params.on_change(par.Ipadapterscale)
+        params = ext.params.build_params(for_update=True)
+        if payloads:
+            api.update_stream_body('bench', payloads.update_body(model_id, params))
+        else:
+            api.update_stream('bench', model_id, **params)
+    return call
+
+
+@case('params.style_image.unchanged')
+def bench_style_unchanged(ctx):
+    ext = ctx.streaming(clients=0)
+    style = td_shim.TOP('style', ctx.comp, payload=b'\xff\xd8' + bytes(range(256)) * 6000)
+    par = ctx.comp.par
+    par.Styleimage.val = style.path
+    ext.OnParameterChange(par.Styleimage)
+
+    def call():
+        style.cook()
+        ext.params.build_changed_params({'Ipadapterscale'})
+    return call
+
+
+def style_switch(ctx, cache_mb):
+    ext = ctx.streaming(clients=0)
+    pipeline = ext.params.style_images
+    pipeline.cache.set_limit(cache_mb)
+    tops = [td_shim.TOP(f'style{i}', ctx.comp, payload=b'\xff\xd8' + bytes([i]) * 1500000) for i in range(2)]
+    par = ctx.comp.par
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        par.Styleimage.val = tops[state['i'] % 2].path
+        ext.OnParameterChange(par.Styleimage)
+        ext.params.get_style_image_source()
+        while pipeline._scheduled:
+            time.sleep(0.0001)
+        td_shim.clear()
+    return call
+
+
+@case('params.style_image.switch.encode')
+def bench_style_switch_encode(ctx):
+    return style_switch(ctx, 0)
+
+
+@case('params.style_image.switch.disk_cache')
+def bench_style_switch_cached(ctx):
+    return style_switch(ctx, 256)
+
+
+def style_rotate(ctx, cache_mb):
+    ext = ctx.streaming(clients=0)
+    pipeline = ext.params.style_images
+    pipeline.cache.set_limit(cache_mb)
+    payloads = [b'\xff\xd8' + bytes([i + 16]) * 1500000 for i in range(2)]
+    top = td_shim.TOP('style_switch', ctx.comp, payload=payloads[0])
+    par = ctx.comp.par
+    par.Styleimage.val = top.path
+    ext.OnParameterChange(par.Styleimage)
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        top.payload = payloads[state['i'] % 2]
+        top.pixels = None
+        top.cook()
+        ext.params.get_style_image_source()
+        while pipeline._scheduled:
+            time.sleep(0.0001)
+        td_shim.clear()
+    return call
+
+
+@case('params.style_image.rotate_one_top.encode')
+def bench_style_rotate_encode(ctx):
+    return style_rotate(ctx, 0)
+
+
+@case('params.style_image.rotate_one_top.disk_cache')
+def bench_style_rotate_cached(ctx):
+    return style_rotate(ctx, 256)
+
+
+@case('payload.ip_adapter_change.json_dumps')
+def bench_payload_json_dumps(ctx):
+    return style_image_update(ctx, None)
+
+
+@case('payload.ip_adapter_change.builder')
+def bench_payload_builder(ctx):
+    return style_image_update(ctx, DaydreamExt.PayloadBuilder())
+
+
+@case('payload.controlnet_change.builder')
+def bench_payload_controlnet(ctx):
+    ext = ctx.streaming(clients=0)
+    payloads = DaydreamExt.PayloadBuilder()
+    par = ctx.comp.par
+    model_id = ext.params.Model
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        par.Depth.val = 0.4 + (state['i'] % 2) * 0.1
+        ext.params.on_change(par.Depth)
+        payloads.update_body(model_id, ext.params.build_changed_params({'Depth'}))
+    return call
+
+
+@case('params.rate_limit.animated_delta')
+def bench_rate_limit_animated(ctx):
+    ext = ctx.streaming(clients=0)
+    par = ctx.comp.par
+    state = {'i': 0}
+
+    def call():
+        state['i'] += 1
+        par.Delta.val = 0.4 + (state['i'] % 100) * 0.004
+        ext.params.on_change(par.Delta)
+        ext._param_limits.touch('Delta', time.monotonic())
+        ext._limitParamChanges({'Delta'})
+        ext._pending_changes.clear()
+        td_shim.clear()
+    return call
+
+
+def slider_tick(ctx, events):
+    ext = ctx.streaming(clients=0)
+    if events is not False:
+        ext.register_listener(lambda event, payload: None, events)
+    ext._pending_changes.update({'Prompt', 'Seed', 'Guidance', 'Delta', 'Depth', 'Tile'})
+    ext._params_update_scheduled = True
+
+    def call():
+        ext._scheduleParamsUpdate('Guidance')
+        ext._drainEvents()
+        td_shim.clear()
+    return call
+
+
+@case('events.slider_tick.no_listener')
+def bench_events_no_listener(ctx):
+    return slider_tick(ctx, False)
+
+
+@case('events.slider_tick.filtered_listener')
+def bench_events_filtered(ctx):
+    return slider_tick(ctx, ('state_changed', 'error'))
+
+
+@case('events.slider_tick.all_events_listener')
+def bench_events_all(ctx):
+    return slider_tick(ctx, None)
+
+
+@case('http.route.status')
+def bench_route_status(ctx):
+    return route(ctx, '/status')
+
+
+@case('http.route.relay_html')
+def bench_route_relay_html(ctx):
+    return route(ctx, '/relay.html')
+
+
+@case('http.route.not_found')
+def bench_route_not_found(ctx):
+    return route(ctx, '/favicon.ico')
+
+
+@case('http.route.whip_result_prefix')
+def bench_route_whip_result_prefix(ctx):
+    return route(ctx, '/whip/result/missing')
+
+
+@case('http.route.metrics')
+def bench_route_metrics(ctx):
+    return route(ctx, '/metrics')
+
+
+@case('http.route.logs')
+def bench_route_logs(ctx):
+    return route(ctx, '/logs?limit=100')
+
+
+@case('sdp.whip_proxy_and_result')
+def bench_whip_roundtrip(ctx):
+    ext = ctx.streaming(clients=0)
+    ext.api = StubAPI()
+    ext._executor = InlineExecutor()
+    handle = ext.http.handle
+    offer = ctx.offer
+
+    def call():
+        response = {}
+        handle({'uri': '/whip', 'method': 'POST', 'pars': {}, 'data': offer}, response)
+        request_id = json.loads(response['data'])['id']
+        handle({'uri': f'/whip/result/{request_id}', 'method': 'GET', 'pars': {}}, {})
+        td_shim.clear()
+    return call
+
+
+@case('sdp.result.pending')
+def bench_result_pending(ctx):
+    ext = ctx.ext
+    ext._whep_requests['pending'] = {
+        'status': 'pending', 'offer': '', 'answer': None, 'error': None,
+        'whep_url': 'https://stub/whep', 'created': time.perf_counter(), 'delivered': False,
+    }
+    handle = ext.http.handle
+    return lambda: handle({'uri': '/whep/result/pending', 'method': 'GET', 'pars': {}}, {})
+
+
+@case('sdp.push_result')
+def bench_push_result(ctx):
+    ext = ctx.streaming(clients=1)
+    entry = {
+        'status': 'ready', 'offer': '', 'answer': 'v=0\r\n' * 40, 'error': None,
+        'whip_url': 'https://stub/whip', 'created': time.perf_counter(), 'delivered': False,
+    }
+    ext._whip_requests['ready'] = entry
+
+    def call():
+        entry['delivered'] = False
+        ext._pushSdpResult('whip', 'ready')
+    return call
+
+
+@case('relay.webrtc_stats')
+def bench_relay_webrtc_stats(ctx):
+    ext = ctx.streaming(clients=1)
+    ext.register_listener(lambda event, payload: None, 'webrtc_stats')
+    text = json.dumps({
+        'type': 'webrtc_stats',
+        'whip': {'fps': 30.0, 'bitrate_kbps': 2900.4, 'rtt_ms': 42.0, 'encode_ms': 3.1, 'jitter_ms': 1.2,
+                 'loss_pct': 0.0, 'available_kbps': 4800.0, 'quality_limit': 'none'},
+        'whep': {'fps': 29.8, 'bitrate_kbps': 3100.2, 'rtt_ms': 44.0, 'decode_ms': 2.4, 'jitter_ms': 3.5,
+                 'jitter_buffer_ms': 48.0, 'loss_pct': 0.12, 'frames_dropped': 0, 'freezes': 0},
+    })
+
+    def call():
+        ext.OnWebSocketReceiveText(0, text)
+        ext._drainEvents()
+        td_shim.clear()
+    return call
+
+
+def fanout(ctx, clients, cook=True):
+    ext = ctx.streaming(clients)
+    source = ctx.source
+    pacer = ext._pacer
+
+    def call():
+        if cook:
+            source.cook()
+        pacer._next = None
+        ext.OnTimerPulse()
+    return call
+
+
+@case('frames.fanout.1')
+def bench_fanout_1(ctx):
+    return fanout(ctx, 1)
+
+
+@case('frames.fanout.4')
+def bench_fanout_4(ctx):
+    return fanout(ctx, 4)
+
+
+@case('frames.fanout.16')
+def bench_fanout_16(ctx):
+    return fanout(ctx, 16)
+
+
+@case('frames.unchanged_source')
+def bench_unchanged(ctx):
+    return fanout(ctx, 4, cook=False)
+
+
+@case('frames.latency_stamped')
+def bench_latency_stamped(ctx):
+    call = fanout(ctx, 4)
+    ctx.ext._latency.active = True
+    return call
+
+
+@case('frames.pacer.between_ticks')
+def bench_pacer_between_ticks(ctx):
+    ext = ctx.streaming(4)
+    source = ctx.source
+    ext._pacer.set_rate(1)
+    ext.OnTimerPulse()
+
+    def call():
+        source.cook()
+        ext.OnTimerPulse()
+    return call
+
+
+def measure(fn, repeat, min_time):
+    for _ in range(10):
+        fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time / 5 or number >= 1 << 20:
+            break
+        number *= 2
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - start) / number * 1e6)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        'best_us': round(min(samples), 3),
+        'median_us': round(statistics.median(samples), 3),
+        'stdev_us': round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def run_cases(selected, repeat, min_time):
+    results = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, factory in selected:
+            ctx = Context()
+            try:
+                results[name] = measure(factory(ctx), repeat, min_time)
+            finally:
+                ctx.close()
+    return results
+
+
+def report(results, baseline, threshold):
+    regressions = []
+    print(f"{'case':<40} {'best':>10} {'median':>10} {'stdev':>8}" + (f" {'baseline':>10} {'delta':>8}" if baseline else ''))
+    for name, r in results.items():
+        line = f"{name:<40} {r['best_us']:>8.2f}us {r['median_us']:>8.2f}us {r['stdev_us']:>6.2f}us"
+        base = baseline.get(name) if baseline else None
+        if base:
+            delta = (r['median_us'] - base['median_us']) / base['median_us'] * 100
+            flag = ''
+            if delta > threshold:
+                flag = '  REGRESSION'
+                regressions.append(name)
+            elif delta < -threshold:
+                flag = '  faster'
+            line += f" {base['median_us']:>8.2f}us {delta:>+7.1f}%{flag}"
+        elif baseline is not None:
+            line += f" {'-':>10} {'new':>8}"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless micro-benchmarks for DaydreamExt using TouchDesigner shims.')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this substring')
+    parser.add_argument('--repeat', type=int, default=15, help='timed repeats per case')
+    parser.add_argument('--min-time', type=float, default=0.2, help='approximate seconds per case')
+    parser.add_argument('--save', metavar='PATH', help='write results as a baseline JSON file')
+    parser.add_argument('--compare', metavar='PATH', help='compare medians against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--list', action='store_true', help='list case names and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, _ in CASES:
+            print(name)
+        return 0
+    selected = [(name, factory) for name, factory in CASES if args.filter in name]
+    if not selected:
+        print(f"No cases match {args.filter!r}")
+        return 1
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    print(f"Python {platform.python_version()} on {platform.system()} {platform.machine()}  numpy/cv2: {DaydreamExt.FrameEncoder.available()}")
+    results = run_cases(selected, args.repeat, args.min_time)
+    regressions = report(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'version': DaydreamExt.VERSION,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0f}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
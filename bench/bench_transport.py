@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import DaydreamExt  # noqa: E402
+from DaydreamExt import FrameEncoder, QualityController, RAW_FRAME_HEADER, np, cv2  # noqa: E402
+
+SIZES = {'512': (512, 512), '720p': (1280, 720), '1080p': (1920, 1080)}
+
+
+def make_frames(width, height, count):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = np.empty((height, width, 4), np.float32)
+        frame[..., 0] = (x + i * 7) % width / width
+        frame[..., 1] = (y + i * 5) % height / height
+        frame[..., 2] = 0.5 + 0.5 * np.sin((x + y + i * 11) / 37.0)
+        frame[..., 3] = 1.0
+        frame[..., :3] += rng.normal(0, 0.02, (height, width, 3)).astype(np.float32)
+        frames.append(frame)
+    return frames
+
+
+def make_encoder(transport):
+    encoder = FrameEncoder(QualityController())
+    encoder.transport = transport
+    return encoder
+
+
+def decode(data):
+    if data[:4] == DaydreamExt.RAW_FRAME_MAGIC:
+        _, width, height = RAW_FRAME_HEADER.unpack_from(data)
+        return np.frombuffer(data, np.uint8, width * height * 4, RAW_FRAME_HEADER.size).reshape(height, width, 4).copy()
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def measure_cpu(transport, frames, repeat):
+    encoder = make_encoder(transport)
+    encoder._encode(frames[0])
+    encode_cpu, encode_wall, decode_wall, sizes = [], [], [], []
+    for _ in range(repeat):
+        for frame in frames:
+            cpu = time.thread_time()
+            wall = time.perf_counter()
+            data = encoder._encode(frame)
+            encode_wall.append((time.perf_counter() - wall) * 1000)
+            encode_cpu.append((time.thread_time() - cpu) * 1000)
+            sizes.append(len(data))
+            start = time.perf_counter()
+            decode(data)
+            decode_wall.append((time.perf_counter() - start) * 1000)
+    return encode_cpu, encode_wall, decode_wall, sizes
+
+
+def measure_latency(transport, frames, repeat):
+    encoder = make_encoder(transport)
+    encoder.start()
+    samples = []
+    try:
+        for _ in range(repeat):
+            for frame in frames:
+                start = time.perf_counter()
+                encoder.submit(frame)
+                while encoder.take() is None:
+                    time.sleep(0.0001)
+                samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        encoder.stop()
+    return samples
+
+
+def p95(samples):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU time and latency of the JPEG and raw RGBA frame transports.')
+    parser.add_argument('--sizes', default='512,720p,1080p', help=f"comma-separated subset of {', '.join(SIZES)}")
+    parser.add_argument('--frames', type=int, default=30, help='distinct source frames per size')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if np is None:
+        print('numpy is required for this benchmark')
+        return 1
+    transports = [t for t in DaydreamExt.FRAME_TRANSPORTS if FrameEncoder.available(t)]
+    if 'jpeg' not in transports:
+        print('cv2 not available, measuring the raw transport only')
+    print(f"Python {sys.version.split()[0]}  numpy {np.__version__}  cv2 {cv2.__version__ if cv2 else '-'}")
+    print('decode is measured with numpy/cv2 as a stand-in for the relay (createImageBitmap on the JPEG blob vs ImageData on the raw buffer)')
+    print(f"{'size':<7} {'transport':<9} {'encode cpu':>11} {'encode p95':>11} {'decode':>9} {'latency':>9} {'lat p95':>9} {'bytes':>10}")
+    for name in args.sizes.split(','):
+        width, height = SIZES[name]
+        frames = make_frames(width, height, args.frames)
+        for transport in transports:
+            encode_cpu, encode_wall, decode_wall, sizes = measure_cpu(transport, frames, args.repeat)
+            latency = measure_latency(transport, frames, args.repeat)
+            print(f"{name:<7} {transport:<9} {statistics.median(encode_cpu):8.2f} ms {p95(encode_wall):8.2f} ms "
+                  f"{statistics.median(decode_wall):6.2f} ms {statistics.median(latency):6.2f} ms "
+                  f"{p95(latency):6.2f} ms {int(statistics.mean(sizes)):>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+import builtins
+import heapq
+import itertools
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Par:
+    def __init__(self, name, val=None, style='Str'):
+        self.name = name
+        self.val = val
+        self.default = val
+        self.style = style
+        self.label = name
+        self.enable = True
+        self.readOnly = False
+        self.min = self.max = None
+        self.normMin = self.normMax = None
+        self.clampMin = self.clampMax = False
+        self.menuNames = []
+        self.menuLabels = []
+
+    def eval(self):
+        return self.val
+
+    def __repr__(self):
+        return f"Par({self.name!r}, {self.val!r})"
+
+
+class ParCollection:
+    def __init__(self, **values):
+        for name, val in values.items():
+            self._add(Par(name, val))
+
+    def _add(self, par, name=None):
+        object.__setattr__(self, name or par.name, par)
+        return par
+
+    def _remove(self, name):
+        self.__dict__.pop(name, None)
+
+    def __setattr__(self, name, value):
+        par = self.__dict__.get(name)
+        if isinstance(par, Par) and not isinstance(value, Par):
+            par.val = value
+        else:
+            object.__setattr__(self, name, value)
+
+    def __iter__(self):
+        return iter(list(self.__dict__.values()))
+
+
+class Block:
+    def __init__(self, index):
+        self.index = index
+        self.par = ParCollection()
+
+
+class Sequence:
+    def __init__(self, owner, page, name):
+        self.owner = owner
+        self.page = page
+        self.name = name
+        self.blocks = []
+        self._blockSize = 0
+        self._start = len(page.pars)
+
+    @property
+    def blockSize(self):
+        return self._blockSize
+
+    @blockSize.setter
+    def blockSize(self, size):
+        self._blockSize = size
+        template = self.page.pars[self._start:self._start + size]
+        block = Block(0)
+        for par in template:
+            self.owner.par._remove(par.name)
+            block.par._add(par, par.name)
+            par.name = f"{self.name}0{par.name.lower()}"
+            self.owner.par._add(par)
+        self.blocks = [block]
+
+    @property
+    def numBlocks(self):
+        return len(self.blocks)
+
+    def destroy(self):
+        self.owner.seq._remove(self.name)
+
+
+class SeqCollection:
+    def _add(self, seq):
+        setattr(self, seq.name, seq)
+        return seq
+
+    def _remove(self, name):
+        self.__dict__.pop(name, None)
+
+
+class Page:
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+        self.pars = []
+
+    def _append(self, name, style, val=None, size=1):
+        par = self.owner.par._add(Par(name, val, style))
+        self.pars.append(par)
+        return [par]
+
+    def appendStr(self, name, label=None):
+        return self._append(name, 'Str', '')
+
+    def appendFloat(self, name, label=None):
+        return self._append(name, 'Float', 0.0)
+
+    def appendInt(self, name, label=None):
+        return self._append(name, 'Int', 0)
+
+    def appendToggle(self, name, label=None):
+        return self._append(name, 'Toggle', False)
+
+    def appendMenu(self, name, label=None):
+        return self._append(name, 'Menu', '')
+
+    def appendPulse(self, name, label=None):
+        return self._append(name, 'Pulse')
+
+    def appendHeader(self, name, label=None):
+        return self._append(name, 'Header')
+
+    def appendSequence(self, name, label=None):
+        return self.owner.seq._add(Sequence(self.owner, self, name))
+
+    def destroy(self):
+        for par in self.pars:
+            self.owner.par._remove(par.name)
+        self.owner.customPages.remove(self)
+
+
+class ExtNamespace:
+    pass
+
+
+class OP:
+    def __init__(self, name, parent=None, **pars):
+        self.name = name
+        self._parent = parent
+        self.par = ParCollection(**pars)
+        self.ext = ExtNamespace()
+        self.storage = {}
+        self._children = {}
+        self.error_text = ''
+        if parent is not None:
+            parent._children[name] = self
+        _registry[self.path] = self
+
+    @property
+    def path(self):
+        if self._parent is None:
+            return f"/{self.name}"
+        return f"{self._parent.path}/{self.name}"
+
+    def parent(self):
+        return self._parent
+
+    def errors(self, recurse=False):
+        return self.error_text
+
+    def store(self, key, value):
+        self.storage[key] = value
+        return value
+
+    def fetch(self, key, default=None, search=True, storeDefault=False):
+        if key in self.storage:
+            return self.storage[key]
+        if search and self._parent is not None:
+            return self._parent.fetch(key, default, search, storeDefault)
+        if storeDefault:
+            self.storage[key] = default
+        return default
+
+    def op(self, name):
+        if name.startswith('/'):
+            return _registry.get(name)
+        return self._children.get(name)
+
+
+class COMP(OP):
+    def __init__(self, name, parent=None, **pars):
+        super().__init__(name, parent, **pars)
+        self.seq = SeqCollection()
+        self.customPages = []
+
+    def appendCustomPage(self, name):
+        page = Page(self, name)
+        self.customPages.append(page)
+        return page
+
+
+class TOP(OP):
+    def __init__(self, name, parent=None, width=512, height=512, payload=b'\xff\xd8' + b'\x00' * 24000):
+        super().__init__(name, parent)
+        self.width = width
+        self.height = height
+        self.totalCooks = 0
+        self.payload = payload
+        self.pixels = None
+        self.time = ExtNamespace()
+        self.time.frame = 0
+
+    def cook(self):
+        self.totalCooks += 1
+        self.time.frame += 1
+
+    def saveByteArray(self, filetype='.jpg', quality=1.0):
+        return self.payload
+
+    def numpyArray(self, delayed=False):
+        if np is None:
+            return None
+        if self.pixels is None or self.pixels.shape[:2] != (self.height, self.width):
+            self.pixels = np.full((self.height, self.width, 4), self.payload[-1] / 255.0, np.float32)
+        return self.pixels
+
+
+class webServerDAT(OP):
+    def __init__(self, name, parent=None):
+        super().__init__(name, parent, port=0, active=0)
+        self.sent_binary = 0
+        self.sent_text = 0
+        self.bytes_sent = 0
+        self.closed = []
+
+    def webSocketSendBinary(self, client, data):
+        self.sent_binary += 1
+        self.bytes_sent += len(data)
+
+    def webSocketSendText(self, client, text):
+        self.sent_text += 1
+        self.bytes_sent += len(text)
+
+    def webSocketClose(self, client):
+        self.closed.append(client)
+
+
+_registry = {}
+_scheduled = []
+_counter = itertools.count()
+_frame = 0
+
+
+def op(path):
+    if isinstance(path, OP):
+        return path
+    return _registry.get(path)
+
+
+def run(script, delayFrames=0, delayMilliSeconds=0):
+    due_frame = _frame + max(1, delayFrames) if delayFrames or not delayMilliSeconds else _frame
+    due_time = time.monotonic() + delayMilliSeconds / 1000.0
+    heapq.heappush(_scheduled, (due_frame, due_time, next(_counter), script))
+
+
+def advance(frames=1, now=None):
+    global _frame
+    executed = 0
+    for _ in range(frames):
+        _frame += 1
+        current = time.monotonic() if now is None else now
+        deferred = []
+        while _scheduled and _scheduled[0][0] <= _frame:
+            item = heapq.heappop(_scheduled)
+            if item[1] > current:
+                deferred.append(item)
+                continue
+            eval(item[3], {'op': op})
+            executed += 1
+        for item in deferred:
+            heapq.heappush(_scheduled, item)
+    return executed
+
+
+def pending():
+    return len(_scheduled)
+
+
+def clear():
+    _scheduled.clear()
+
+
+def reset():
+    global _frame
+    _registry.clear()
+    _scheduled.clear()
+    _frame = 0
+
+
+def install():
+    builtins.op = op
+    builtins.run = run
+    builtins.webServerDAT = webServerDAT
+
+
+def build_component(name='daydream'):
+    comp = COMP(name)
+    webServerDAT('web_server', comp)
+    OP('web_render', comp, url='', active=0)
+    OP('frame_timer', comp, active=0)
+    OP('param_exec', comp, pars='')
+    OP('text_overlay', comp, text='')
+    TOP('stream_source', comp)
+    return comp
+
+
+def create_extension(ext_class, name='daydream'):
+    comp = build_component(name)
+    ext = ext_class(comp)
+    comp.ext.Daydream = ext
+    return comp, ext
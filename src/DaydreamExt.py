@@ -6,11 +6,29 @@ import ssl
 import os
 import secrets
 import socket
+import struct
+import sys
+import types
 import webbrowser
 import base64
+import hashlib
+import mmap
+import bisect
+import random
+import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin
+import io
 import threading
 
+try:
+    import numpy as np
+    import cv2
+except ImportError:
+    np = None
+    cv2 = None
+
 VERSION = "0.1.7"
 
 API_TIMEOUT_CREATE = 15
@@ -23,24 +41,116 @@ JPEG_QUALITY_STYLE = 0.85
 JPEG_QUALITY_STREAM = 0.7
 
 MAX_STYLE_IMAGE_SIZE = 50 * 1024 * 1024
+STYLE_HASH_SIZE = 16
+STYLE_CACHE_SUFFIX = '.durl'
+STYLE_STAMP_INDEX_SIZE = 256
+
+FRAME_QUEUE_SIZE = 2
+FRAME_STATS_WINDOW = 120
+FRAME_SAMPLE_GRID = 64
+FRAME_KEEPALIVE_MS = 500
+FRAME_TARGET_FPS = 30
+FRAME_PACE_TOLERANCE = 0.1
+FRAME_PACE_RESYNC = 2
+FRAME_MAX_PAYLOAD = 256 * 1024
+FRAME_TRANSPORTS = ('jpeg', 'raw')
+RAW_FRAME_MAGIC = b'DDRF'
+RAW_FRAME_HEADER = struct.Struct('<4sHH')
+RAW_FRAME_MAX_SIZE = 512
+LATENCY_MAGIC = b'DDSQ'
+LATENCY_HEADER = struct.Struct('<4sId')
+LATENCY_WINDOW = 200
+LATENCY_MARKER_INTERVAL_MS = 3000
+LATENCY_MAX_MS = 30000
+WEBRTC_STATS_WINDOW = 60
+WEBRTC_STATS_FIELDS = {
+    'whip': ('fps', 'bitrate_kbps', 'rtt_ms', 'encode_ms', 'jitter_ms', 'loss_pct', 'available_kbps'),
+    'whep': ('fps', 'bitrate_kbps', 'rtt_ms', 'decode_ms', 'jitter_ms', 'jitter_buffer_ms', 'loss_pct',
+             'frames_dropped', 'freezes'),
+}
+
+ADAPT_INTERVAL_S = 0.5
+ADAPT_EWMA_ALPHA = 0.2
+ADAPT_HEADROOM = 0.6
+ADAPT_QUALITY_STEP = 0.05
+ADAPT_SCALE_STEP = 0.1
+
+SDP_DELIVERED_TTL = 30
+
+STANDBY_REFRESH_DELAY_MS = 1000
+STANDBY_MAX_AGE_S = 600
+STANDBY_MAX_IDLE_REFRESHES = 2
+STANDBY_PARAMS = ('Model', 'Width', 'Height', 'Steps')
+
+HOTSWAP_DELAY_MS = 500
+HOTSWAP_TIMEOUT_S = 30
+HOTSWAP_PARAMS = ('Model', 'Width', 'Height', 'Steps', 'Noise', 'Ipadaptertype')
+
+RECOVERY_BASE_DELAY_MS = 500
+RECOVERY_MAX_DELAY_MS = 30000
+RECOVERY_JITTER = 0.5
+RECOVERY_BUDGET = 5
+RECOVERY_WINDOW_S = 60
+RECOVERY_COOLDOWN_S = 30
 
 EXECUTOR_MAX_WORKERS = 4
+RUNTIME_MODULE = 'daydream_runtime'
+RUNTIME_MAX_WORKERS = 8
+RUNTIME_PORTS = 1
+WEB_SERVER_CHECK_DELAY_MS = 250
+WEB_SERVER_START_RETRIES = 3
+AUTH_CALLBACK_PATH = '/'
+WS_PATH = '/ws'
+POOL_MAX_PER_HOST = 4
+POOL_IDLE_TIMEOUT = 30
+POOL_MAX_REDIRECTS = 3
 PARAMS_UPDATE_DELAY_MS = 100
+PARAMS_TRAILING_MS = 300
+PARAMS_RETRY_LIMIT = 3
+PARAMS_RETRY_BASE_S = 0.25
+PARAMS_RATE_POLICIES = {
+    'Guidance': {'min_interval_ms': 200, 'rate': 4.0, 'burst': 2, 'abs_epsilon': 0.05},
+    'Delta': {'min_interval_ms': 200, 'rate': 4.0, 'burst': 2, 'abs_epsilon': 0.005},
+    'Ipadapterscale': {'min_interval_ms': 200, 'rate': 4.0, 'burst': 2, 'abs_epsilon': 0.01},
+    **{
+        name: {'min_interval_ms': 200, 'rate': 4.0, 'burst': 2, 'abs_epsilon': 0.01}
+        for name in ('Depth', 'Canny', 'Tile', 'Hed', 'Openpose', 'Color')
+    },
+}
+PARAMS_POLICY_KEYS = ('min_interval_ms', 'rate', 'burst', 'abs_epsilon', 'rel_epsilon', 'trailing_ms')
+CUE_STORAGE_KEY = 'daydream_cues'
+CUE_STATS_WINDOW = 120
+
+METRICS_PREFIX = 'daydream_'
+METRICS_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+EVENT_QUEUE_SIZE = 256
+EVENT_DRAIN_BUDGET_MS = 2.0
+
+LOG_BUFFER_SIZE = 1000
+LOG_RATE_LIMIT = 5
+LOG_RATE_WINDOW_S = 1.0
+LOG_MAX_KEYS = 512
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+LOG_TAGS = {'debug': '', 'info': '', 'warning': ' Warning', 'error': ' Error'}
 
 PUBLIC_CONTRACT = {
     'extension_name': 'Daydream',
     'lifecycle_methods': ['Login', 'Start', 'Stop', 'ResetParameters', 'Destroy'],
     'state_properties': ['state', 'Active', 'IsLoggedIn', 'ApiToken', 'stream_id', 'whip_url', 'whep_url'],
     'states': ['IDLE', 'CREATING', 'STREAMING', 'ERROR'],
-    'required_operators': ['web_server', 'web_server_sdp', 'web_server_auth', 'web_render', 'stream_source', 'frame_timer'],
+    'required_operators': ['web_server', 'web_render', 'stream_source', 'frame_timer'],
     'listener_api': ['register_listener', 'unregister_listener'],
     'events': [
         'initialized',
         'login_started', 'login_success', 'login_failed',
         'stream_create_started', 'stream_created', 'stream_create_failed',
         'streaming_started', 'streaming_stopped',
+        'standby_ready', 'standby_failed',
+        'stream_swap_started', 'stream_swapped', 'stream_swap_failed',
         'params_update_scheduled', 'params_update_sent', 'params_update_result',
-        'state_changed', 'error',
+        'cue_fired', 'cue_acked',
+        'stream_recovered', 'latency_measured', 'webrtc_stats', 'state_changed', 'error',
     ],
 }
 
@@ -52,6 +162,7 @@ def _create_ipv4_socket(host, port, timeout):
         try:
             sock = socket.socket(af, socktype, proto)
             sock.settimeout(timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             sock.connect(sa)
             return sock
         except OSError:
@@ -90,6 +201,154 @@ class IPv4HTTPSHandler(urllib.request.HTTPSHandler):
         return self.do_open(IPv4HTTPSConnection, req, context=self._context)
 
 
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+_RETRYABLE_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'PATCH', 'DELETE'))
+
+
+class ConnectionPool:
+    def __init__(self, ssl_ctx, max_per_host=POOL_MAX_PER_HOST, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.ssl_ctx = ssl_ctx
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = {}
+        self._in_use = {}
+        self._closed = False
+        self.stats = {'opened': 0, 'reused': 0, 'evicted': 0, 'stale_retries': 0}
+
+    def _new_connection(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = IPv4HTTPSConnection(host, port, timeout=timeout, context=self.ssl_ctx)
+        else:
+            conn = IPv4HTTPConnection(host, port, timeout=timeout)
+        with self._cond:
+            self.stats['opened'] += 1
+        return conn
+
+    def _evict_idle(self, key, now):
+        idle = self._idle.get(key)
+        if not idle:
+            return
+        fresh = []
+        for conn, last_used in idle:
+            if now - last_used > self.idle_timeout or conn.sock is None:
+                conn.close()
+                self.stats['evicted'] += 1
+            else:
+                fresh.append((conn, last_used))
+        self._idle[key] = fresh
+
+    def _acquire(self, key, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise OSError("Connection pool is closed")
+                now = time.monotonic()
+                self._evict_idle(key, now)
+                idle = self._idle.get(key)
+                if idle:
+                    conn, _ = idle.pop()
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    self.stats['reused'] += 1
+                    return conn, True
+                in_use = self._in_use.get(key, 0)
+                if in_use < self.max_per_host:
+                    self._in_use[key] = in_use + 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise OSError(f"Connection pool exhausted for {key[1]}:{key[2]}")
+                self._cond.wait(remaining)
+        return self._new_connection(key, timeout), False
+
+    def _release(self, key, conn, reusable):
+        with self._cond:
+            self._in_use[key] = max(0, self._in_use.get(key, 0) - 1)
+            if reusable and not self._closed and conn.sock is not None:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            else:
+                conn.close()
+            self._cond.notify()
+
+    def _send(self, conn, method, path, body, headers, timeout):
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.request(method, path, body=body, headers=headers)
+
+    def _receive(self, conn):
+        resp = conn.getresponse()
+        data = resp.read()
+        return resp, data
+
+    def _exchange(self, conn, reused, method, path, body, headers, timeout):
+        sent = False
+        try:
+            self._send(conn, method, path, body, headers, timeout)
+            sent = True
+            return self._receive(conn)
+        except _STALE_CONNECTION_ERRORS:
+            if not reused or (sent and method not in _RETRYABLE_METHODS):
+                raise
+        conn.close()
+        with self._cond:
+            self.stats['stale_retries'] += 1
+            self.stats['opened'] += 1
+        self._send(conn, method, path, body, headers, timeout)
+        return self._receive(conn)
+
+    def request(self, method, url, body=None, headers=None, timeout=API_TIMEOUT_UPDATE):
+        headers = dict(headers or {})
+        for _ in range(POOL_MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            scheme = parts.scheme.lower()
+            port = parts.port or (443 if scheme == 'https' else 80)
+            key = (scheme, parts.hostname, port)
+            path = parts.path or '/'
+            if parts.query:
+                path = f"{path}?{parts.query}"
+            conn, reused = self._acquire(key, timeout)
+            try:
+                resp, data = self._exchange(conn, reused, method, path, body, headers, timeout)
+            except Exception:
+                self._release(key, conn, False)
+                raise
+            self._release(key, conn, not resp.will_close)
+            location = resp.getheader('Location')
+            if resp.status in (307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.msg, io.BytesIO(data))
+            return resp.status, resp.getheaders(), data
+        raise urllib.error.HTTPError(url, resp.status, "Too many redirects", resp.msg, io.BytesIO(data))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'idle': {f"{k[1]}:{k[2]}": len(v) for k, v in self._idle.items() if v},
+                'in_use': {f"{k[1]}:{k[2]}": n for k, n in self._in_use.items() if n},
+                **self.stats,
+            }
+
+
 CONTROLNET_SUPPORT = {
     "stabilityai/sdxl-turbo": {
         "depth": ("xinsir/controlnet-depth-sdxl-1.0", "depth_tensorrt"),
@@ -124,8 +383,27 @@ CONTROLNET_PARAM_MAP = {
     "color": "Color",
 }
 
+CONTROLNET_TEMPLATES = {
+    model: [
+        (
+            par_name, support[cn_type][0], support[cn_type][1],
+            f'{{"model_id": {json.dumps(support[cn_type][0])}, "conditioning_scale": ',
+            f', "preprocessor": {json.dumps(support[cn_type][1])}, "preprocessor_params": {{}}, "enabled": true}}',
+        )
+        for cn_type, par_name in CONTROLNET_PARAM_MAP.items() if cn_type in support
+    ]
+    for model, support in CONTROLNET_SUPPORT.items()
+}
+
+CONTROLNET_FRAGMENTS = {
+    (model_id, preprocessor): (prefix, suffix)
+    for templates in CONTROLNET_TEMPLATES.values()
+    for _, model_id, preprocessor, prefix, suffix in templates
+}
+
 CN_PARAMS_SET = {'Depth', 'Canny', 'Tile', 'Hed', 'Openpose', 'Color'}
 IP_PARAMS_SET = {'Ipadapter', 'Ipadapterscale', 'Styleimage', 'Ipadaptertype'}
+MODEL_PARAMS_SET = CN_PARAMS_SET | IP_PARAMS_SET
 
 IP_ADAPTER_SUPPORT = {
     "stabilityai/sdxl-turbo": {"regular", "faceid"},
@@ -134,12 +412,25 @@ IP_ADAPTER_SUPPORT = {
     "prompthero/openjourney-v4": {"regular"},
 }
 
+HOT_PARAMS = [
+    'Prompt', 'Negprompt', 'Seed', 'Guidance', 'Delta',
+    'Depth', 'Canny', 'Tile', 'Hed', 'Openpose', 'Color',
+    'Ipadapter', 'Ipadapterscale', 'Styleimage',
+]
+
+PERFORMANCE_PARAMS = [
+    'Skipunchanged', 'Changethreshold',
+    'Adaptivequality', 'Framebudget', 'Jpegqualitymin', 'Jpegqualitymax', 'Scalemin', 'Scalemax',
+]
+
 ALL_WATCHED_PARAMS = [
     "Login", "Resetparameters", "Active", "Model", "Prompt", "Negprompt", "Seed",
     "Guidance", "Delta", "Steps", "Stepschedule*",
     "Noise", "Width", "Height",
     "Depth", "Canny", "Tile", "Hed", "Openpose", "Color",
     "Ipadapter", "Ipadapterscale", "Styleimage", "Ipadaptertype",
+    *PERFORMANCE_PARAMS, "Transport", "Targetfps", "Standby", "Hotswap", "Stylecachesize", "Loglevel", "Sharedruntime",
+    "Calibratelatency",
 ]
 
 PARAM_DEFAULTS = {
@@ -164,23 +455,147 @@ PARAM_DEFAULTS = {
     'Styleimage': '',
     'Model': 'stabilityai/sdxl-turbo',
     'Active': False,
+    'Transport': 'jpeg',
+    'Targetfps': FRAME_TARGET_FPS,
+    'Skipunchanged': True,
+    'Changethreshold': 0.002,
+    'Adaptivequality': True,
+    'Framebudget': 8.0,
+    'Jpegqualitymin': 0.4,
+    'Jpegqualitymax': 0.85,
+    'Scalemin': 0.5,
+    'Scalemax': 1.0,
+    'Standby': False,
+    'Hotswap': False,
+    'Stylecachesize': 256,
+    'Loglevel': 'info',
+    'Sharedruntime': False,
+    'Calibratelatency': False,
 }
 
 
+class RingLogger:
+    def __init__(self, size=LOG_BUFFER_SIZE, level='info', rate_limit=LOG_RATE_LIMIT, window_s=LOG_RATE_WINDOW_S, owner=None):
+        self.owner = owner
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._seq = 0
+        self.levelno = LOG_LEVELS[level]
+        self.rate_limit = rate_limit
+        self.window_s = window_s
+        self.echo = True
+        self.suppressed = 0
+
+    @property
+    def level(self):
+        for name, levelno in LOG_LEVELS.items():
+            if levelno == self.levelno:
+                return name
+        return None
+
+    def set_level(self, level):
+        if level in LOG_LEVELS:
+            self.levelno = LOG_LEVELS[level]
+
+    def enabled(self, level):
+        return LOG_LEVELS[level] >= self.levelno
+
+    def debug(self, msg, *args, source='Daydream', key=None):
+        if self.levelno <= 10:
+            self._log('debug', msg, args, source, key)
+
+    def info(self, msg, *args, source='Daydream', key=None):
+        if self.levelno <= 20:
+            self._log('info', msg, args, source, key)
+
+    def warning(self, msg, *args, source='Daydream', key=None):
+        if self.levelno <= 30:
+            self._log('warning', msg, args, source, key)
+
+    def error(self, msg, *args, source='Daydream', key=None):
+        self._log('error', msg, args, source, key)
+
+    def _log(self, level, msg, args, source, key):
+        now = time.monotonic()
+        key = key or msg
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None or now - entry[0] >= self.window_s:
+                suppressed = entry[2] if entry else 0
+                if entry is None and len(self._keys) >= LOG_MAX_KEYS:
+                    self._keys = {k: v for k, v in self._keys.items() if now - v[0] < self.window_s}
+                entry = self._keys[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if entry[1] >= self.rate_limit:
+                entry[2] += 1
+                self.suppressed += 1
+                return
+            entry[1] += 1
+        try:
+            message = msg % args if args else msg
+        except (TypeError, ValueError):
+            message = f"{msg} {args!r}"
+        if suppressed:
+            message = f"{message} ({suppressed} similar suppressed)"
+        with self._lock:
+            self._seq += 1
+            self._records.append((self._seq, time.time(), level, source, message))
+        if self.echo:
+            print(f"{source}{LOG_TAGS[level]}: {message}")
+
+    def records(self, level=None, limit=None, since=None):
+        minimum = LOG_LEVELS.get(level, 0)
+        with self._lock:
+            records = list(self._records)
+        result = []
+        for seq, ts, lvl, source, message in reversed(records):
+            if since is not None and seq <= since:
+                break
+            if LOG_LEVELS[lvl] < minimum:
+                continue
+            result.append({'seq': seq, 'time': round(ts, 3), 'level': lvl, 'source': source, 'message': message})
+            if limit and len(result) >= limit:
+                break
+        result.reverse()
+        return result
+
+    def snapshot(self):
+        return {
+            'owner': self.owner,
+            'level': self.level,
+            'buffered': len(self._records),
+            'capacity': self._records.maxlen,
+            'last_seq': self._seq,
+            'suppressed': self.suppressed,
+        }
+
+
+log = RingLogger()
+
+
 class DaydreamAPI:
     BASE_URL = "https://api.daydream.live/v1"
 
-    def __init__(self, token=None):
+    def __init__(self, token=None, use_pool=True, pool=None, logger=None):
         self.token = token
-        self.ssl_ctx = ssl._create_unverified_context()
+        self.log = logger or log
+        self.ssl_ctx = pool.ssl_ctx if pool else ssl._create_unverified_context()
         self._opener = urllib.request.build_opener(
             IPv4HTTPHandler(),
             IPv4HTTPSHandler(context=self.ssl_ctx)
         )
+        self._owns_pool = pool is None and use_pool
+        self.pool = pool or (ConnectionPool(self.ssl_ctx) if use_pool else None)
 
     def set_token(self, token):
         self.token = token
 
+    def close(self):
+        if self.pool and self._owns_pool:
+            self.pool.close()
+
     def _get_headers(self):
         if not self.token:
             raise ValueError("API Token is not set")
@@ -190,6 +605,14 @@ class DaydreamAPI:
             "x-client-source": "touchdesigner",
         }
 
+    def _request(self, method, url, data, headers, timeout):
+        if self.pool:
+            _, resp_headers, body = self.pool.request(method, url, body=data, headers=headers, timeout=timeout)
+            return body, resp_headers
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        with self._opener.open(req, timeout=timeout) as resp:
+            return resp.read(), resp.getheaders()
+
     def create_stream(self, model_id="stabilityai/sdxl-turbo", **params):
         url = f"{self.BASE_URL}/streams"
         payload = {
@@ -197,36 +620,46 @@ class DaydreamAPI:
             "params": {"model_id": model_id, **params}
         }
         data = json.dumps(payload).encode('utf-8')
-        req = urllib.request.Request(url, data=data, headers=self._get_headers(), method="POST")
         try:
-            with self._opener.open(req, timeout=API_TIMEOUT_CREATE) as resp:
-                response_data = json.loads(resp.read().decode('utf-8'))
-                print(f"API: Stream created successfully. ID: {response_data.get('id')}")
-                return response_data
+            body, _ = self._request("POST", url, data, self._get_headers(), API_TIMEOUT_CREATE)
+            response_data = json.loads(body.decode('utf-8'))
+            self.log.info("Stream created successfully. ID: %s", response_data.get('id'), source='API')
+            return response_data
         except urllib.error.HTTPError as e:
             err_body = e.read().decode()
-            print(f"API Error {e.code}: {err_body}")
+            self.log.error("Create stream failed %s: %s", e.code, err_body, source='API')
             raise e
         except Exception as e:
-            print(f"API Connection Error: {e}")
+            self.log.error("Connection error: %s", e, source='API')
             raise e
 
     def update_stream(self, stream_id, model_id, **params):
         if not stream_id or not model_id:
-            print("API Warning: Missing stream_id or model_id for update")
+            self.log.warning("Missing stream_id or model_id for update", source='API')
             return
-        url = f"{self.BASE_URL}/streams/{stream_id}"
         payload = {
             "pipeline": "streamdiffusion",
             "params": {"model_id": model_id, **params}
         }
-        data = json.dumps(payload).encode('utf-8')
-        req = urllib.request.Request(url, data=data, headers=self._get_headers(), method="PATCH")
+        return self.update_stream_body(stream_id, json.dumps(payload).encode('utf-8'))
+
+    def update_stream_body(self, stream_id, data):
+        url = f"{self.BASE_URL}/streams/{stream_id}"
         try:
-            with self._opener.open(req, timeout=API_TIMEOUT_UPDATE) as resp:
-                return True
+            self._request("PATCH", url, data, self._get_headers(), API_TIMEOUT_UPDATE)
+            return True
         except Exception as e:
-            print(f"API Update Error: {e}")
+            self.log.error("Update failed: %s", e, source='API')
+            return False
+
+    def delete_stream(self, stream_id):
+        url = f"{self.BASE_URL}/streams/{stream_id}"
+        try:
+            self._request("DELETE", url, None, self._get_headers(), API_TIMEOUT_UPDATE)
+            self.log.info("Stream %s released", stream_id, source='API')
+            return True
+        except Exception as e:
+            self.log.warning("Releasing stream %s failed: %s", stream_id, e, source='API')
             return False
 
     def exchange_sdp(self, url, offer_sdp, token=None, timeout=API_TIMEOUT_SDP):
@@ -234,14 +667,13 @@ class DaydreamAPI:
         if token:
             headers["Authorization"] = f"Bearer {token}"
         data = offer_sdp.encode('utf-8')
-        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
         try:
-            with self._opener.open(req, timeout=timeout) as resp:
-                return resp.read().decode('utf-8'), dict(resp.getheaders())
+            body, resp_headers = self._request("POST", url, data, headers, timeout)
+            return body.decode('utf-8'), dict(resp_headers)
         except urllib.error.HTTPError as e:
             raise e
         except Exception as e:
-            print(f"API SDP Exchange Error: {e}")
+            self.log.error("SDP exchange failed: %s", e, source='API')
             raise e
 
     def create_api_key(self, jwt_token, name="TouchDesigner", user_type="touchdesigner"):
@@ -249,25 +681,1626 @@ class DaydreamAPI:
         payload = {"name": name, "user_type": user_type}
         data = json.dumps(payload).encode('utf-8')
         headers = {"Authorization": f"Bearer {jwt_token}", "Content-Type": "application/json", "x-client-source": "touchdesigner"}
-        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
         try:
-            with self._opener.open(req, timeout=API_TIMEOUT_UPDATE) as resp:
-                return json.loads(resp.read().decode('utf-8')).get('apiKey')
+            body, _ = self._request("POST", url, data, headers, API_TIMEOUT_UPDATE)
+            return json.loads(body.decode('utf-8')).get('apiKey')
         except urllib.error.HTTPError as e:
             err_body = e.read().decode()
-            print(f"API Error creating key {e.code}: {err_body}")
+            self.log.error("Creating key failed %s: %s", e.code, err_body, source='API')
             raise e
 
 
+class ParamsUpdatePipeline:
+    def __init__(self, api, executor, on_complete, payloads=None):
+        self.api = api
+        self.payloads = payloads
+        self.executor = executor
+        self.on_complete = on_complete
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._stream = None
+        self._pending = {}
+        self._pending_body = None
+        self._pending_seqs = []
+        self._inflight_seq = None
+        self._last_completed_seq = 0
+        self._failures = 0
+        self._backoff = False
+        self.retries = 0
+
+    def submit(self, stream_id, model_id, params, body=None):
+        with self._lock:
+            if self._stream != (stream_id, model_id):
+                self._stream = (stream_id, model_id)
+                self._pending = {}
+                self._pending_seqs = []
+                self._failures = 0
+            self._seq += 1
+            seq = self._seq
+            self._pending_body = body if not self._pending else None
+            self._pending.update(params)
+            self._pending_seqs.append(seq)
+            queued = self._inflight_seq is not None or self._backoff
+            if not queued:
+                self._start_locked()
+        return seq, queued
+
+    def _start_locked(self):
+        params, body, seqs = self._pending, self._pending_body, self._pending_seqs
+        self._pending, self._pending_body, self._pending_seqs = {}, None, []
+        seq = seqs[-1]
+        self._inflight_seq = seq
+        stream_id, model_id = self._stream
+        self.executor.submit(self._send, stream_id, model_id, seq, seqs[:-1], params, body)
+
+    def _send(self, stream_id, model_id, seq, merged, params, body=None):
+        start = time.perf_counter()
+        error = None
+        try:
+            if body is not None and stream_id:
+                ok = self.api.update_stream_body(stream_id, body)
+            elif self.payloads and stream_id and model_id:
+                ok = self.api.update_stream_body(stream_id, self.payloads.update_body(model_id, params))
+            else:
+                ok = self.api.update_stream(stream_id, model_id=model_id, **params)
+            if not ok:
+                error = "Update failed"
+        except Exception as e:
+            error = str(e)
+        rtt_ms = (time.perf_counter() - start) * 1000
+        retry_s = None
+        with self._lock:
+            self._inflight_seq = None
+            stale = self._stream != (stream_id, model_id) or seq <= self._last_completed_seq
+            if error is not None and not stale:
+                self._pending_body = body if not self._pending else None
+                self._pending = {**params, **self._pending}
+                if self._failures < PARAMS_RETRY_LIMIT:
+                    retry_s = PARAMS_RETRY_BASE_S * 2 ** self._failures
+                    self._failures += 1
+                    self._pending_seqs = [*merged, seq, *self._pending_seqs]
+                    self._backoff = True
+                    self.retries += 1
+                else:
+                    self._failures = 0
+            elif error is None:
+                self._failures = 0
+            if retry_s is None:
+                if not stale:
+                    self._last_completed_seq = seq
+                if self._pending_seqs and self._stream is not None:
+                    self._start_locked()
+        if retry_s is not None:
+            timer = threading.Timer(retry_s, self._retry)
+            timer.daemon = True
+            timer.start()
+        elif not stale:
+            self.on_complete(seq, merged, rtt_ms, error)
+
+    def _retry(self):
+        with self._lock:
+            self._backoff = False
+            if self._pending_seqs and self._inflight_seq is None and self._stream is not None:
+                self._start_locked()
+
+    def reset(self):
+        with self._lock:
+            self._stream = None
+            self._pending = {}
+            self._pending_body = None
+            self._pending_seqs = []
+            self._failures = 0
+            self._backoff = False
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return self._inflight_seq
+
+
+class ParamRateLimiter:
+    def __init__(self, policies=PARAMS_RATE_POLICIES):
+        self.policies = {name: dict(policy) for name, policy in policies.items()}
+        self._counts = {}
+        self.reset()
+
+    def reset(self):
+        self._last = {}
+        self._buckets = {}
+        self._changed_at = {}
+
+    def set_policy(self, name, policy):
+        if policy is None:
+            self.policies.pop(name, None)
+        else:
+            self.policies[name] = {k: v for k, v in policy.items() if k in PARAMS_POLICY_KEYS and v is not None}
+        self._last.pop(name, None)
+        self._buckets.pop(name, None)
+
+    def _count(self, name, key):
+        counts = self._counts.get(name)
+        if counts is None:
+            counts = self._counts[name] = {'sent': 0, 'unchanged': 0, 'held_epsilon': 0, 'held_rate': 0}
+        counts[key] += 1
+
+    def touch(self, name, now):
+        if name in self.policies:
+            self._changed_at[name] = now
+
+    def _tokens(self, name, policy, now):
+        burst = policy.get('burst', 1)
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = [float(burst), now]
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * policy['rate'])
+        bucket[1] = now
+        return bucket
+
+    @staticmethod
+    def _within_epsilon(policy, value, last_value):
+        try:
+            diff = abs(value - last_value)
+        except TypeError:
+            return False
+        if diff <= policy.get('abs_epsilon', 0.0):
+            return True
+        rel = policy.get('rel_epsilon')
+        return bool(rel) and diff <= rel * max(abs(value), abs(last_value))
+
+    def admit(self, name, value, now):
+        policy = self.policies.get(name)
+        if policy is None:
+            return 0.0
+        last = self._last.get(name)
+        if last is not None and value == last[0]:
+            self._count(name, 'unchanged')
+            return None
+        wait = 0.0
+        if last is not None:
+            quiet = now - self._changed_at.get(name, 0.0)
+            trailing = policy.get('trailing_ms', PARAMS_TRAILING_MS) / 1000
+            if quiet < trailing and self._within_epsilon(policy, value, last[0]):
+                self._count(name, 'held_epsilon')
+                return trailing - quiet
+            wait = last[1] + policy.get('min_interval_ms', 0) / 1000 - now
+        if policy.get('rate'):
+            tokens = self._tokens(name, policy, now)[0]
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / policy['rate'])
+        if wait > 0:
+            self._count(name, 'held_rate')
+            return wait
+        return 0.0
+
+    def record(self, name, value, now, sent=True):
+        policy = self.policies.get(name)
+        if policy is None:
+            return
+        self._last[name] = (value, now)
+        if sent:
+            self._count(name, 'sent')
+            if policy.get('rate'):
+                self._tokens(name, policy, now)[0] -= 1
+
+    def snapshot(self):
+        return {
+            name: {
+                'policy': dict(policy),
+                'last_sent': self._last[name][0] if name in self._last else None,
+                **self._counts.get(name, {'sent': 0, 'unchanged': 0, 'held_epsilon': 0, 'held_rate': 0}),
+            }
+            for name, policy in self.policies.items()
+        }
+
+
+class PayloadBuilder:
+    FRAGMENT_KEYS = ('controlnets', 'ip_adapter', 'ip_adapter_style_image_url')
+
+    def __init__(self):
+        self._fragments = {}
+        self.hits = 0
+        self.misses = 0
+        self.reused_bytes = 0
+        self.encoded_bytes = 0
+
+    def _fragment(self, key, value):
+        cached = self._fragments.get(key)
+        if cached is not None and cached[0] is value:
+            self.hits += 1
+            self.reused_bytes += len(cached[1])
+            return cached[1]
+        text = self._encode_controlnets(value) if key == 'controlnets' else json.dumps(value)
+        data = text.encode('utf-8')
+        self._fragments[key] = (value, data)
+        self.misses += 1
+        self.encoded_bytes += len(data)
+        return data
+
+    @staticmethod
+    def _encode_controlnets(controlnets):
+        parts = []
+        for cn in controlnets:
+            fragment = CONTROLNET_FRAGMENTS.get((cn.get('model_id'), cn.get('preprocessor')))
+            if fragment and len(cn) == 5 and cn.get('enabled') is True and cn.get('preprocessor_params') == {}:
+                parts.append(f"{fragment[0]}{json.dumps(cn['conditioning_scale'])}{fragment[1]}")
+            else:
+                parts.append(json.dumps(cn))
+        return '[' + ', '.join(parts) + ']'
+
+    def update_body(self, model_id, params):
+        parts = [b'{"pipeline": "streamdiffusion", "params": {"model_id": ', json.dumps(model_id).encode('utf-8')]
+        fragment_keys = self.FRAGMENT_KEYS
+        for key, value in params.items():
+            parts.append(f', {json.dumps(key)}: '.encode('utf-8'))
+            parts.append(self._fragment(key, value) if key in fragment_keys else json.dumps(value).encode('utf-8'))
+        parts.append(b'}}')
+        return b''.join(parts)
+
+    def reset(self):
+        self._fragments.clear()
+
+    def snapshot(self):
+        return {
+            'fragment_hits': self.hits,
+            'fragment_misses': self.misses,
+            'reused_bytes': self.reused_bytes,
+            'encoded_bytes': self.encoded_bytes,
+        }
+
+
+class RollingStats:
+    def __init__(self, window=FRAME_STATS_WINDOW):
+        self._values = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self._values.append(value)
+        self.count += 1
+
+    def snapshot(self):
+        values = sorted(self._values)
+        if not values:
+            return {'count': self.count, 'last': None, 'avg': None, 'p95': None, 'max': None}
+        return {
+            'count': self.count,
+            'last': round(self._values[-1], 3),
+            'avg': round(sum(values) / len(values), 3),
+            'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            'max': round(values[-1], 3),
+        }
+
+
+class Metrics:
+    def __init__(self, buckets=METRICS_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})
+            self._shards.append(shard)
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        counters = self._shard()[0]
+        key = (name, tuple(labels.items()))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value_ms, **labels):
+        histograms = self._shard()[1]
+        key = (name, tuple(labels.items()))
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        hist[bisect.bisect_left(self.buckets, value_ms)] += 1
+        hist[-1] += value_ms
+
+    def _merged(self):
+        counters, histograms = {}, {}
+        for shard_counters, shard_histograms in list(self._shards):
+            for key, value in list(shard_counters.items()):
+                counters[key] = counters.get(key, 0) + value
+            for key, hist in list(shard_histograms.items()):
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = list(hist)
+                else:
+                    for i, value in enumerate(hist):
+                        total[i] += value
+        return counters, histograms
+
+    def _quantile(self, counts, total, q):
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else '+Inf'
+        return None
+
+    def snapshot(self):
+        counters, histograms = self._merged()
+        result = {'uptime_s': round(time.time() - self.started, 1), 'counters': {}, 'histograms': {}}
+        for (name, labels), value in sorted(counters.items()):
+            result['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), hist in sorted(histograms.items()):
+            counts, total_ms = hist[:-1], hist[-1]
+            count = sum(counts)
+            cumulative = 0
+            buckets = []
+            for le, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                buckets.append([le, cumulative])
+            result['histograms'].setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': count,
+                'sum_ms': round(total_ms, 3),
+                'avg_ms': round(total_ms / count, 3) if count else None,
+                'p50_ms': self._quantile(counts, count, 0.5),
+                'p95_ms': self._quantile(counts, count, 0.95),
+                'p99_ms': self._quantile(counts, count, 0.99),
+                'buckets': buckets,
+            })
+        return result
+
+    @staticmethod
+    def _labels(labels, extra=None):
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+    def prometheus(self):
+        counters, histograms = self._merged()
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{METRICS_PREFIX}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{self._labels(labels)} {value}")
+        for (name, labels), hist in sorted(histograms.items()):
+            metric = f"{METRICS_PREFIX}{name}_ms"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            counts, total_ms = hist[:-1], hist[-1]
+            cumulative = 0
+            for le, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{self._labels(labels, ('le', le))} {cumulative}")
+            count = sum(counts)
+            lines.append(f"{metric}_bucket{self._labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {total_ms:.3f}")
+            lines.append(f"{metric}_count{self._labels(labels)} {count}")
+        lines.append(f"# TYPE {METRICS_PREFIX}uptime_seconds gauge")
+        lines.append(f"{METRICS_PREFIX}uptime_seconds {time.time() - self.started:.1f}")
+        return '\n'.join(lines) + '\n'
+
+
+class EventSubscription:
+    def __init__(self, fn, events=None, queue_size=EVENT_QUEUE_SIZE):
+        self.fn = fn
+        self.name = getattr(fn, '__qualname__', None) or repr(fn)
+        self.events = frozenset(events) if events is not None else None
+        self.queue = deque()
+        self.queue_size = max(1, int(queue_size))
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latency_ms = RollingStats()
+        self.call_ms = RollingStats()
+
+    def push(self, item):
+        dropped = False
+        if len(self.queue) >= self.queue_size:
+            try:
+                self.queue.popleft()
+                self.dropped += 1
+                dropped = True
+            except IndexError:
+                pass
+        self.queue.append(item)
+        return dropped
+
+    def snapshot(self):
+        return {
+            'name': self.name,
+            'events': sorted(self.events) if self.events is not None else None,
+            'queued': len(self.queue),
+            'queue_size': self.queue_size,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'latency_ms': self.latency_ms.snapshot(),
+            'call_ms': self.call_ms.snapshot(),
+        }
+
+
+class EventBus:
+    def __init__(self, schedule, metrics=None, budget_ms=EVENT_DRAIN_BUDGET_MS, logger=None):
+        self._schedule = schedule
+        self.metrics = metrics
+        self.log = logger or log
+        self.budget_ms = budget_ms
+        self._lock = threading.Lock()
+        self._subscriptions = ()
+        self._by_event = {}
+        self._wildcard = ()
+        self._drain_scheduled = False
+        self._cursor = 0
+        self.published = 0
+        self.skipped = 0
+
+    def subscribe(self, fn, events=None, queue_size=EVENT_QUEUE_SIZE):
+        if not callable(fn):
+            return None
+        if isinstance(events, str):
+            events = (events,)
+        with self._lock:
+            subscriptions = [sub for sub in self._subscriptions if sub.fn != fn]
+            sub = EventSubscription(fn, events, queue_size)
+            subscriptions.append(sub)
+            self._rebuild(subscriptions)
+        return sub
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            subscriptions = [sub for sub in self._subscriptions if sub.fn != fn]
+            if len(subscriptions) == len(self._subscriptions):
+                return False
+            self._rebuild(subscriptions)
+        return True
+
+    def _rebuild(self, subscriptions):
+        by_event = {}
+        for sub in subscriptions:
+            for event in sub.events or ():
+                by_event[event] = by_event.get(event, ()) + (sub,)
+        self._subscriptions = tuple(subscriptions)
+        self._wildcard = tuple(sub for sub in subscriptions if sub.events is None)
+        self._by_event = by_event
+
+    def wants(self, event):
+        return bool(self._wildcard) or event in self._by_event
+
+    def publish(self, event, payload):
+        targets = self._wildcard + self._by_event.get(event, ())
+        if not targets:
+            self.skipped += 1
+            return False
+        if callable(payload):
+            payload = payload()
+        item = (event, payload, time.perf_counter())
+        dropped = 0
+        for sub in targets:
+            dropped += sub.push(item)
+        self.published += 1
+        if dropped and self.metrics:
+            self.metrics.inc('events_dropped', dropped)
+        self._request_drain()
+        return True
+
+    def _request_drain(self):
+        with self._lock:
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        self._schedule()
+
+    def drain(self):
+        with self._lock:
+            self._drain_scheduled = False
+        subscriptions = self._subscriptions
+        if not subscriptions:
+            return 0
+        metrics = self.metrics
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        delivered = 0
+        count = len(subscriptions)
+        pending = True
+        while pending:
+            pending = False
+            start_index = self._cursor % count
+            for offset in range(count):
+                sub = subscriptions[(start_index + offset) % count]
+                try:
+                    event, payload, queued_at = sub.queue.popleft()
+                except IndexError:
+                    continue
+                start = time.perf_counter()
+                latency_ms = (start - queued_at) * 1000
+                sub.latency_ms.add(latency_ms)
+                try:
+                    sub.fn(event, payload)
+                except Exception as e:
+                    sub.errors += 1
+                    self.log.error("Listener error on '%s': %s", event, e)
+                end = time.perf_counter()
+                sub.call_ms.add((end - start) * 1000)
+                sub.delivered += 1
+                delivered += 1
+                if metrics:
+                    metrics.observe('event_delivery', latency_ms)
+                if sub.queue:
+                    pending = True
+                if end >= deadline:
+                    self._cursor = (start_index + offset + 1) % count
+                    pending = False
+                    break
+        if any(sub.queue for sub in subscriptions):
+            self._request_drain()
+        return delivered
+
+    def snapshot(self):
+        subscriptions = self._subscriptions
+        return {
+            'published': self.published,
+            'skipped': self.skipped,
+            'queued': sum(len(sub.queue) for sub in subscriptions),
+            'dropped': sum(sub.dropped for sub in subscriptions),
+            'budget_ms': self.budget_ms,
+            'listeners': [sub.snapshot() for sub in subscriptions],
+        }
+
+
+class QualityController:
+    def __init__(self, quality=JPEG_QUALITY_STREAM, scale=1.0):
+        self._lock = threading.Lock()
+        self.enabled = True
+        self.budget_ms = 8.0
+        self.quality_min, self.quality_max = quality, quality
+        self.scale_min, self.scale_max = scale, scale
+        self.quality = quality
+        self.scale = scale
+        self._encode_ms = None
+        self._decode_ms = None
+        self._payload = None
+        self._last_adjust = time.monotonic()
+        self.adjustments = 0
+
+    def configure(self, enabled, budget_ms, quality_min, quality_max, scale_min, scale_max):
+        with self._lock:
+            self.enabled = enabled
+            self.budget_ms = budget_ms
+            self.quality_min, self.quality_max = min(quality_min, quality_max), max(quality_min, quality_max)
+            self.scale_min, self.scale_max = min(scale_min, scale_max), max(scale_min, scale_max)
+            if not enabled:
+                self.quality = JPEG_QUALITY_STREAM
+                self.scale = 1.0
+                return
+            self.quality = min(max(self.quality, self.quality_min), self.quality_max)
+            self.scale = min(max(self.scale, self.scale_min), self.scale_max)
+
+    def _ewma(self, current, value):
+        return value if current is None else current + ADAPT_EWMA_ALPHA * (value - current)
+
+    def observe_encode(self, encode_ms, payload_bytes):
+        with self._lock:
+            self._encode_ms = self._ewma(self._encode_ms, encode_ms)
+            if payload_bytes is not None:
+                self._payload = self._ewma(self._payload, payload_bytes)
+            self._adjust_locked()
+
+    def observe_decode(self, decode_ms):
+        with self._lock:
+            self._decode_ms = self._ewma(self._decode_ms, decode_ms)
+            self._adjust_locked()
+
+    def _adjust_locked(self):
+        now = time.monotonic()
+        if not self.enabled or self._encode_ms is None or now - self._last_adjust < ADAPT_INTERVAL_S:
+            return
+        self._last_adjust = now
+        cost = self._encode_ms + (self._decode_ms or 0.0)
+        payload = self._payload or 0.0
+        quality, scale = self.quality, self.scale
+        if cost > self.budget_ms and scale > self.scale_min:
+            scale = max(self.scale_min, scale - ADAPT_SCALE_STEP)
+        elif (cost > self.budget_ms or payload > FRAME_MAX_PAYLOAD) and quality > self.quality_min:
+            quality = max(self.quality_min, quality - ADAPT_QUALITY_STEP)
+        elif cost < self.budget_ms * ADAPT_HEADROOM and payload < FRAME_MAX_PAYLOAD * ADAPT_HEADROOM:
+            if scale < self.scale_max:
+                scale = min(self.scale_max, scale + ADAPT_SCALE_STEP)
+            elif quality < self.quality_max:
+                quality = min(self.quality_max, quality + ADAPT_QUALITY_STEP)
+        if (quality, scale) != (self.quality, self.scale):
+            self.quality, self.scale = round(quality, 3), round(scale, 3)
+            self.adjustments += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'quality': self.quality,
+                'scale': self.scale,
+                'budget_ms': self.budget_ms,
+                'encode_ms': round(self._encode_ms, 3) if self._encode_ms is not None else None,
+                'decode_ms': round(self._decode_ms, 3) if self._decode_ms is not None else None,
+                'payload_bytes': int(self._payload) if self._payload is not None else None,
+                'adjustments': self.adjustments,
+            }
+
+
+class RecoveryController:
+    def __init__(self, base_ms=RECOVERY_BASE_DELAY_MS, max_ms=RECOVERY_MAX_DELAY_MS, jitter=RECOVERY_JITTER,
+                 budget=RECOVERY_BUDGET, window_s=RECOVERY_WINDOW_S, cooldown_s=RECOVERY_COOLDOWN_S, rng=random.random):
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.jitter = jitter
+        self.budget = budget
+        self.window_s = window_s
+        self.cooldown_s = cooldown_s
+        self.rng = rng
+        self._retries = deque()
+        self.generation = 0
+        self.total_retries = 0
+        self.trips = 0
+        self.recoveries = 0
+        self.recover_ms = RollingStats()
+        self.reset()
+
+    def reset(self):
+        self.generation += 1
+        self.state = 'closed'
+        self.attempt = 0
+        self.incident_started = None
+        self.next_retry_at = None
+        self.last_delay_ms = None
+
+    @property
+    def recovering(self):
+        return self.incident_started is not None
+
+    def _in_window(self, now):
+        retries = self._retries
+        while retries and retries[0] <= now - self.window_s:
+            retries.popleft()
+        return len(retries)
+
+    def on_failure(self, now):
+        if self.incident_started is None:
+            self.incident_started = now
+        if self.state == 'half_open' or self._in_window(now) >= self.budget:
+            self.state = 'open'
+            self.trips += 1
+            delay_ms = self.cooldown_s * 1000.0
+        else:
+            delay_ms = min(self.max_ms, self.base_ms * 2 ** self.attempt) * (1 - self.jitter * self.rng())
+        self.attempt += 1
+        self.total_retries += 1
+        self._retries.append(now)
+        self.last_delay_ms = delay_ms
+        self.next_retry_at = now + delay_ms / 1000
+        return delay_ms
+
+    def on_retry(self):
+        self.next_retry_at = None
+        if self.state == 'open':
+            self.state = 'half_open'
+
+    def on_success(self, now):
+        self.state = 'closed'
+        if self.incident_started is None:
+            return None
+        recover_ms = (now - self.incident_started) * 1000
+        result = {'attempts': self.attempt, 'recover_ms': round(recover_ms, 1)}
+        self.recover_ms.add(recover_ms)
+        self.recoveries += 1
+        self.attempt = 0
+        self.incident_started = None
+        self.next_retry_at = None
+        return result
+
+    def snapshot(self, now):
+        return {
+            'state': self.state,
+            'recovering': self.recovering,
+            'attempt': self.attempt,
+            'next_retry_in_ms': round(max(0.0, self.next_retry_at - now) * 1000) if self.next_retry_at else None,
+            'last_delay_ms': round(self.last_delay_ms) if self.last_delay_ms is not None else None,
+            'retries_in_window': self._in_window(now),
+            'budget': self.budget,
+            'window_s': self.window_s,
+            'total_retries': self.total_retries,
+            'trips': self.trips,
+            'recoveries': self.recoveries,
+            'recover_ms': self.recover_ms.snapshot(),
+        }
+
+
+class FramePacer:
+    def __init__(self, fps=FRAME_TARGET_FPS):
+        self.set_rate(fps)
+        self.reset()
+
+    def set_rate(self, fps):
+        self.fps = max(1, int(fps))
+        self.interval = 1.0 / self.fps
+        self._next = None
+
+    def reset(self):
+        self._next = None
+        self._last_sent = None
+        self.interval_ms = RollingStats()
+        self.jitter_ms = RollingStats()
+        self.drift_ms = RollingStats()
+        self.age_ms = RollingStats()
+        self.ticks = 0
+        self.early = 0
+        self.due_ticks = 0
+        self.resyncs = 0
+        self.missed = 0
+
+    def due(self, now):
+        self.ticks += 1
+        if self._next is None:
+            self._next = now
+        lateness = now - self._next
+        if lateness < -self.interval * FRAME_PACE_TOLERANCE:
+            self.early += 1
+            return False
+        if lateness > self.interval * FRAME_PACE_RESYNC:
+            self.resyncs += 1
+            self.missed += int(lateness / self.interval)
+            self._next = now
+            lateness = 0.0
+        self.drift_ms.add(lateness * 1000)
+        self._next += self.interval
+        self.due_ticks += 1
+        return True
+
+    def sent(self, now, captured_at=None):
+        if self._last_sent is not None:
+            interval_ms = (now - self._last_sent) * 1000
+            self.interval_ms.add(interval_ms)
+            self.jitter_ms.add(abs(interval_ms - self.interval * 1000))
+        self._last_sent = now
+        if captured_at is not None:
+            self.age_ms.add((now - captured_at) * 1000)
+
+    def snapshot(self):
+        interval = self.interval_ms.snapshot()
+        return {
+            'target_fps': self.fps,
+            'actual_fps': round(1000.0 / interval['avg'], 2) if interval['avg'] else None,
+            'ticks': self.ticks,
+            'due_ticks': self.due_ticks,
+            'early_ticks': self.early,
+            'resyncs': self.resyncs,
+            'missed_deadlines': self.missed,
+            'interval_ms': interval,
+            'jitter_ms': self.jitter_ms.snapshot(),
+            'drift_ms': self.drift_ms.snapshot(),
+            'frame_age_ms': self.age_ms.snapshot(),
+        }
+
+
+class LatencyProbe:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.active = False
+        self.seq = 0
+        self._latency_ms = deque(maxlen=window)
+        self._relay_ms = RollingStats(window)
+        self.measured = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.last = None
+
+    def stamp(self, data, captured_at):
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return b''.join((LATENCY_HEADER.pack(LATENCY_MAGIC, self.seq, captured_at * 1000), data))
+
+    def record(self, message, now):
+        captured_ms = message.get('captured_ms')
+        if message.get('timeout'):
+            self.timeouts += 1
+            return None
+        if not isinstance(captured_ms, (int, float)):
+            self.rejected += 1
+            return None
+        latency_ms = now * 1000 - captured_ms
+        if not 0 <= latency_ms <= LATENCY_MAX_MS:
+            self.rejected += 1
+            return None
+        relay_ms = message.get('relay_ms')
+        if isinstance(relay_ms, (int, float)):
+            self._relay_ms.add(relay_ms)
+        else:
+            relay_ms = None
+        self._latency_ms.append(latency_ms)
+        self.measured += 1
+        self.last = {'seq': message.get('seq'), 'latency_ms': round(latency_ms, 1), 'relay_ms': relay_ms}
+        return self.last
+
+    def percentiles(self):
+        values = sorted(self._latency_ms)
+        if not values:
+            return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+        last = len(values) - 1
+        return {f'p{q}_ms': round(values[min(last, int(len(values) * q / 100))], 1) for q in (50, 95, 99)}
+
+    def snapshot(self):
+        values = self._latency_ms
+        return {
+            'active': self.active,
+            'measured': self.measured,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'window': len(values),
+            'min_ms': round(min(values), 1) if values else None,
+            'max_ms': round(max(values), 1) if values else None,
+            **self.percentiles(),
+            'relay_ms': self._relay_ms.snapshot(),
+            'last': self.last,
+        }
+
+
+class WebRTCStats:
+    def __init__(self, window=WEBRTC_STATS_WINDOW):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._series = {
+            direction: {field: RollingStats(self.window) for field in fields}
+            for direction, fields in WEBRTC_STATS_FIELDS.items()
+        }
+        self.reports = 0
+        self.last = None
+        self.last_at = None
+
+    def record(self, message, now):
+        sample = {}
+        for direction, fields in WEBRTC_STATS_FIELDS.items():
+            report = message.get(direction)
+            if not isinstance(report, dict):
+                continue
+            series = self._series[direction]
+            values = {}
+            for field in fields:
+                value = report.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    series[field].add(value)
+                    values[field] = value
+            if isinstance(report.get('quality_limit'), str):
+                values['quality_limit'] = report['quality_limit']
+            sample[direction] = values
+        if not sample:
+            return None
+        self.reports += 1
+        self.last = sample
+        self.last_at = now
+        return sample
+
+    def snapshot(self, now):
+        return {
+            'reports': self.reports,
+            'age_s': round(now - self.last_at, 1) if self.last_at is not None else None,
+            'last': self.last,
+            **{
+                direction: {field: stats.snapshot() for field, stats in series.items()}
+                for direction, series in self._series.items()
+            },
+        }
+
+
+class FrameEncoder:
+    def __init__(self, controller, queue_size=FRAME_QUEUE_SIZE, metrics=None, logger=None):
+        self.controller = controller
+        self.metrics = metrics
+        self.log = logger or log
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._cond = threading.Condition(threading.Lock())
+        self._latest = None
+        self._thread = None
+        self._running = False
+        self._scaled = None
+        self._rgba = None
+        self._bgr = None
+        self._resized = None
+        self._raw = None
+        self._sent_sample = None
+        self.change_threshold = None
+        self.transport = 'jpeg'
+        self.encode_ms = RollingStats()
+        self.submitted = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+
+    @staticmethod
+    def available(transport='jpeg'):
+        if transport == 'raw':
+            return np is not None
+        return np is not None and cv2 is not None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='DaydreamFrameEncoder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._queue.clear()
+            self._latest = None
+            self._sent_sample = None
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def submit(self, pixels, captured_at=None):
+        if captured_at is None:
+            captured_at = time.monotonic()
+        with self._cond:
+            if len(self._queue) >= self._queue_size:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append((pixels, captured_at))
+            self.submitted += 1
+            self._cond.notify()
+
+    def take(self):
+        with self._cond:
+            data, self._latest = self._latest, None
+        return data
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                pixels, captured_at = self._queue.popleft()
+            start = time.perf_counter()
+            try:
+                if self.change_threshold is not None and self._unchanged(pixels):
+                    self.skipped += 1
+                    continue
+                data = self._encode(pixels)
+            except Exception as e:
+                self.errors += 1
+                self.log.error("Frame encode error: %s", e)
+                continue
+            encode_ms = (time.perf_counter() - start) * 1000
+            self.encode_ms.add(encode_ms)
+            if self.metrics:
+                self.metrics.observe('frame_encode', encode_ms, mode='async')
+            self.controller.observe_encode(encode_ms, len(data) if self.transport == 'jpeg' else None)
+            with self._cond:
+                if self._latest is not None:
+                    self.dropped += 1
+                self._latest = (data, captured_at)
+                self.encoded += 1
+
+    def _unchanged(self, pixels):
+        step = max(1, min(pixels.shape[0], pixels.shape[1]) // FRAME_SAMPLE_GRID)
+        sample = pixels[::step, ::step, :3].astype(np.float32)
+        if pixels.dtype == np.uint8:
+            sample *= 1.0 / 255.0
+        prev = self._sent_sample
+        if prev is not None and prev.shape == sample.shape:
+            if self.change_threshold <= 0:
+                if np.array_equal(prev, sample):
+                    return True
+            elif float(np.abs(sample - prev).mean()) <= self.change_threshold:
+                return True
+        self._sent_sample = sample
+        return False
+
+    def _to_rgba(self, pixels):
+        h, w = pixels.shape[:2]
+        if self._rgba is None or self._rgba.shape[:2] != (h, w):
+            self._scaled = np.empty((h, w, 4), np.float32)
+            self._rgba = np.empty((h, w, 4), np.uint8)
+            self._bgr = np.empty((h, w, 3), np.uint8)
+        if pixels.dtype == np.uint8:
+            self._rgba[...] = pixels[::-1]
+        else:
+            np.multiply(pixels, 255.0, out=self._scaled)
+            np.clip(self._scaled, 0.0, 255.0, out=self._scaled)
+            self._rgba[...] = self._scaled[::-1]
+        return self._rgba
+
+    def _encode(self, pixels):
+        if self.transport == 'raw':
+            return self._encode_raw(pixels)
+        h, w = pixels.shape[:2]
+        cv2.cvtColor(self._to_rgba(pixels), cv2.COLOR_RGBA2BGR, dst=self._bgr)
+        image = self._bgr
+        scale = self.controller.scale
+        if scale < 1.0:
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            if self._resized is None or self._resized.shape[1::-1] != size:
+                self._resized = np.empty((size[1], size[0], 3), np.uint8)
+            cv2.resize(self._bgr, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+            image = self._resized
+        quality = int(self.controller.quality * 100)
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("JPEG encode failed")
+        return encoded.tobytes()
+
+    def _encode_raw(self, pixels):
+        h, w = pixels.shape[:2]
+        scale = min(1.0, RAW_FRAME_MAX_SIZE / max(w, h)) * self.controller.scale
+        if scale >= 1.0:
+            image = self._to_rgba(pixels)
+        elif cv2 is not None:
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            if self._raw is None or self._raw.shape[1::-1] != size or self._raw.dtype != pixels.dtype:
+                self._raw = np.empty((size[1], size[0], 4), pixels.dtype)
+            cv2.resize(pixels, size, dst=self._raw, interpolation=cv2.INTER_AREA)
+            image = self._to_rgba(self._raw)
+        else:
+            step = int(np.ceil(1.0 / scale))
+            image = self._to_rgba(pixels[::step, ::step])
+        height, width = image.shape[:2]
+        return b''.join((RAW_FRAME_HEADER.pack(RAW_FRAME_MAGIC, width, height), memoryview(image).cast('B')))
+
+    def snapshot(self):
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            'queue_depth': depth,
+            'submitted': self.submitted,
+            'encoded': self.encoded,
+            'dropped': self.dropped,
+            'skipped_unchanged_pixels': self.skipped,
+            'errors': self.errors,
+            'encode_ms': self.encode_ms.snapshot(),
+        }
+
+
+class StyleImageCache:
+    CACHE_PATH = os.path.expanduser("~/.daydream/cache")
+
+    def __init__(self, path=None, max_bytes=PARAM_DEFAULTS['Stylecachesize'] * 1024 * 1024, logger=None):
+        self.path = path or self.CACHE_PATH
+        self.max_bytes = max_bytes
+        self.log = logger or log
+        self._lock = threading.Lock()
+        self._index = None
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _file(self, digest):
+        return os.path.join(self.path, digest + STYLE_CACHE_SUFFIX)
+
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        index = {}
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(STYLE_CACHE_SUFFIX) and entry.is_file():
+                        st = entry.stat()
+                        index[entry.name[:-len(STYLE_CACHE_SUFFIX)]] = [st.st_size, st.st_mtime]
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.log.warning("Could not read style cache: %s", e)
+        self._index = index
+        self._size = sum(size for size, _ in index.values())
+        return index
+
+    def set_limit(self, megabytes):
+        self.max_bytes = max(0, int(megabytes)) * 1024 * 1024
+
+    def get(self, digest):
+        if self.max_bytes <= 0:
+            return None
+        with self._lock:
+            index = self._load_index()
+            if self._size > self.max_bytes:
+                self._evict()
+            entry = index.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            path = self._file(digest)
+            try:
+                with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    data = str(m, 'ascii')
+                now = time.time()
+                os.utime(path, (now, now))
+            except (OSError, ValueError):
+                self._forget(digest)
+                self.misses += 1
+                return None
+            entry[1] = now
+            self.hits += 1
+            return data
+
+    def put(self, digest, data_url):
+        if self.max_bytes <= 0:
+            return
+        data = data_url.encode('ascii')
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._put(digest, data)
+
+    def _put(self, digest, data):
+        index = self._load_index()
+        path = self._file(digest)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            self.log.warning("Could not write style cache: %s", e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._forget(digest)
+        index[digest] = [len(data), time.time()]
+        self._size += len(data)
+        self.writes += 1
+        self._evict()
+
+    def _forget(self, digest):
+        entry = self._index.pop(digest, None) if self._index is not None else None
+        if entry:
+            self._size -= entry[0]
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        for digest, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(self._file(digest))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._forget(digest)
+            self.evictions += 1
+
+    def snapshot(self):
+        return {
+            'path': self.path,
+            'entries': len(self._index) if self._index is not None else None,
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+        }
+
+
+class StyleImagePipeline:
+    def __init__(self, on_ready=None, cache=None, logger=None):
+        self.on_ready = on_ready
+        self.log = logger or log
+        self.cache = cache or StyleImageCache(logger=self.log)
+        self.metrics = None
+        self._stamps = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='DaydreamStyle')
+        self._lock = threading.Lock()
+        self._current = None
+        self._requested = None
+        self._job = None
+        self._scheduled = False
+        self._rgba = None
+        self.encode_ms = RollingStats()
+        self.captures = 0
+        self.encodes = 0
+        self.unchanged = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+    @staticmethod
+    def can_downscale():
+        return np is not None and cv2 is not None
+
+    def update(self, source, style_top, target_size):
+        signature = (source, style_top.width, style_top.height, style_top.time.frame, target_size)
+        with self._lock:
+            if signature == self._requested:
+                return
+            self._requested = signature
+        stamp = self._stamp(source, style_top, target_size)
+        if self._use_cached(source, stamp):
+            return
+        job = (source, stamp, *self._capture(style_top), target_size)
+        self.captures += 1
+        with self._lock:
+            self._job = job
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self._drain)
+
+    def prepare(self, source, style_top, target_size, on_done):
+        stamp = self._stamp(source, style_top, target_size)
+        entry = self._lookup(stamp)
+        if entry is not None:
+            on_done(source, *entry)
+            return
+        self.captures += 1
+        self._executor.submit(self._prepare, source, stamp, *self._capture(style_top), target_size, on_done)
+
+    def _stamp(self, source, style_top, target_size):
+        cooks = getattr(style_top, 'totalCooks', None)
+        if cooks is None:
+            return None
+        return (source, cooks, style_top.width, style_top.height, target_size)
+
+    def _remember(self, stamp, digest):
+        if stamp is None:
+            return
+        with self._lock:
+            stamps = self._stamps
+            stamps.pop(stamp, None)
+            stamps[stamp] = digest
+            if len(stamps) > STYLE_STAMP_INDEX_SIZE:
+                del stamps[next(iter(stamps))]
+
+    def _lookup(self, stamp):
+        digest = self._stamps.get(stamp) if stamp is not None else None
+        if digest is None:
+            return None
+        current = self._current
+        if current and current['hash'] == digest:
+            return digest, current['data']
+        data_url = self.cache.get(digest)
+        if data_url is None:
+            with self._lock:
+                self._stamps.pop(stamp, None)
+            return None
+        return digest, data_url
+
+    def _use_cached(self, source, stamp):
+        entry = self._lookup(stamp)
+        if entry is None:
+            return False
+        digest, data_url = entry
+        with self._lock:
+            self._job = None
+            current = self._current
+            changed = current is None or current['hash'] != digest
+            if changed:
+                self._current = {'source': source, 'hash': digest, 'data': data_url, 'bytes': len(data_url), 'cached': True}
+            elif current['source'] != source:
+                self._current = dict(current, source=source)
+        if not changed:
+            self.unchanged += 1
+            return True
+        self.cache_hits += 1
+        if self.on_ready:
+            self.on_ready()
+        return True
+
+    def _capture(self, style_top):
+        if self.can_downscale():
+            return 'pixels', style_top.numpyArray()
+        return 'jpeg', style_top.saveByteArray('.jpg', quality=JPEG_QUALITY_STYLE)
+
+    def current(self):
+        current = self._current
+        return current['data'] if current else None
+
+    def current_hash(self):
+        current = self._current
+        return current['hash'] if current else None
+
+    def invalidate(self):
+        with self._lock:
+            self._requested = None
+
+    def adopt(self, source, digest, data_url):
+        with self._lock:
+            self._requested = None
+            self._current = {'source': source, 'hash': digest, 'data': data_url, 'bytes': len(data_url), 'cached': True}
+
+    def clear(self):
+        with self._lock:
+            self._requested = None
+            self._job = None
+            self._current = None
+
+    def close(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                job, self._job = self._job, None
+                if job is None:
+                    self._scheduled = False
+                    return
+            try:
+                changed = self._process(*job)
+            except Exception as e:
+                self.errors += 1
+                self.log.warning("Style image encode failed. %s", e)
+                continue
+            if changed and self.on_ready:
+                self.on_ready()
+
+    def _prepare(self, source, stamp, kind, data, target_size, on_done):
+        digest = data_url = None
+        try:
+            start = time.perf_counter()
+            image, digest = self._digest(kind, data, target_size)
+            data_url, _ = self._data_url(digest, image, data, start)
+            if data_url is not None:
+                self._remember(stamp, digest)
+        except Exception as e:
+            self.errors += 1
+            self.log.warning("Style image encode failed. %s", e)
+        on_done(source, digest, data_url)
+
+    def _digest(self, kind, data, target_size):
+        if kind == 'pixels':
+            image = self._downscale(data, target_size)
+            return image, hashlib.blake2b(image.tobytes(), digest_size=STYLE_HASH_SIZE).hexdigest()
+        return None, hashlib.blake2b(data, digest_size=STYLE_HASH_SIZE).hexdigest()
+
+    def _data_url(self, digest, image, data, start):
+        data_url = self.cache.get(digest)
+        if data_url is not None:
+            return data_url, True
+        if image is not None:
+            ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(JPEG_QUALITY_STYLE * 100)])
+            if not ok:
+                raise ValueError("JPEG encode failed")
+            data = encoded.tobytes()
+        if len(data) > MAX_STYLE_IMAGE_SIZE:
+            self.log.warning("Style image too large (>50MB)")
+            return None, False
+        data_url = f"data:image/jpeg;base64,{base64.b64encode(data).decode('ascii')}"
+        self.cache.put(digest, data_url)
+        encode_ms = (time.perf_counter() - start) * 1000
+        self.encode_ms.add(encode_ms)
+        if self.metrics:
+            self.metrics.observe('style_encode', encode_ms)
+        return data_url, False
+
+    def _process(self, source, stamp, kind, data, target_size):
+        start = time.perf_counter()
+        image, digest = self._digest(kind, data, target_size)
+        current = self._current
+        if current and current['hash'] == digest:
+            self.unchanged += 1
+            self._remember(stamp, digest)
+            if current['source'] != source:
+                self._current = dict(current, source=source)
+            return False
+        data_url, cached = self._data_url(digest, image, data, start)
+        if data_url is None:
+            return False
+        self._remember(stamp, digest)
+        with self._lock:
+            if self._requested is None or self._requested[0] != source:
+                return False
+            self._current = {'source': source, 'hash': digest, 'data': data_url, 'bytes': len(data_url), 'cached': cached}
+        if cached:
+            self.cache_hits += 1
+        else:
+            self.encodes += 1
+        return True
+
+    def _downscale(self, pixels, target_size):
+        h, w = pixels.shape[:2]
+        if self._rgba is None or self._rgba.shape[:2] != (h, w):
+            self._rgba = np.empty((h, w, 4), np.uint8)
+        if pixels.dtype == np.uint8:
+            self._rgba[...] = pixels[::-1]
+        else:
+            self._rgba[...] = np.clip(pixels[::-1] * 255.0, 0.0, 255.0)
+        image = cv2.cvtColor(self._rgba, cv2.COLOR_RGBA2BGR)
+        scale = min(1.0, target_size[0] / w, target_size[1] / h)
+        if scale < 1.0:
+            size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image
+
+    def snapshot(self):
+        current = self._current
+        return {
+            'hash': current['hash'] if current else None,
+            'bytes': current['bytes'] if current else 0,
+            'pending': self._scheduled,
+            'captures': self.captures,
+            'encodes': self.encodes,
+            'unchanged': self.unchanged,
+            'cache_hits': self.cache_hits,
+            'errors': self.errors,
+            'encode_ms': self.encode_ms.snapshot(),
+            'cache': self.cache.snapshot(),
+        }
+
+
+class CueList:
+    def __init__(self, owner_comp=None, window=CUE_STATS_WINDOW):
+        self.ownerComp = owner_comp
+        stored = owner_comp.fetch(CUE_STORAGE_KEY, None, search=False) if owner_comp is not None else None
+        self.cues = {name: dict(values) for name, values in (stored or {}).items()}
+        self.styles = {}
+        self.payloads = PayloadBuilder()
+        self._prepared = {}
+        self._fired = {}
+        self.prepare_ms = RollingStats(window)
+        self.ack_ms = RollingStats(window)
+        self.fired = 0
+        self.cold = 0
+        self.queued = 0
+        self.acked = 0
+        self.failed = 0
+        self.last = None
+
+    def _save(self):
+        if self.ownerComp is not None:
+            self.ownerComp.store(CUE_STORAGE_KEY, {name: dict(values) for name, values in self.cues.items()})
+
+    def save(self, name, values):
+        self.cues[name] = dict(values)
+        self._prepared.pop(name, None)
+        self._save()
+
+    def delete(self, name):
+        if self.cues.pop(name, None) is None:
+            return False
+        self._prepared.pop(name, None)
+        self._save()
+        return True
+
+    def prepared(self, name, model_id):
+        entry = self._prepared.get(name)
+        return entry if entry is not None and entry['model_id'] == model_id else None
+
+    def put(self, name, model_id, params, style, prepare_ms):
+        values = self.cues[name]
+        deps = set()
+        if values.keys() & CN_PARAMS_SET:
+            deps |= CN_PARAMS_SET
+        if values.keys() & IP_PARAMS_SET:
+            deps |= IP_PARAMS_SET
+        entry = self._prepared[name] = {
+            'model_id': model_id,
+            'params': params,
+            'body': self.payloads.update_body(model_id, params),
+            'style': style,
+            'deps': deps - values.keys(),
+        }
+        self.prepare_ms.add(prepare_ms)
+        return entry
+
+    def invalidate(self, names=None):
+        if names is None:
+            stale = list(self._prepared)
+        else:
+            stale = [name for name, entry in self._prepared.items() if entry['deps'] & names]
+        for name in stale:
+            del self._prepared[name]
+        return len(stale)
+
+    def on_fire(self, name, seq, fired_at, prepared, queued):
+        self._fired[seq] = (name, fired_at)
+        self.fired += 1
+        if not prepared:
+            self.cold += 1
+        if queued:
+            self.queued += 1
+        self.last = {'name': name, 'seq': seq, 'prepared': prepared, 'queued': queued, 'ack_ms': None}
+
+    def on_ack(self, seqs, acked_at, error):
+        acked = []
+        for seq in seqs:
+            fired = self._fired.pop(seq, None)
+            if fired is None:
+                continue
+            ack_ms = round((acked_at - fired[1]) * 1000, 2)
+            if error:
+                self.failed += 1
+            else:
+                self.acked += 1
+                self.ack_ms.add(ack_ms)
+            if self.last and self.last['seq'] == seq:
+                self.last['ack_ms'] = ack_ms
+            acked.append((fired[0], seq, ack_ms))
+        return acked
+
+    def reset(self):
+        self._fired.clear()
+
+    @property
+    def in_flight(self):
+        return bool(self._fired)
+
+    def snapshot(self):
+        return {
+            'cues': list(self.cues),
+            'prepared': [name for name in self.cues if name in self._prepared],
+            'styles': sum(1 for style in self.styles.values() if style and style[1]),
+            'fired': self.fired,
+            'cold': self.cold,
+            'queued': self.queued,
+            'acked': self.acked,
+            'failed': self.failed,
+            'in_flight': len(self._fired),
+            'ack_ms': self.ack_ms.snapshot(),
+            'prepare_ms': self.prepare_ms.snapshot(),
+            'last': dict(self.last) if self.last else None,
+        }
+
+
 class ParameterManager:
-    def __init__(self, owner_comp):
+    def __init__(self, owner_comp, logger=None):
         self.ownerComp = owner_comp
-        self._style_image_cache = {'source': None, 'signature': None, 'data': None}
+        self.log = logger or log
+        self.style_images = StyleImagePipeline(logger=self.log)
+        self._style_sent = None
+        self.stream_model = None
+        self._values = {}
+        self._derived = {}
 
     def _get(self, name, default=None):
-        if hasattr(self.ownerComp.par, name):
-            return getattr(self.ownerComp.par, name).eval()
-        return default if default is not None else PARAM_DEFAULTS.get(name)
+        values = self._values
+        if name in values:
+            value = values[name]
+        else:
+            par = getattr(self.ownerComp.par, name, None)
+            value = values[name] = par.eval() if par is not None else None
+        if value is None:
+            return default if default is not None else PARAM_DEFAULTS.get(name)
+        return value
+
+    def on_change(self, par):
+        name = par.name
+        self._values[name] = par.eval()
+        self._invalidate_derived(name)
+
+    def set(self, name, value):
+        par = getattr(self.ownerComp.par, name, None)
+        if par is None:
+            return
+        par.val = value
+        self._values[name] = par.eval()
+        self._invalidate_derived(name)
+
+    def _invalidate_derived(self, name):
+        derived = self._derived
+        if not derived:
+            return
+        if name.lower().startswith('stepschedule'):
+            derived.pop('TindexList', None)
+        elif name in CN_PARAMS_SET or name == 'Model':
+            derived.pop('controlnets', None)
+        elif name in IP_PARAMS_SET:
+            derived.pop('ip_adapter', None)
+
+    def invalidate(self):
+        self._values.clear()
+        self._derived.clear()
 
     def _get_int(self, name, default=None):
         val = self._get(name, default)
@@ -338,31 +2371,101 @@ class ParameterManager:
         return self._get('Color', 0.0)
 
     @property
-    def Ipadapter(self):
-        return self._get_bool('Ipadapter', False)
+    def Ipadapter(self):
+        return self._get_bool('Ipadapter', False)
+
+    @property
+    def Ipadapterscale(self):
+        return self._get('Ipadapterscale', 0.5)
+
+    @property
+    def Styleimage(self):
+        return self._get('Styleimage', '')
+
+    @property
+    def Ipadaptertype(self):
+        return self._get('Ipadaptertype', 'regular')
+
+    @property
+    def Model(self):
+        return self._get('Model', 'stabilityai/sdxl-turbo')
+
+    @property
+    def Active(self):
+        return self._get_bool('Active', False)
+
+    @property
+    def Standby(self):
+        return self._get_bool('Standby', False)
+
+    @property
+    def Hotswap(self):
+        return self._get_bool('Hotswap', False)
+
+    @property
+    def Stylecachesize(self):
+        return self._get_int('Stylecachesize', 256)
+
+    @property
+    def Loglevel(self):
+        return self._get('Loglevel', 'info')
+
+    @property
+    def Sharedruntime(self):
+        return self._get_bool('Sharedruntime', False)
+
+    @property
+    def Calibratelatency(self):
+        return self._get_bool('Calibratelatency', False)
+
+    @property
+    def Skipunchanged(self):
+        return self._get_bool('Skipunchanged', True)
+
+    @property
+    def Transport(self):
+        return self._get('Transport', 'jpeg')
+
+    @property
+    def Targetfps(self):
+        return self._get_int('Targetfps', FRAME_TARGET_FPS)
+
+    @property
+    def Changethreshold(self):
+        return self._get('Changethreshold', 0.002)
+
+    @property
+    def Adaptivequality(self):
+        return self._get_bool('Adaptivequality', True)
 
     @property
-    def Ipadapterscale(self):
-        return self._get('Ipadapterscale', 0.5)
+    def Framebudget(self):
+        return self._get('Framebudget', 8.0)
 
     @property
-    def Styleimage(self):
-        return self._get('Styleimage', '')
+    def Jpegqualitymin(self):
+        return self._get('Jpegqualitymin', 0.4)
 
     @property
-    def Ipadaptertype(self):
-        return self._get('Ipadaptertype', 'regular')
+    def Jpegqualitymax(self):
+        return self._get('Jpegqualitymax', 0.85)
 
     @property
-    def Model(self):
-        return self._get('Model', 'stabilityai/sdxl-turbo')
+    def Scalemin(self):
+        return self._get('Scalemin', 0.5)
 
     @property
-    def Active(self):
-        return self._get_bool('Active', False)
+    def Scalemax(self):
+        return self._get('Scalemax', 1.0)
 
     @property
     def TindexList(self):
+        derived = self._derived
+        if 'TindexList' not in derived:
+            derived['TindexList'] = self._eval_tindex_list()
+        return list(derived['TindexList'])
+
+    def _eval_tindex_list(self):
         result = []
         if hasattr(self.ownerComp.seq, 'Stepschedule'):
             for block in self.ownerComp.seq.Stepschedule.blocks:
@@ -386,6 +2489,9 @@ class ParameterManager:
             return
         self._ensure_missing_control_params(daydream_page)
         self._ensure_missing_params(params_page)
+        performance_page = self._get_page('Performance') or self.ownerComp.appendCustomPage('Performance')
+        self._ensure_missing_performance_params(performance_page)
+        self.invalidate()
 
     def _ensure_missing_control_params(self, page):
         if not hasattr(self.ownerComp.par, 'Version'):
@@ -441,6 +2547,69 @@ class ParameterManager:
         if not hasattr(self.ownerComp.par, 'Styleimage'):
             page.appendStr('Styleimage', label='Style Image')
 
+    def _ensure_missing_performance_params(self, page):
+        if not hasattr(self.ownerComp.par, 'Standby'):
+            p = page.appendToggle('Standby', label='Warm Standby Stream')[0]
+            p.default = p.val = PARAM_DEFAULTS['Standby']
+        if not hasattr(self.ownerComp.par, 'Hotswap'):
+            p = page.appendToggle('Hotswap', label='Hot Swap Cold Params')[0]
+            p.default = p.val = PARAM_DEFAULTS['Hotswap']
+        if not hasattr(self.ownerComp.par, 'Stylecachesize'):
+            p = page.appendInt('Stylecachesize', label='Style Cache Size (MB)')[0]
+            p.default = p.val = PARAM_DEFAULTS['Stylecachesize']
+            p.min = 0
+            p.normMin, p.normMax = 0, 2048
+            p.clampMin = True
+        if not hasattr(self.ownerComp.par, 'Sharedruntime'):
+            p = page.appendToggle('Sharedruntime', label='Shared Runtime')[0]
+            p.default = p.val = PARAM_DEFAULTS['Sharedruntime']
+        if not hasattr(self.ownerComp.par, 'Loglevel'):
+            p = page.appendMenu('Loglevel', label='Log Level')[0]
+            p.menuNames = list(LOG_LEVELS)
+            p.menuLabels = [name.capitalize() for name in LOG_LEVELS]
+            p.default = p.val = PARAM_DEFAULTS['Loglevel']
+        if not hasattr(self.ownerComp.par, 'Transport'):
+            p = page.appendMenu('Transport', label='Frame Transport')[0]
+            p.menuNames = list(FRAME_TRANSPORTS)
+            p.menuLabels = ['JPEG', 'Raw RGBA']
+            p.default = p.val = PARAM_DEFAULTS['Transport']
+        if not hasattr(self.ownerComp.par, 'Targetfps'):
+            p = page.appendInt('Targetfps', label='Target FPS')[0]
+            p.default = p.val = PARAM_DEFAULTS['Targetfps']
+            p.min, p.max = 1, 60
+            p.clampMin = p.clampMax = True
+        if not hasattr(self.ownerComp.par, 'Calibratelatency'):
+            p = page.appendToggle('Calibratelatency', label='Calibrate Latency')[0]
+            p.default = p.val = PARAM_DEFAULTS['Calibratelatency']
+        if not hasattr(self.ownerComp.par, 'Skipunchanged'):
+            p = page.appendToggle('Skipunchanged', label='Skip Unchanged Frames')[0]
+            p.default = p.val = PARAM_DEFAULTS['Skipunchanged']
+        if not hasattr(self.ownerComp.par, 'Changethreshold'):
+            p = page.appendFloat('Changethreshold', label='Change Threshold')[0]
+            p.default = p.val = PARAM_DEFAULTS['Changethreshold']
+            p.min, p.max = 0.0, 0.1
+            p.clampMin = True
+        if not hasattr(self.ownerComp.par, 'Adaptivequality'):
+            p = page.appendToggle('Adaptivequality', label='Adaptive Quality')[0]
+            p.default = p.val = PARAM_DEFAULTS['Adaptivequality']
+        if not hasattr(self.ownerComp.par, 'Framebudget'):
+            p = page.appendFloat('Framebudget', label='Frame Budget (ms)')[0]
+            p.default = p.val = PARAM_DEFAULTS['Framebudget']
+            p.min, p.max = 1.0, 33.0
+            p.clampMin = True
+        for name, label in (('Jpegqualitymin', 'JPEG Quality Min'), ('Jpegqualitymax', 'JPEG Quality Max')):
+            if not hasattr(self.ownerComp.par, name):
+                p = page.appendFloat(name, label=label)[0]
+                p.default = p.val = PARAM_DEFAULTS[name]
+                p.min, p.max = 0.1, 1.0
+                p.clampMin = p.clampMax = True
+        for name, label in (('Scalemin', 'Scale Min'), ('Scalemax', 'Scale Max')):
+            if not hasattr(self.ownerComp.par, name):
+                p = page.appendFloat(name, label=label)[0]
+                p.default = p.val = PARAM_DEFAULTS[name]
+                p.min, p.max = 0.25, 1.0
+                p.clampMin = p.clampMax = True
+
     def create_all(self):
         daydream = self.ownerComp.appendCustomPage('Daydream')
         p = daydream.appendStr('Version', label='Version')[0]
@@ -485,6 +2654,10 @@ class ParameterManager:
         self._create_ipadapter_type_param(params)
         params.appendStr('Styleimage', label='Style Image')
 
+        performance = self.ownerComp.appendCustomPage('Performance')
+        self._ensure_missing_performance_params(performance)
+        self.invalidate()
+
     def _create_model_param(self, page):
         p = page.appendMenu('Model', label='Model')[0]
         p.menuNames = ['stabilityai/sdxl-turbo', 'stabilityai/sd-turbo', 'Lykon/dreamshaper-8', 'prompthero/openjourney-v4']
@@ -551,12 +2724,12 @@ class ParameterManager:
 
     def reset(self):
         for p in list(self.ownerComp.customPages):
-            if p.name in ('Daydream', 'Parameters'):
+            if p.name in ('Daydream', 'Parameters', 'Performance'):
                 p.destroy()
         if hasattr(self.ownerComp.seq, 'Stepschedule'):
             self.ownerComp.seq.Stepschedule.destroy()
         self.create_all()
-        print("Daydream: Parameters reset to defaults")
+        self.log.info("Parameters reset to defaults")
 
     def update_states(self, logged_in):
         par = self.ownerComp.par
@@ -574,8 +2747,7 @@ class ParameterManager:
                 if hasattr(block.par, 'Step'):
                     block.par.Step.enable = logged_in
         if not logged_in:
-            if hasattr(par, 'Active'):
-                par.Active.val = False
+            self.set('Active', False)
             return
         self.update_controlnet_states()
         self.update_ipadapter_states()
@@ -589,7 +2761,7 @@ class ParameterManager:
                 p = getattr(par, par_name)
                 p.enable = cn_type in available
                 if cn_type not in available:
-                    p.val = 0
+                    self.set(par_name, 0)
 
     def update_ipadapter_states(self):
         model = self.Model
@@ -603,14 +2775,15 @@ class ParameterManager:
         if hasattr(par, 'Ipadaptertype'):
             par.Ipadaptertype.enable = has_faceid
             if not has_faceid:
-                par.Ipadaptertype.val = 'regular'
+                self.set('Ipadaptertype', 'regular')
 
     def update_cold_states(self, is_streaming):
         par = self.ownerComp.par
         cold_params = ['Resetparameters', 'Model', 'Width', 'Height', 'Steps', 'Noise', 'Ipadaptertype']
+        hot_swap = self.Hotswap
         for par_name in cold_params:
             if hasattr(par, par_name):
-                getattr(par, par_name).enable = not is_streaming
+                getattr(par, par_name).enable = not is_streaming or (hot_swap and par_name in HOTSWAP_PARAMS)
 
     def setup_param_exec(self):
         param_exec = self.ownerComp.op('param_exec')
@@ -620,57 +2793,60 @@ class ParameterManager:
     def get_style_image_source(self):
         value = self.Styleimage
         if not value:
-            self._style_image_cache = {'source': None, 'signature': None, 'data': None}
+            self.style_images.clear()
             return None
         if value.startswith('http://') or value.startswith('https://'):
             return value
         style_top = op(value)
         if not style_top or not hasattr(style_top, 'saveByteArray') or style_top.width == 0:
             return None
-        signature = (style_top.width, style_top.height, style_top.time.frame)
-        cached = self._style_image_cache
-        if cached.get('source') == value and cached.get('signature') == signature and cached.get('data'):
-            return cached['data']
-        jpeg_data = style_top.saveByteArray('.jpg', quality=JPEG_QUALITY_STYLE)
-        if len(jpeg_data) > MAX_STYLE_IMAGE_SIZE:
-            print("Daydream Warning: Style image too large (>50MB)")
-            return None
-        data_url = f"data:image/jpeg;base64,{base64.b64encode(jpeg_data).decode('ascii')}"
-        self._style_image_cache = {'source': value, 'signature': signature, 'data': data_url}
-        return data_url
+        self.style_images.update(value, style_top, (self.Width, self.Height))
+        return self.style_images.current()
 
     def invalidate_style_cache(self):
-        self._style_image_cache = {'source': None, 'signature': None, 'data': None}
+        self.style_images.invalidate()
 
-    def build_controlnets(self):
-        model = self.Model
-        support = CONTROLNET_SUPPORT.get(model, {})
-        if not support:
+    def adopt_style(self, source, digest, data_url):
+        self.style_images.adopt(source, digest, data_url)
+        self._style_sent = data_url
+
+    def style_changed_since_sent(self):
+        current = self.style_images.current()
+        return current is not None and current is not self._style_sent
+
+    def update_model(self):
+        return self.stream_model or self.Model
+
+    def build_controlnets(self, model):
+        cached = self._derived.get('controlnets')
+        if cached is None or cached[0] != model:
+            cached = self._derived['controlnets'] = (model, self._eval_controlnets(model))
+        return cached[1]
+
+    def _eval_controlnets(self, model):
+        templates = CONTROLNET_TEMPLATES.get(model)
+        if not templates:
             return None
-        controlnets = []
-        scale_map = [
-            ("depth", self.Depth), ("canny", self.Canny), ("tile", self.Tile),
-            ("hed", self.Hed), ("openpose", self.Openpose), ("color", self.Color),
-        ]
-        for cn_type, scale in scale_map:
-            if cn_type not in support:
-                continue
-            model_id, preprocessor = support[cn_type]
-            controlnets.append({
+        return [
+            {
                 "model_id": model_id,
-                "conditioning_scale": scale,
+                "conditioning_scale": getattr(self, par_name),
                 "preprocessor": preprocessor,
                 "preprocessor_params": {},
                 "enabled": True
-            })
-        return controlnets if controlnets else None
+            }
+            for par_name, model_id, preprocessor, _, _ in templates
+        ]
 
     def build_ip_adapter(self, has_style_image=False):
-        return {
-            "type": self.Ipadaptertype,
-            "enabled": self.Ipadapter and has_style_image,
-            "scale": self.Ipadapterscale,
-        }
+        cached = self._derived.get('ip_adapter')
+        if cached is None or cached[0] != has_style_image:
+            cached = self._derived['ip_adapter'] = (has_style_image, {
+                "type": self.Ipadaptertype,
+                "enabled": self.Ipadapter and has_style_image,
+                "scale": self.Ipadapterscale,
+            })
+        return cached[1]
 
     def build_params(self, for_update=False):
         params = {
@@ -684,14 +2860,16 @@ class ParameterManager:
         seed = self.Seed
         if seed >= 0:
             params["seed"] = seed
-        controlnets = self.build_controlnets()
+        model = self.update_model() if for_update else self.Model
+        controlnets = self.build_controlnets(model)
         if controlnets:
             params["controlnets"] = controlnets
-        if IP_ADAPTER_SUPPORT.get(self.Model):
+        if IP_ADAPTER_SUPPORT.get(model):
             style_source = self.get_style_image_source()
             params["ip_adapter"] = self.build_ip_adapter(has_style_image=style_source is not None)
             if style_source:
                 params["ip_adapter_style_image_url"] = style_source
+                self._style_sent = style_source
         if not for_update:
             params["width"] = self.Width
             params["height"] = self.Height
@@ -716,58 +2894,217 @@ class ParameterManager:
             params['do_add_noise'] = self.Noise
         if any(c.lower().startswith('stepschedule') for c in changed):
             params['t_index_list'] = self.TindexList
+        model = self.update_model()
         if changed & CN_PARAMS_SET:
-            controlnets = self.build_controlnets()
+            controlnets = self.build_controlnets(model)
             if controlnets:
                 params['controlnets'] = controlnets
-        if changed & IP_PARAMS_SET and IP_ADAPTER_SUPPORT.get(self.Model):
+        if changed & IP_PARAMS_SET and IP_ADAPTER_SUPPORT.get(model):
             style_source = self.get_style_image_source()
             params['ip_adapter'] = self.build_ip_adapter(has_style_image=style_source is not None)
-            if style_source:
+            if style_source and style_source is not self._style_sent:
                 params['ip_adapter_style_image_url'] = style_source
+                self._style_sent = style_source
+        return params
+
+    def build_cue_params(self, values, style_source=None):
+        saved = self._values, self._derived
+        self._values, self._derived = dict(self._values, **values), {}
+        try:
+            changed = set(values)
+            params = self.build_changed_params(changed - IP_PARAMS_SET)
+            if changed & IP_PARAMS_SET and IP_ADAPTER_SUPPORT.get(self.update_model()):
+                if 'Styleimage' not in changed:
+                    style_source = self._style_sent
+                params['ip_adapter'] = self.build_ip_adapter(has_style_image=style_source is not None)
+                if 'Styleimage' in changed and style_source:
+                    params['ip_adapter_style_image_url'] = style_source
+        finally:
+            self._values, self._derived = saved
         return params
 
 
+class RuntimeLease:
+    def __init__(self, runtime, owner):
+        self.runtime = runtime
+        self.owner = owner
+        self.ports = ()
+        self.registered = time.time()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.peak_active = 0
+        self.busy_ms = 0.0
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self.submitted += 1
+        return self.runtime.executor.submit(self._run, fn, args, kwargs)
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        start = time.perf_counter()
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.busy_ms += (time.perf_counter() - start) * 1000
+                self.completed += 1
+                self.failed += failed
+
+    def shutdown(self, wait=False):
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.runtime.release(self)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'owner': self.owner,
+                'ports': list(self.ports),
+                'tasks_submitted': self.submitted,
+                'tasks_completed': self.completed,
+                'tasks_failed': self.failed,
+                'tasks_active': self.active,
+                'tasks_peak_active': self.peak_active,
+                'task_busy_ms': round(self.busy_ms, 1),
+                'uptime_s': round(time.time() - self.registered, 1),
+            }
+
+
+class DaydreamRuntime:
+    def __init__(self, max_workers=EXECUTOR_MAX_WORKERS, shared=False):
+        self.version = VERSION
+        self.shared = shared
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Daydream')
+        self.pool = ConnectionPool(ssl._create_unverified_context())
+        self.metrics = Metrics()
+        self.closed = False
+        self._lock = threading.Lock()
+        self._leases = {}
+        self._reserved = {}
+
+    @classmethod
+    def shared_instance(cls):
+        module = sys.modules.get(RUNTIME_MODULE)
+        if module is None:
+            module = sys.modules.setdefault(RUNTIME_MODULE, types.ModuleType(RUNTIME_MODULE))
+        runtime = getattr(module, 'runtime', None)
+        if runtime is None or runtime.closed:
+            runtime = module.runtime = cls(RUNTIME_MAX_WORKERS, shared=True)
+        return runtime
+
+    def register(self, owner, ports=None, count=RUNTIME_PORTS):
+        with self._lock:
+            previous = self._leases.get(owner)
+            lease = self._leases[owner] = RuntimeLease(self, owner)
+            if previous is not None:
+                previous.closed = True
+                ports = ports or previous.ports
+        self.allocate_ports(lease, count, ports)
+        return lease
+
+    def allocate_ports(self, lease, count, preferred=None):
+        with self._lock:
+            for port in [p for p, o in self._reserved.items() if o == lease.owner]:
+                del self._reserved[port]
+            ports = [p for p in (preferred or ())[:count] if p not in self._reserved]
+            for port in ports:
+                self._reserved[port] = lease.owner
+            sockets = []
+            try:
+                while len(ports) < count:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.bind(('127.0.0.1', 0))
+                    sockets.append(sock)
+                    port = sock.getsockname()[1]
+                    if port not in self._reserved:
+                        self._reserved[port] = lease.owner
+                        ports.append(port)
+                lease.ports = tuple(ports)
+            finally:
+                for sock in sockets:
+                    sock.close()
+        return lease.ports
+
+    def release(self, lease):
+        with self._lock:
+            if self._leases.get(lease.owner) is lease:
+                del self._leases[lease.owner]
+                for port in lease.ports:
+                    if self._reserved.get(port) == lease.owner:
+                        del self._reserved[port]
+            idle = not self._leases
+        if idle:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.executor.shutdown(wait=False)
+        self.pool.close()
+
+    def snapshot(self):
+        with self._lock:
+            leases = list(self._leases.values())
+        return {
+            'shared': self.shared,
+            'version': self.version,
+            'instances': len(leases),
+            'max_workers': self.max_workers,
+            'threads': len(getattr(self.executor, '_threads', ())),
+            'queued_tasks': self.executor._work_queue.qsize() if hasattr(self.executor, '_work_queue') else None,
+            'ports_reserved': len(self._reserved),
+            'pool': self.pool.snapshot(),
+            'leases': [lease.snapshot() for lease in leases],
+        }
+
+
 class HTTPHandler:
     def __init__(self, ext):
         self.ext = ext
+        self._routes = {
+            ('GET', AUTH_CALLBACK_PATH): lambda request, response, path: self._handle_auth_callback(request, response),
+            ('GET', '/relay.html'): lambda request, response, path: self._handle_relay_html(response),
+            ('GET', '/status'): lambda request, response, path: self._handle_status_request(response),
+            ('GET', '/metrics'): lambda request, response, path: self._handle_metrics_request(request, response),
+            ('GET', '/logs'): lambda request, response, path: self._handle_logs_request(request, response),
+            ('POST', '/whip'): lambda request, response, path: self._handle_whip_proxy(request, response),
+            ('POST', '/whep'): lambda request, response, path: self._handle_whep_proxy(request, response),
+        }
+        self._prefix_routes = (
+            ('GET', '/whip/result/', lambda request, response, path: self._handle_whip_result(response, path)),
+            ('GET', '/whep/result/', lambda request, response, path: self._handle_whep_result(response, path)),
+        )
 
-    def handle(self, request, response, server_type='frame'):
-        path = request.get('uri', '/').split('?')[0]
+    def handle(self, request, response):
+        path = request.get('uri', '/').split('?', 1)[0]
         method = request.get('method', 'GET')
-
-        if server_type == 'sdp':
-            self._add_cors_headers(response)
-            if method == 'OPTIONS':
-                response['statusCode'] = 204
-                response['statusReason'] = 'No Content'
-                response['data'] = b''
-            elif path == '/whip' and method == 'POST':
-                self._handle_whip_proxy(request, response)
-            elif path.startswith('/whip/result/') and method == 'GET':
-                self._handle_whip_result(response, path)
-            elif path == '/whep' and method == 'POST':
-                self._handle_whep_proxy(request, response)
-            elif path.startswith('/whep/result/') and method == 'GET':
-                self._handle_whep_result(response, path)
-            else:
-                response['statusCode'] = 404
-                response['data'] = b'Not Found'
-        elif server_type == 'auth':
-            self._handle_auth_callback(request, response)
-        else:
-            if path == '/relay.html' and method == 'GET':
-                self._handle_relay_html(response)
-            elif path == '/status' and method == 'GET':
-                self._handle_status_request(response)
-            else:
-                response['statusCode'] = 404
-                response['data'] = b'Not Found'
-
-    def _add_cors_headers(self, response):
-        response['Access-Control-Allow-Origin'] = '*'
-        response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Content-Type'
+        route = self._routes.get((method, path))
+        if route is not None:
+            route(request, response, path)
+            return
+        for route_method, prefix, route in self._prefix_routes:
+            if method == route_method and path.startswith(prefix):
+                route(request, response, path)
+                return
+        response['statusCode'] = 404
+        response['data'] = b'Not Found'
 
     def _handle_relay_html(self, response):
         response['statusCode'] = 200
@@ -786,60 +3123,115 @@ class HTTPHandler:
         response['content-type'] = 'application/json'
         response['data'] = json.dumps(status).encode()
 
+    def _swap_slot(self, request):
+        if request.get('pars', {}).get('slot') != 'next':
+            return None
+        return self.ext._swap or {}
+
+    def _handle_metrics_request(self, request, response):
+        response['statusCode'] = 200
+        response['statusReason'] = 'OK'
+        if request.get('pars', {}).get('format') == 'json':
+            response['content-type'] = 'application/json'
+            response['data'] = json.dumps(self.ext.GetMetrics()).encode('utf-8')
+        else:
+            response['content-type'] = 'text/plain; version=0.0.4; charset=utf-8'
+            response['data'] = self.ext.metrics.prometheus().encode('utf-8')
+
+    def _handle_logs_request(self, request, response):
+        pars = request.get('pars', {})
+        try:
+            limit = int(pars['limit']) if pars.get('limit') else None
+            since = int(pars['since']) if pars.get('since') else None
+        except ValueError:
+            response['statusCode'] = 400
+            response['data'] = b'Invalid limit or since'
+            return
+        response['statusCode'] = 200
+        response['statusReason'] = 'OK'
+        response['content-type'] = 'application/json'
+        response['data'] = json.dumps(self.ext.GetLogs(pars.get('level'), limit, since)).encode('utf-8')
+
     def _handle_whip_proxy(self, request, response):
-        if not self.ext.whip_url:
+        swap = self._swap_slot(request)
+        whip_url = swap.get('whip_url') if swap is not None else self.ext.whip_url
+        if not whip_url:
             response['statusCode'] = 400
             response['data'] = b'No WHIP URL available'
             return
         offer_sdp = request.get('data', b'').decode('utf-8')
         request_id = secrets.token_urlsafe(8)
-        print(f"Daydream: WHIP proxy - forwarding offer to {self.ext.whip_url}")
-        owner_path = self.ext.ownerComp.path
+        self.ext.log.debug("WHIP proxy - forwarding offer to %s", whip_url)
         ext = self.ext
         with ext._whip_lock:
+            self._prune_delivered(ext._whip_requests)
             ext._whip_requests[request_id] = {
                 'status': 'pending',
                 'offer': offer_sdp,
                 'answer': None,
                 'error': None,
-                'whip_url': self.ext.whip_url,
-                'token': self.ext.ApiToken
+                'whip_url': whip_url,
+                'token': self.ext.ApiToken,
+                'created': time.perf_counter(),
+                'delivered': False,
             }
         def exchange_async():
             with ext._whip_lock:
                 req_data = ext._whip_requests.get(request_id)
             if not req_data:
                 return
+            start = time.perf_counter()
             try:
                 answer_sdp, headers = ext.api.exchange_sdp(req_data['whip_url'], req_data['offer'], req_data['token'], timeout=API_TIMEOUT_WHIP)
+                ext.metrics.observe('exchange_sdp', (time.perf_counter() - start) * 1000, kind='whip')
                 for k, v in headers.items():
                     if k.lower() == 'livepeer-playback-url':
-                        ext.whep_url = v
-                        print(f"Daydream: Got WHEP URL: {ext.whep_url}")
+                        if swap is not None:
+                            swap['whep_url'] = v
+                        else:
+                            ext.whep_url = v
+                        self.ext.log.debug("Got WHEP URL: %s", v)
                         break
                 with ext._whip_lock:
                     req_data['answer'] = answer_sdp
                     req_data['status'] = 'ready'
+                if swap is None:
+                    ext._callOnMain('_onWhipConnected')
             except urllib.error.HTTPError as e:
                 err_body = e.read().decode() if hasattr(e, 'read') else str(e)
-                print(f"Daydream: WHIP proxy error {e.code}: {err_body}")
+                ext.metrics.inc('errors', stage='exchange_sdp', kind='whip')
+                self.ext.log.error("WHIP proxy error %s: %s", e.code, err_body)
                 with ext._whip_lock:
                     req_data['status'] = 'error'
                     req_data['error'] = err_body
-                run(f"op('{owner_path}').ext.Daydream._onWhipFailed()", delayFrames=1)
+                self._on_whip_failed(swap)
             except Exception as e:
-                print(f"Daydream: WHIP proxy error: {e}")
+                self.ext.log.error("WHIP proxy error: %s", e)
+                ext.metrics.inc('errors', stage='exchange_sdp', kind='whip')
                 with ext._whip_lock:
                     req_data['status'] = 'error'
                     req_data['error'] = str(e)
-                run(f"op('{owner_path}').ext.Daydream._onWhipFailed()", delayFrames=1)
+                self._on_whip_failed(swap)
+            finally:
+                ext._callOnMain('_pushSdpResult', 'whip', request_id)
         ext._executor.submit(exchange_async)
         response['statusCode'] = 202
         response['statusReason'] = 'Accepted'
         response['content-type'] = 'application/json'
         response['data'] = json.dumps({'id': request_id}).encode('utf-8')
 
-    def _handle_sdp_result(self, response, request_id, lock, requests_dict):
+    def _on_whip_failed(self, swap):
+        if swap is None:
+            self.ext._callOnMain('_onWhipFailed')
+        elif swap.get('id') is not None:
+            self.ext._callOnMain('_onSwapFailed', swap['id'], 'WHIP connection failed')
+
+    def _prune_delivered(self, requests_dict):
+        now = time.perf_counter()
+        for request_id in [k for k, v in requests_dict.items() if v['delivered'] and now - v['created'] > SDP_DELIVERED_TTL]:
+            del requests_dict[request_id]
+
+    def _handle_sdp_result(self, response, request_id, lock, requests_dict, kind):
         with lock:
             req_data = requests_dict.get(request_id)
             if not req_data:
@@ -850,22 +3242,26 @@ class HTTPHandler:
                 response['statusCode'] = 202
                 response['content-type'] = 'application/json'
                 response['data'] = json.dumps({'status': 'pending'}).encode('utf-8')
-            elif req_data['status'] == 'ready':
+                return
+            if not req_data['delivered']:
+                self.ext._recordSdpSetup(kind, 'poll', req_data['created'])
+            if req_data['status'] == 'ready':
                 response['statusCode'] = 200
                 response['content-type'] = 'application/sdp'
                 response['data'] = req_data['answer'].encode('utf-8')
-                del requests_dict[request_id]
             else:
                 response['statusCode'] = 500
                 response['data'] = (req_data['error'] or 'Unknown error').encode('utf-8')
-                del requests_dict[request_id]
+            del requests_dict[request_id]
 
     def _handle_whip_result(self, response, path):
         request_id = path.split('/whip/result/')[-1]
-        self._handle_sdp_result(response, request_id, self.ext._whip_lock, self.ext._whip_requests)
+        self._handle_sdp_result(response, request_id, self.ext._whip_lock, self.ext._whip_requests, 'whip')
 
     def _handle_whep_proxy(self, request, response):
-        if not self.ext.whep_url:
+        swap = self._swap_slot(request)
+        whep_url = swap.get('whep_url') if swap is not None else self.ext.whep_url
+        if not whep_url:
             response['statusCode'] = 404
             response['data'] = b'No WHEP URL available yet'
             return
@@ -873,31 +3269,40 @@ class HTTPHandler:
         request_id = secrets.token_urlsafe(8)
         ext = self.ext
         with ext._whep_lock:
+            self._prune_delivered(ext._whep_requests)
             ext._whep_requests[request_id] = {
                 'status': 'pending',
                 'offer': offer_sdp,
                 'answer': None,
                 'error': None,
-                'whep_url': self.ext.whep_url
+                'whep_url': whep_url,
+                'created': time.perf_counter(),
+                'delivered': False,
             }
         def exchange_async():
             with ext._whep_lock:
                 req_data = ext._whep_requests.get(request_id)
             if not req_data:
                 return
+            start = time.perf_counter()
             try:
                 answer_sdp, _ = ext.api.exchange_sdp(req_data['whep_url'], req_data['offer'], timeout=API_TIMEOUT_WHEP)
+                ext.metrics.observe('exchange_sdp', (time.perf_counter() - start) * 1000, kind='whep')
                 with ext._whep_lock:
                     req_data['answer'] = answer_sdp
                     req_data['status'] = 'ready'
             except urllib.error.HTTPError:
+                ext.metrics.inc('errors', stage='exchange_sdp', kind='whep')
                 with ext._whep_lock:
                     req_data['status'] = 'error'
                     req_data['error'] = 'WHEP not ready'
             except Exception as e:
+                ext.metrics.inc('errors', stage='exchange_sdp', kind='whep')
                 with ext._whep_lock:
                     req_data['status'] = 'error'
                     req_data['error'] = str(e)
+            finally:
+                ext._callOnMain('_pushSdpResult', 'whep', request_id)
         ext._executor.submit(exchange_async)
         response['statusCode'] = 202
         response['statusReason'] = 'Accepted'
@@ -906,11 +3311,11 @@ class HTTPHandler:
 
     def _handle_whep_result(self, response, path):
         request_id = path.split('/whep/result/')[-1]
-        self._handle_sdp_result(response, request_id, self.ext._whep_lock, self.ext._whep_requests)
+        self._handle_sdp_result(response, request_id, self.ext._whep_lock, self.ext._whep_requests, 'whep')
 
     def _handle_auth_callback(self, request, response):
         params = request.get('pars', {})
-        print(f"Daydream: Auth callback received, params: {params}")
+        self.ext.log.debug("Auth callback received, params: %s", sorted(params))
         token = params.get('token')
         state = params.get('state')
         if not token:
@@ -936,15 +3341,15 @@ class HTTPHandler:
                 raise ValueError("No API key returned")
             self.ext._api_key = api_key
             self.ext._saveCredentials(api_key)
-            print("Daydream: Login successful, API key saved")
-            run(f"op('{self.ext.ownerComp.path}').ext.Daydream._onLoginSuccess()", delayFrames=1)
+            self.ext.log.info("Login successful, API key saved")
+            self.ext._callOnMain('_onLoginSuccess')
             response['statusCode'] = 302
             response['statusReason'] = 'Found'
             response['Location'] = 'https://app.daydream.live/sign-in/local/success'
             response['data'] = b''
         except Exception as e:
             err = str(e)
-            print(f"Daydream: Login failed: {err}")
+            self.ext.log.error("Login failed: %s", err)
             response['statusCode'] = 500
             response['content-type'] = 'text/html; charset=utf-8'
             response['data'] = f'<html><body><h1>Error: {err}</h1></body></html>'.encode('utf-8')
@@ -961,20 +3366,29 @@ class DaydreamExt:
 
     def __init__(self, ownerComp):
         self.ownerComp = ownerComp
-        self.api = DaydreamAPI()
-        self.params = ParameterManager(ownerComp)
+        self.log = RingLogger(owner=ownerComp.path)
+        self.params = ParameterManager(ownerComp, logger=self.log)
+        self._lease = self._acquireRuntime(self.params.Sharedruntime)
+        self.api = DaydreamAPI(pool=self._lease.runtime.pool, logger=self.log)
+        self.metrics = self._lease.runtime.metrics
+        self.params.style_images.metrics = self.metrics
+        self.params.style_images.on_ready = lambda: self._callOnMain('_onStyleImageReady')
         self.http = HTTPHandler(self)
+        self.events = EventBus(self._scheduleEventDrain, self.metrics, logger=self.log)
 
-        self._listeners = []
         self.state = "IDLE"
+        self._recovery = RecoveryController()
+        self._reported_breaker = self._recovery.state
         self.stream_id = None
         self.model_id = None
         self.whip_url = None
         self.whep_url = None
 
-        self.mjpeg_port, self.sdp_port, self.auth_port = self._allocate_ports()
+        self.port = self._lease.ports[0]
 
         self.ws_clients = set()
+        self._relay_hello = {}
+        self._relay_features = frozenset()
         self._whip_requests = {}
         self._whep_requests = {}
         self._ws_lock = threading.Lock()
@@ -987,25 +3401,73 @@ class DaydreamExt:
 
         self._stream_source = None
         self._web_server = None
+        self._frame_encoder = None
+        self._frames_sent = 0
+        self._frames_skipped = 0
+        self._frames_keepalive = 0
+        self._skip_unchanged = True
+        self._transport = 'jpeg'
+        self._pacer = FramePacer()
+        self._latency = LatencyProbe()
+        self._webrtc_stats = WebRTCStats()
+        self._inline_encode_ms = RollingStats()
+        self._quality = QualityController()
+        self._relay_decode = None
+        self._resetFrameChangeTracking()
+        self._sdp_setup_ms = {kind: {'push': RollingStats(), 'poll': RollingStats()} for kind in ('whip', 'whep')}
+        self._relay_sdp_setup_ms = {kind: {'push': RollingStats(), 'poll': RollingStats()} for kind in ('whip', 'whep')}
+        self._ws_handlers = {
+            'decode_stats': self._onRelayDecodeStats,
+            'sdp_timing': self._onRelaySdpTiming,
+            'swap_complete': self._onRelaySwapComplete,
+            'swap_failed': self._onRelaySwapFailed,
+            'latency_marker': self._onRelayLatencyMarker,
+            'webrtc_stats': self._onRelayWebRTCStats,
+        }
 
-        self._executor = ThreadPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS)
+        self._executor = self._lease
+        self._payloads = PayloadBuilder()
+        self._updates = ParamsUpdatePipeline(self.api, self._executor, self._onParamsUpdateComplete, self._payloads)
         self._relay_html_cache = None
         self._pending_changes = set()
         self._params_update_scheduled = False
+        self._params_flush_at = None
+        self._param_limits = ParamRateLimiter()
+        self._cues = CueList(ownerComp)
+        self._cue_applied = {}
+        self._cue_prepare_scheduled = False
+        self._stream_create_started = None
+        self._attach_info = None
+        self._standby = None
+        self._standby_generation = 0
+        self._standby_results = {}
+        self._standby_creating_key = None
+        self._standby_refresh_scheduled = False
+        self._standby_idle_refreshes = 0
+        self._swap = None
+        self._swap_generation = 0
+        self._swap_results = {}
+        self._swap_scheduled = False
+        self._swap_dirty = False
+        self._swap_held = set()
 
         self._loadCredentials()
         self.params.setup()
-        if hasattr(self.ownerComp.par, 'Active'):
-            self.ownerComp.par.Active.val = False
+        self.params.style_images.cache.set_limit(self.params.Stylecachesize)
+        self.log.set_level(self.params.Loglevel)
+        self._latency.active = self._latencyStampsWanted()
+        self.params.set('Active', False)
         self.params.update_states(self.IsLoggedIn)
         self.params.setup_param_exec()
         self._startServers()
         self._warmupWebRender()
+        self._scheduleStandbyRefresh()
+        self._scheduleCuePrepare()
 
         if self._api_key:
-            print(f"DaydreamExt v{VERSION} initialized (Logged in)")
+            self.log.info("DaydreamExt v%s initialized (Logged in)", VERSION)
         else:
-            print(f"DaydreamExt v{VERSION} initialized (Not logged in - click Login)")
+            self.log.info("DaydreamExt v%s initialized (Not logged in - click Login)", VERSION)
 
         self._emit('initialized', {'logged_in': self.IsLoggedIn})
     @property
@@ -1028,32 +3490,42 @@ class DaydreamExt:
     def IsLoggedIn(self):
         return bool(self._api_key)
 
-    def register_listener(self, fn):
-        if callable(fn) and fn not in self._listeners:
-            self._listeners.append(fn)
+    def register_listener(self, fn, events=None, queue_size=EVENT_QUEUE_SIZE):
+        self.events.subscribe(fn, events, queue_size)
 
     def unregister_listener(self, fn):
-        if fn in self._listeners:
-            self._listeners.remove(fn)
+        self.events.unsubscribe(fn)
 
     def _emit(self, event, payload=None):
+        self.events.publish(event, lambda: self._eventPayload(payload))
+
+    def _eventPayload(self, payload):
+        if callable(payload):
+            payload = payload()
         if payload is None:
             payload = {}
         payload['owner_path'] = self.ownerComp.path
         payload['state'] = self.state
         payload['stream_id'] = self.stream_id
-        for listener in self._listeners:
-            try:
-                listener(event, payload)
-            except Exception as e:
-                print(f"Daydream: Listener error on '{event}': {e}")
+        return payload
+
+    def _scheduleEventDrain(self):
+        run(f"op('{self.ownerComp.path}').ext.Daydream._drainEvents()", delayFrames=1)
+
+    def _drainEvents(self):
+        self.events.drain()
+
+    def GetEventStats(self):
+        return self.events.snapshot()
 
     def _set_state(self, new_state, reason=None, error=None):
         old_state = self.state
-        if old_state == new_state:
+        breaker = self._recovery.state
+        if old_state == new_state and breaker == self._reported_breaker:
             return
         self.state = new_state
-        payload = {'from': old_state, 'to': new_state}
+        self._reported_breaker = breaker
+        payload = {'from': old_state, 'to': new_state, 'breaker': breaker}
         if reason:
             payload['reason'] = reason
         if error:
@@ -1071,17 +3543,39 @@ class DaydreamExt:
             'ip_adapter_types': list(IP_ADAPTER_SUPPORT.get(model, set())),
         }
 
-    def _allocate_ports(self):
-        ports = []
-        sockets = []
-        for _ in range(3):
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.bind(('127.0.0.1', 0))
-            ports.append(s.getsockname()[1])
-            sockets.append(s)
-        for s in sockets:
-            s.close()
-        return tuple(ports)
+    def GetMetrics(self):
+        return self.metrics.snapshot()
+
+    def GetLogs(self, level=None, limit=None, since=None):
+        return {**self.log.snapshot(), 'records': self.log.records(level, limit, since)}
+
+    def _acquireRuntime(self, shared, ports=None):
+        runtime = DaydreamRuntime.shared_instance() if shared else DaydreamRuntime()
+        return runtime.register(self.ownerComp.path, ports)
+
+    def _applyRuntime(self):
+        shared = self.params.Sharedruntime
+        if self._lease.runtime.shared == shared:
+            return
+        if self.Active or self.state == "CREATING":
+            self.log.info("Shared runtime change will apply after Stop")
+            return
+        previous = self._lease
+        self._lease = self._acquireRuntime(shared, previous.ports)
+        runtime = self._lease.runtime
+        self.api = DaydreamAPI(self.api.token, pool=runtime.pool, logger=self.log)
+        self.metrics = runtime.metrics
+        self.params.style_images.metrics = self.metrics
+        self.events.metrics = self.metrics
+        self._executor = self._lease
+        self._updates = ParamsUpdatePipeline(self.api, self._executor, self._onParamsUpdateComplete, self._payloads)
+        self._discardStandby("runtime_changed")
+        previous.close()
+        self.log.info("Using %s runtime", "shared" if shared else "private")
+        self._scheduleStandbyRefresh()
+
+    def GetRuntimeStats(self):
+        return {**self._lease.runtime.snapshot(), 'instance': self._lease.snapshot()}
 
     def _loadCredentials(self):
         if not os.path.exists(self.CREDENTIALS_PATH):
@@ -1094,9 +3588,9 @@ class DaydreamExt:
                         self._api_key = line.split(':', 1)[1].strip()
                         break
                 if self._api_key:
-                    print(f"Daydream: Loaded credentials from {self.CREDENTIALS_PATH}")
+                    self.log.info("Loaded credentials from %s", self.CREDENTIALS_PATH)
         except Exception as e:
-            print(f"Daydream: Failed to load credentials: {e}")
+            self.log.error("Failed to load credentials: %s", e)
 
     def _saveCredentials(self, api_key):
         credentials_dir = os.path.dirname(self.CREDENTIALS_PATH)
@@ -1105,12 +3599,11 @@ class DaydreamExt:
         try:
             with open(self.CREDENTIALS_PATH, 'w') as f:
                 f.write(f"DAYDREAM_API_KEY: {api_key}\n")
-            print(f"Daydream: Saved credentials to {self.CREDENTIALS_PATH}")
+            self.log.info("Saved credentials to %s", self.CREDENTIALS_PATH)
         except Exception as e:
-            print(f"Daydream: Failed to save credentials: {e}")
+            self.log.error("Failed to save credentials: %s", e)
 
     def _load_auth_states(self):
-        import time
         if not os.path.exists(self.AUTH_STATES_PATH):
             return {}
         try:
@@ -1130,10 +3623,9 @@ class DaydreamExt:
             with open(self.AUTH_STATES_PATH, 'w') as f:
                 json.dump({'states': states}, f)
         except Exception as e:
-            print(f"Daydream: Failed to save auth states: {e}")
+            self.log.error("Failed to save auth states: %s", e)
 
     def _add_auth_state(self, state):
-        import time
         states = self._load_auth_states()
         states[state] = time.time()
         self._save_auth_states(states)
@@ -1150,14 +3642,21 @@ class DaydreamExt:
 
     def _onLoginSuccess(self):
         self.params.update_states(True)
-        print("Daydream: Login successful, ready to stream")
+        self.log.info("Login successful, ready to stream")
         self._emit('login_success', {})
+        self._scheduleStandbyRefresh()
 
     def _resetStreamState(self, reason=None):
         self.stream_id = None
         self.whip_url = None
         self.model_id = None
         self.whep_url = None
+        self.params.stream_model = None
+        if self._swap:
+            self._releaseStream(self._swap.get('stream_id'))
+        self._swap = None
+        self._swap_dirty = False
+        self._swap_held.clear()
         self._set_state("IDLE", reason=reason or "reset")
 
     def ResetParameters(self):
@@ -1167,10 +3666,10 @@ class DaydreamExt:
         self.params.setup_param_exec()
 
     def Setup(self):
-        required_ops = ['web_server', 'web_server_sdp', 'web_render', 'stream_source', 'frame_timer']
+        required_ops = ['web_server', 'web_render', 'stream_source', 'frame_timer']
         missing = [op for op in required_ops if not self.ownerComp.op(op)]
         if missing:
-            print(f"Daydream Warning: Missing operators: {missing}")
+            self.log.warning("Missing operators: %s", missing)
             return False
         return True
 
@@ -1178,29 +3677,30 @@ class DaydreamExt:
         self._auth_state = secrets.token_urlsafe(16)
         self._add_auth_state(self._auth_state)
         self._auth_pending = True
-        auth_url = f"https://app.daydream.live/sign-in/local?port={self.auth_port}&state={self._auth_state}"
-        print(f"Daydream: Opening browser for login: {auth_url}")
-        self._emit('login_started', {'auth_port': self.auth_port})
+        auth_url = f"https://app.daydream.live/sign-in/local?port={self.port}&state={self._auth_state}"
+        self.log.info("Opening browser for login: %s", auth_url)
+        self._emit('login_started', {'auth_port': self.port})
         webbrowser.open(auth_url)
 
     def Start(self):
         if not self.ApiToken:
             err = "Not logged in. Please click Login first."
-            print(f"Daydream Error: {err}")
+            self.log.error(err)
             self._set_state("ERROR", reason="start_failed", error=err)
             self._emit('error', {'error': err, 'context': 'start'})
             return
         self._stream_source = self.ownerComp.op('stream_source')
         if not self._stream_source or self._stream_source.width == 0 or self._stream_source.height == 0:
             err = "No input connected to stream_source."
-            print(f"Daydream Error: {err}")
+            self.log.error(err)
             self._set_state("ERROR", reason="start_failed", error=err)
             self._emit('error', {'error': err, 'context': 'start'})
             return
         if self.state == "CREATING":
-            print("Daydream: Stream is being created, please wait...")
+            self.log.info("Stream is being created, please wait...")
             return
         self._web_server = self.ownerComp.op('web_server')
+        self._startFrameEncoder()
         self._setupWebRender()
         frame_timer = self.ownerComp.op('frame_timer')
         if frame_timer:
@@ -1208,14 +3708,19 @@ class DaydreamExt:
         self._createStream()
 
     def Stop(self):
-        print("Daydream: Stopping...")
+        self.log.info("Stopping...")
         was_streaming = self.state == "STREAMING"
         prev_stream_id = self.stream_id
         frame_timer = self.ownerComp.op('frame_timer')
         if frame_timer:
             frame_timer.par.active = 0
         self._params_update_scheduled = False
+        self._params_flush_at = None
         self._pending_changes.clear()
+        self._param_limits.reset()
+        self._cues.reset()
+        self._updates.reset()
+        self._payloads.reset()
         web_server = self.ownerComp.op('web_server')
         if web_server:
             with self._ws_lock:
@@ -1227,6 +3732,8 @@ class DaydreamExt:
                     pass
         with self._ws_lock:
             self.ws_clients.clear()
+        self._relay_hello.clear()
+        self._relay_features = frozenset()
         with self._whip_lock:
             self._whip_requests.clear()
         with self._whep_lock:
@@ -1234,13 +3741,17 @@ class DaydreamExt:
         web_render = self.ownerComp.op('web_render')
         if web_render:
             web_render.par.url = 'about:blank'
+        self._stopFrameEncoder()
         self._stream_source = None
         self._web_server = None
+        self._recovery.reset()
         self._resetStreamState(reason="stop")
         self.params.update_cold_states(False)
         self.UpdateStatusText("Idle")
         if was_streaming:
             self._emit('streaming_stopped', {'prev_stream_id': prev_stream_id})
+        self._applyRuntime()
+        self._scheduleStandbyRefresh()
 
     def _warmupWebRender(self):
         web_render = self.ownerComp.op('web_render')
@@ -1248,53 +3759,73 @@ class DaydreamExt:
             return
         web_render.par.url = 'about:blank'
         web_render.par.active = 1
-        print("Daydream: Web Render pre-warmed")
+        self.log.debug("Web Render pre-warmed")
 
-    def _startServers(self):
+    def _startServers(self, attempt=0):
+        for legacy in ('web_server_sdp', 'web_server_auth'):
+            legacy_server = self.ownerComp.op(legacy)
+            if legacy_server:
+                legacy_server.par.active = 0
         web_server = self.ownerComp.op('web_server')
         if web_server:
             web_server.par.active = 0
-            web_server.par.port = self.mjpeg_port
+            web_server.par.port = self.port
             web_server.par.active = 1
-            print(f"Daydream: Frame server started on port {self.mjpeg_port}")
-        else:
-            print("Daydream Error: web_server DAT not found")
-        web_server_sdp = self.ownerComp.op('web_server_sdp')
-        if web_server_sdp:
-            web_server_sdp.par.active = 0
-            web_server_sdp.par.port = self.sdp_port
-            web_server_sdp.par.active = 1
-            print(f"Daydream: SDP proxy server started on port {self.sdp_port}")
-        else:
-            print("Daydream Error: web_server_sdp DAT not found - WHIP/WHEP will not work!")
-        web_server_auth = self.ownerComp.op('web_server_auth')
-        if web_server_auth:
-            web_server_auth.par.active = 0
-            web_server_auth.par.port = self.auth_port
-            web_server_auth.par.active = 1
-            print(f"Daydream: Auth server started on port {self.auth_port}")
+            self.log.info("Web server started on port %s", self.port)
+            run(f"op('{self.ownerComp.path}').ext.Daydream._checkWebServer({attempt})", delayMilliSeconds=WEB_SERVER_CHECK_DELAY_MS)
         else:
-            print("Daydream Error: web_server_auth DAT not found")
+            self.log.error("web_server DAT not found")
+
+    def _checkWebServer(self, attempt):
+        web_server = self.ownerComp.op('web_server')
+        if not web_server or web_server.par.port.eval() != self.port:
+            return
+        errors = web_server.errors()
+        if not errors:
+            return
+        if attempt >= WEB_SERVER_START_RETRIES:
+            err = f"Web server failed to start on port {self.port}: {errors}"
+            self.log.error(err)
+            self._emit('error', {'error': err, 'context': 'web_server'})
+            return
+        failed_port = self.port
+        self.port = self._lease.runtime.allocate_ports(self._lease, len(self._lease.ports))[0]
+        self.log.warning("Web server failed to start on port %s (%s), retrying on %s", failed_port, errors, self.port)
+        self._startServers(attempt + 1)
+        if self.Active:
+            self._setupWebRender()
 
     def _setupWebRender(self):
         web_render = self.ownerComp.op('web_render')
         if not web_render:
-            print("Daydream Error: web_render TOP not found")
+            self.log.error("web_render TOP not found")
             return
-        url = f"http://localhost:{self.mjpeg_port}/relay.html"
-        print(f"Daydream: Loading Web Render URL: {url}")
+        url = f"http://localhost:{self.port}/relay.html"
+        self.log.debug("Loading Web Render URL: %s", url)
         web_render.par.url = url
 
     def _createStream(self):
         if self.state == "CREATING":
-            print("Daydream: Stream creation already in progress")
+            self.log.info("Stream creation already in progress")
             return
         if not self.ApiToken:
-            print("Daydream Error: Not logged in")
+            self.log.error("Not logged in")
             return
-        print("Daydream: Creating stream...")
+        self._stream_create_started = time.perf_counter()
+        standby = self._takeStandby()
+        if standby:
+            self.log.info("Attaching to standby stream %s", standby['response'].get('id'))
+            self._set_state("CREATING", reason="standby_attach")
+            self._emit('stream_create_started', {'model': self.params.Model, 'standby': True})
+            self._attach_info = {'standby': True, 'time_saved_ms': standby['create_ms']}
+            self.params.stream_model = standby['key'][0]
+            self._pending_response = standby['response']
+            self._onStreamCreated()
+            return
+        self.log.info("Creating stream...")
         self._set_state("CREATING", reason="stream_create")
-        self._emit('stream_create_started', {'model': self.params.Model})
+        self._emit('stream_create_started', {'model': self.params.Model, 'standby': False})
+        self._attach_info = {'standby': False, 'time_saved_ms': 0.0}
         self.UpdateStatusText("Creating stream...")
         self.api.set_token(self.ApiToken)
         params = self.params.build_params(for_update=False)
@@ -1303,18 +3834,21 @@ class DaydreamExt:
             "params": params,
             "owner_path": self.ownerComp.path
         }
+        self.params.stream_model = self.params.Model
         self._executor.submit(self._createStreamAsync)
 
     def _createStreamAsync(self):
-        owner_path = self._start_params["owner_path"]
+        start = time.perf_counter()
         try:
             params = self._start_params["params"]
             response = self.api.create_stream(model_id=self._start_params["model"], **params)
+            self.metrics.observe('create_stream', (time.perf_counter() - start) * 1000, kind='stream')
             self._pending_response = response
-            run(f"op('{owner_path}').ext.Daydream._onStreamCreated()", delayFrames=1)
+            self._callOnMain('_onStreamCreated')
         except Exception as e:
+            self.metrics.inc('errors', stage='create_stream')
             self._pending_error = str(e)
-            run(f"op('{owner_path}').ext.Daydream._onStreamCreateError()", delayFrames=1)
+            self._callOnMain('_onStreamCreateError')
 
     def _onStreamCreated(self):
         response = self._pending_response
@@ -1322,9 +3856,9 @@ class DaydreamExt:
         self.whip_url = response.get("whip_url")
         response_params = response.get("params", {})
         self.model_id = response_params.get("model_id")
-        print(f"Daydream: Stream Created. ID: {self.stream_id}")
-        print(f"Daydream: WHIP URL: {self.whip_url}")
-        print(f"Daydream: Model: {self.model_id}")
+        self.log.info("Stream Created. ID: %s", self.stream_id)
+        self.log.debug("WHIP URL: %s", self.whip_url)
+        self.log.info("Model: %s", self.model_id)
         self._emit('stream_created', {
             'whip_url': self.whip_url,
             'model_id': self.model_id,
@@ -1335,45 +3869,498 @@ class DaydreamExt:
             self._resetStreamState(reason="active_toggled_off")
             self.UpdateStatusText("Idle")
 
+    def _standbyKey(self):
+        p = self.params
+        return (p.Model, p.Width, p.Height, p.Steps)
+
+    def _scheduleStandbyRefresh(self, idle=False):
+        if not idle:
+            self._standby_idle_refreshes = 0
+        if self._standby_refresh_scheduled:
+            return
+        self._standby_refresh_scheduled = True
+        run(f"op('{self.ownerComp.path}').ext.Daydream._refreshStandby()", delayMilliSeconds=STANDBY_REFRESH_DELAY_MS)
+
+    def _discardStandby(self, reason, release=True):
+        standby = self._standby
+        if standby:
+            self.log.info("Discarding standby stream %s (%s)", standby['response'].get('id'), reason)
+            if release:
+                self._releaseStream(standby['response'].get('id'))
+        self._standby = None
+        self._standby_creating_key = None
+        self._standby_generation += 1
+
+    def _releaseStream(self, stream_id):
+        if not stream_id or not self.ApiToken:
+            return
+        self.api.set_token(self.ApiToken)
+        self._executor.submit(self.api.delete_stream, stream_id)
+        self.metrics.inc('streams_released')
+
+    def _onStandbyExpired(self, generation):
+        if generation != self._standby_generation or not self._standby:
+            return
+        if self._standby_idle_refreshes >= STANDBY_MAX_IDLE_REFRESHES:
+            self._discardStandby("expired")
+            return
+        self._standby_idle_refreshes += 1
+        self._scheduleStandbyRefresh(idle=True)
+
+    def _refreshStandby(self):
+        self._standby_refresh_scheduled = False
+        if not self.params.Standby or not self.IsLoggedIn:
+            if self._standby or self._standby_creating_key:
+                self._discardStandby("disabled")
+            return
+        if self.state not in ("IDLE", "ERROR"):
+            return
+        key = self._standbyKey()
+        standby = self._standby
+        if standby and standby['key'] == key and time.monotonic() - standby['created_at'] < STANDBY_MAX_AGE_S:
+            return
+        if standby is None and self._standby_creating_key == key:
+            return
+        self._discardStandby("params_changed" if standby and standby['key'] != key else "refresh")
+        generation = self._standby_generation
+        self._standby_creating_key = key
+        self.api.set_token(self.ApiToken)
+        params = self.params.build_params(for_update=False)
+        self.log.info("Creating standby stream for %s", key)
+        self._executor.submit(self._createStandbyAsync, generation, key, params)
+
+    def _createStandbyAsync(self, generation, key, params):
+        start = time.perf_counter()
+        try:
+            response = self.api.create_stream(model_id=key[0], **params)
+        except Exception as e:
+            self.metrics.inc('errors', stage='create_stream')
+            self._standby_results[generation] = {'error': str(e)}
+        else:
+            self.metrics.observe('create_stream', (time.perf_counter() - start) * 1000, kind='standby')
+            self._standby_results[generation] = {
+                'key': key,
+                'response': response,
+                'create_ms': (time.perf_counter() - start) * 1000,
+            }
+        self._callOnMain('_onStandbyCreated', generation)
+
+    def _onStandbyCreated(self, generation):
+        result = self._standby_results.pop(generation, None)
+        if not result:
+            return
+        if generation != self._standby_generation:
+            if 'response' in result:
+                self.log.info("Standby stream %s is no longer needed", result['response'].get('id'))
+                self._releaseStream(result['response'].get('id'))
+            return
+        self._standby_creating_key = None
+        if 'error' in result:
+            self.log.warning("Standby stream creation failed. %s", result['error'])
+            self._emit('standby_failed', {'error': result['error']})
+            return
+        result['created_at'] = time.monotonic()
+        self._standby = result
+        self.log.info("Standby stream ready: %s (%.0f ms)", result['response'].get('id'), result['create_ms'])
+        self._emit('standby_ready', {'model': result['key'][0], 'create_ms': round(result['create_ms'], 1)})
+        run(f"op('{self.ownerComp.path}').ext.Daydream._onStandbyExpired({generation})", delayMilliSeconds=STANDBY_MAX_AGE_S * 1000)
+
+    def _takeStandby(self):
+        standby = self._standby
+        if not standby:
+            return None
+        if standby['key'] != self._standbyKey() or time.monotonic() - standby['created_at'] >= STANDBY_MAX_AGE_S:
+            self._discardStandby("stale")
+            return None
+        self._discardStandby("attached", release=False)
+        return standby
+
+    def _scheduleHotSwap(self):
+        if self._swap_scheduled:
+            return
+        self._swap_scheduled = True
+        run(f"op('{self.ownerComp.path}').ext.Daydream._beginHotSwap()", delayMilliSeconds=HOTSWAP_DELAY_MS)
+
+    def _beginHotSwap(self):
+        self._swap_scheduled = False
+        if self.state != "STREAMING" or not self.stream_id or not self.params.Hotswap:
+            self._releaseSwapHeld()
+            return
+        if self._swap:
+            self._swap_dirty = True
+            return
+        if 'stream_swap' not in self._relay_features:
+            self.log.warning("Relay does not support stream swap yet, keeping %s", self.params.stream_model)
+            self._swap_dirty = True
+            self._releaseSwapHeld()
+            return
+        self._swap_dirty = False
+        self._swap_generation += 1
+        generation = self._swap_generation
+        model = self.params.Model
+        params = self.params.build_params(for_update=False)
+        self._swap = {'id': generation, 'started': time.perf_counter(), 'model': model}
+        self.log.info("Hot swap #%s - creating %s stream in background...", generation, model)
+        self._emit('stream_swap_started', {'id': generation, 'model': model, 'stream_id': self.stream_id})
+        self.api.set_token(self.ApiToken)
+        self._executor.submit(self._createSwapAsync, generation, model, params)
+        run(f"op('{self.ownerComp.path}').ext.Daydream._onSwapTimeout({generation})", delayMilliSeconds=HOTSWAP_TIMEOUT_S * 1000)
+
+    def _createSwapAsync(self, generation, model, params):
+        start = time.perf_counter()
+        try:
+            response = self.api.create_stream(model_id=model, **params)
+        except Exception as e:
+            self.metrics.inc('errors', stage='create_stream')
+            self._swap_results[generation] = {'error': str(e)}
+        else:
+            self.metrics.observe('create_stream', (time.perf_counter() - start) * 1000, kind='swap')
+            self._swap_results[generation] = {'response': response}
+        self._callOnMain('_onSwapCreated', generation)
+
+    def _onSwapCreated(self, generation):
+        result = self._swap_results.pop(generation, None)
+        swap = self._swap
+        if not result:
+            return
+        if not swap or swap['id'] != generation:
+            if 'response' in result:
+                self.log.info("Hot swap #%s - releasing stale stream %s", generation, result['response'].get('id'))
+                self._releaseStream(result['response'].get('id'))
+            return
+        if 'error' in result:
+            self._onSwapFailed(generation, result['error'])
+            return
+        response = result['response']
+        swap['stream_id'] = response.get('id')
+        swap['model_id'] = response.get('params', {}).get('model_id')
+        swap['whip_url'] = response.get('whip_url')
+        swap['created_ms'] = (time.perf_counter() - swap['started']) * 1000
+        self.log.info("Hot swap #%s - stream %s created, negotiating relay...", generation, swap['stream_id'])
+        if not self._sendRelayMessage({'type': 'swap_prepare', 'id': generation}):
+            self._onSwapFailed(generation, 'Relay not connected')
+
+    def _onRelaySwapComplete(self, message):
+        swap = self._swap
+        if not swap or swap['id'] != message.get('id'):
+            return
+        self._swap = None
+        prev_stream_id = self.stream_id
+        self.stream_id = swap['stream_id']
+        self.model_id = swap['model_id']
+        self.whip_url = swap['whip_url']
+        self.whep_url = swap.get('whep_url')
+        self.params.stream_model = swap['model']
+        self._swap_held.clear()
+        self._updates.reset()
+        self._updates.submit(self.stream_id, self.model_id, self.params.build_params(for_update=True))
+        swap_latency_ms = (time.perf_counter() - swap['started']) * 1000
+        overlap_ms = message.get('overlap_ms')
+        self.log.info("Hot swap #%s complete - %s -> %s (%.0f ms)", swap['id'], prev_stream_id, self.stream_id, swap_latency_ms)
+        self._releaseStream(prev_stream_id)
+        self._emit('stream_swapped', {
+            'id': swap['id'],
+            'prev_stream_id': prev_stream_id,
+            'stream_id': self.stream_id,
+            'model_id': self.model_id,
+            'whep_url': self.whep_url,
+            'create_ms': round(swap['created_ms'], 1),
+            'swap_latency_ms': round(swap_latency_ms, 1),
+            'overlap_ms': overlap_ms if isinstance(overlap_ms, (int, float)) else None,
+        })
+        self.UpdateStatusText(f"Streaming: {self.stream_id}")
+        if self._swap_dirty:
+            self._scheduleHotSwap()
+
+    def _onRelaySwapFailed(self, message):
+        self._onSwapFailed(message.get('id'), message.get('error') or 'Relay swap failed')
+
+    def _onSwapTimeout(self, generation):
+        self._onSwapFailed(generation, f"Timed out after {HOTSWAP_TIMEOUT_S}s")
+
+    def _onSwapFailed(self, generation, error):
+        swap = self._swap
+        if not swap or swap['id'] != generation:
+            return
+        self._swap = None
+        self.log.warning("Hot swap #%s failed. %s", generation, error)
+        self._sendRelayMessage({'type': 'swap_cancel', 'id': generation})
+        self._releaseStream(swap.get('stream_id'))
+        self._emit('stream_swap_failed', {
+            'id': generation,
+            'error': error,
+            'stream_id': self.stream_id,
+            'failed_stream_id': swap.get('stream_id'),
+        })
+        if self._swap_dirty:
+            self._scheduleHotSwap()
+        else:
+            self._releaseSwapHeld()
+
+    def _releaseSwapHeld(self):
+        if not self._swap_held:
+            return
+        self._pending_changes |= self._swap_held
+        self._swap_held.clear()
+        self._sendParamsUpdate()
+
     def _onStreamCreateError(self):
         err = self._pending_error
-        print(f"Daydream Error: Failed to create stream. {err}")
+        self.log.error("Failed to create stream. %s", err)
         self._resetStreamState(reason="stream_create_failed")
+        if self.Active and self._recovery.recovering:
+            self._emit('stream_create_failed', {'error': err})
+            self._scheduleRecovery("stream_create_failed", err, 'stream_create')
+            return
         self._set_state("ERROR", reason="stream_create_failed", error=err)
         self._emit('stream_create_failed', {'error': err})
         self._emit('error', {'error': err, 'context': 'stream_create'})
         self.UpdateStatusText(f"Error: {err}")
-        if hasattr(self.ownerComp.par, 'Active'):
-            self.ownerComp.par.Active.val = False
+        self.params.set('Active', False)
 
     def _onWhipFailed(self):
-        print("Daydream: WHIP failed, recreating stream...")
-        self._emit('error', {'error': 'WHIP connection failed', 'context': 'whip', 'will_retry': self.Active})
+        if not self.Active:
+            self.log.warning("WHIP failed")
+            self._emit('error', {'error': 'WHIP connection failed', 'context': 'whip', 'will_retry': False})
+            self._resetStreamState(reason="whip_failed")
+            return
         self._resetStreamState(reason="whip_failed")
-        if self.Active:
-            self._createStream()
+        self._scheduleRecovery("whip_failed", 'WHIP connection failed', 'whip')
+
+    def _scheduleRecovery(self, reason, error, context):
+        recovery = self._recovery
+        delay_ms = recovery.on_failure(time.monotonic())
+        self.metrics.inc('recovery_retries', context=context)
+        if recovery.state == 'open':
+            self.metrics.inc('recovery_breaker_trips')
+            self.log.warning("%s - retry budget exhausted, pausing recovery for %.0fs", error, delay_ms / 1000, key='recovery')
+        else:
+            self.log.warning("%s - retrying in %.1fs (attempt %s)", error, delay_ms / 1000, recovery.attempt, key='recovery')
+        self._set_state("ERROR", reason=reason, error=error)
+        self._emit('error', {
+            'error': error,
+            'context': context,
+            'will_retry': True,
+            'attempt': recovery.attempt,
+            'retry_in_ms': round(delay_ms),
+            'breaker': recovery.state,
+        })
+        self.UpdateStatusText(f"Reconnecting in {delay_ms / 1000:.1f}s...")
+        run(f"op('{self.ownerComp.path}').ext.Daydream._onRecoveryRetry({recovery.generation})",
+            delayMilliSeconds=delay_ms)
+
+    def _onRecoveryRetry(self, generation):
+        recovery = self._recovery
+        if generation != recovery.generation or not self.Active or self.state in ("CREATING", "STREAMING"):
+            return
+        recovery.on_retry()
+        self.metrics.inc('recovery_attempts')
+        self._createStream()
+
+    def _onWhipConnected(self):
+        recovery = self._recovery
+        if self.state != "STREAMING":
+            return
+        result = recovery.on_success(time.monotonic())
+        if result is None:
+            return
+        self.metrics.observe('recovery_time', result['recover_ms'])
+        self.log.info("Stream recovered after %s attempt(s) in %.0f ms", result['attempts'], result['recover_ms'])
+        self._set_state(self.state, reason="recovered")
+        self._emit('stream_recovered', result)
+
+    def GetRecoveryStats(self):
+        return self._recovery.snapshot(time.monotonic())
 
     def _startWebRTC(self):
-        print("Daydream: Stream ready, WebRTC can connect...")
+        self.log.info("Stream ready, WebRTC can connect...")
+        self._webrtc_stats.reset()
         self._set_state("STREAMING", reason="webrtc_ready")
+        attach_info = self._attach_info or {'standby': False, 'time_saved_ms': 0.0}
+        if attach_info['standby']:
+            self._updates.submit(self.stream_id, self.model_id, self.params.build_params(for_update=True))
+        elif self.params.style_changed_since_sent():
+            self._scheduleParamsUpdate('Styleimage')
+        create_ms = (time.perf_counter() - self._stream_create_started) * 1000 if self._stream_create_started else None
         self._emit('streaming_started', {
             'whip_url': self.whip_url,
             'whep_url': self.whep_url,
             'model_id': self.model_id,
+            'standby': attach_info['standby'],
+            'create_ms': round(create_ms, 1) if create_ms is not None else None,
+            'time_saved_ms': round(attach_info['time_saved_ms'], 1),
         })
         self.UpdateStatusText(f"Streaming: {self.stream_id}")
 
     def OnWebSocketOpen(self, client, uri):
-        print(f"Daydream: WebSocket client connected: {client}")
+        if (uri or WS_PATH).split('?', 1)[0] != WS_PATH:
+            web_server = self.ownerComp.op('web_server')
+            if web_server:
+                web_server.webSocketClose(client)
+            return
+        self.log.info("WebSocket client connected: %s", client)
         with self._ws_lock:
             self.ws_clients.add(client)
+        self._capture_cooks = None
+        self._capture_settled = False
+        self._updateRelayFeatures()
 
     def OnWebSocketClose(self, client):
         with self._ws_lock:
             self.ws_clients.discard(client)
+        self._relay_hello.pop(client, None)
+        self._updateRelayFeatures()
 
     def OnWebSocketReceiveText(self, client, data):
-        pass
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get('type') == 'hello':
+            self._onRelayHello(client, message)
+            return
+        handler = self._ws_handlers.get(message.get('type'))
+        if handler:
+            handler(message)
+
+    def _onRelayHello(self, client, message):
+        features = message.get('features')
+        self._relay_hello[client] = frozenset(f for f in features if isinstance(f, str)) if isinstance(features, list) else frozenset()
+        self._updateRelayFeatures()
+
+    def _updateRelayFeatures(self):
+        with self._ws_lock:
+            clients = list(self.ws_clients)
+        features = frozenset.intersection(*[self._relay_hello.get(c, frozenset()) for c in clients]) if clients else frozenset()
+        if features == self._relay_features:
+            return
+        self._relay_features = features
+        self.log.info("Relay features: %s", ', '.join(sorted(features)) or 'none')
+        if self._swap_dirty and not self._swap and 'stream_swap' in features and self.state == "STREAMING":
+            self._scheduleHotSwap()
+        if self._web_server is not None and self._resolveTransport() != self._transport:
+            self._stopFrameEncoder()
+            self._startFrameEncoder()
+        if self._latency.active != self._latencyStampsWanted():
+            self._applyLatencyCalibration()
+
+    def _onRelayDecodeStats(self, message):
+        self._relay_decode = {
+            'frames': message.get('frames', 0),
+            'dropped': message.get('dropped', 0),
+            'decode_ms': message.get('decode_ms'),
+            'lag_ms': message.get('lag_ms'),
+        }
+        lag_ms = message.get('lag_ms')
+        if isinstance(lag_ms, (int, float)):
+            self._quality.observe_decode(lag_ms)
+
+    def _latencyStampsWanted(self):
+        return bool(self.params.Calibratelatency) and 'frame_stamps' in self._relay_features
+
+    def _applyLatencyCalibration(self):
+        self._latency.active = self._latencyStampsWanted()
+        if self.params.Calibratelatency and not self._latency.active:
+            self.log.info("Latency calibration waiting for a relay that supports frame stamps")
+        else:
+            self.log.info("Latency calibration %s", "started" if self._latency.active else "stopped")
+        self._sendLatencyCalibration()
+
+    def _sendLatencyCalibration(self):
+        self._sendRelayMessage({
+            'type': 'latency_calibration',
+            'enabled': self._latency.active,
+            'interval_ms': LATENCY_MARKER_INTERVAL_MS,
+        })
+
+    def _onRelayLatencyMarker(self, message):
+        if not self._latency.active:
+            return
+        sample = self._latency.record(message, time.monotonic())
+        if sample is None:
+            if message.get('timeout'):
+                self.metrics.inc('latency_marker_timeouts')
+                self.log.debug("Latency marker %s not detected in the output", message.get('seq'))
+            return
+        self.metrics.observe('e2e_latency', sample['latency_ms'])
+        self.log.debug("End-to-end latency %.1f ms (frame %s)", sample['latency_ms'], sample['seq'])
+        self._emit('latency_measured', lambda: {
+            **sample,
+            **self._latency.percentiles(),
+            'samples': self._latency.measured,
+        })
+
+    def GetLatencyStats(self):
+        return self._latency.snapshot()
+
+    def _onRelayWebRTCStats(self, message):
+        sample = self._webrtc_stats.record(message, time.monotonic())
+        if sample is not None:
+            self._emit('webrtc_stats', lambda: dict(sample))
+
+    def GetWebRTCStats(self):
+        return self._webrtc_stats.snapshot(time.monotonic())
+
+    def _pushSdpResult(self, kind, request_id):
+        lock, requests_dict = (self._whip_lock, self._whip_requests) if kind == 'whip' else (self._whep_lock, self._whep_requests)
+        web_server = self.ownerComp.op('web_server')
+        with self._ws_lock:
+            clients = list(self.ws_clients)
+        if not web_server or not clients:
+            return
+        with lock:
+            req_data = requests_dict.get(request_id)
+            if not req_data or req_data['status'] == 'pending' or req_data['delivered']:
+                return
+            message = {'type': 'sdp_result', 'kind': kind, 'id': request_id, 'status': req_data['status']}
+            if req_data['status'] == 'ready':
+                message['sdp'] = req_data['answer']
+            else:
+                message['error'] = req_data['error'] or 'Unknown error'
+            req_data['delivered'] = True
+        self._sendRelayMessage(message)
+        self._recordSdpSetup(kind, 'push', req_data['created'])
+
+    def _sendRelayMessage(self, message):
+        web_server = self.ownerComp.op('web_server')
+        with self._ws_lock:
+            clients = list(self.ws_clients)
+        if not web_server or not clients:
+            return False
+        text = json.dumps(message)
+        sent = False
+        for client in clients:
+            try:
+                web_server.webSocketSendText(client, text)
+                sent = True
+            except Exception:
+                pass
+        return sent
+
+    def _recordSdpSetup(self, kind, mode, created):
+        self._sdp_setup_ms[kind][mode].add((time.perf_counter() - created) * 1000)
+
+    def _onRelaySdpTiming(self, message):
+        kind, mode, setup_ms = message.get('kind'), message.get('mode'), message.get('setup_ms')
+        if kind in self._relay_sdp_setup_ms and mode in ('push', 'poll') and isinstance(setup_ms, (int, float)):
+            self._relay_sdp_setup_ms[kind][mode].add(setup_ms)
+
+    def GetConnectionStats(self):
+        return {
+            'sdp_answer_ms': {
+                kind: {mode: stats.snapshot() for mode, stats in modes.items()}
+                for kind, modes in self._sdp_setup_ms.items()
+            },
+            'relay_sdp_setup_ms': {
+                kind: {mode: stats.snapshot() for mode, stats in modes.items()}
+                for kind, modes in self._relay_sdp_setup_ms.items()
+            },
+            'pool': self.api.pool.snapshot() if self.api.pool else None,
+            'payload': self._payloads.snapshot(),
+            'style_image': self.params.style_images.snapshot(),
+        }
 
     def OnTimerPulse(self):
         with self._ws_lock:
@@ -1385,31 +4372,166 @@ class DaydreamExt:
         if not stream_source or not web_server:
             return
         try:
-            jpeg_data = stream_source.saveByteArray('.jpg', quality=JPEG_QUALITY_STREAM)
-            dead_clients = []
-            for client in clients_snapshot:
-                try:
-                    web_server.webSocketSendBinary(client, jpeg_data)
-                except Exception:
-                    dead_clients.append(client)
-            if dead_clients:
-                with self._ws_lock:
-                    for client in dead_clients:
-                        self.ws_clients.discard(client)
+            now = time.monotonic()
+            due = self._pacer.due(now)
+            encoder = self._frame_encoder
+            frame_data = captured_at = None
+            if encoder:
+                frame = encoder.take()
+                if frame is not None:
+                    frame_data, captured_at = frame
+                elif not due:
+                    return
+            elif not due:
+                return
+            capture = due and (not self._skip_unchanged or self._sourceChanged(stream_source))
+            if capture and encoder:
+                pixels = stream_source.numpyArray(delayed=True)
+                if pixels is not None:
+                    encoder.submit(pixels, now)
+            elif capture:
+                start = time.perf_counter()
+                frame_data = stream_source.saveByteArray('.jpg', quality=self._quality.quality)
+                captured_at = now
+                encode_ms = (time.perf_counter() - start) * 1000
+                self._inline_encode_ms.add(encode_ms)
+                self.metrics.observe('frame_encode', encode_ms, mode='inline')
+                self._quality.observe_encode(encode_ms, len(frame_data))
+            elif due:
+                self._frames_skipped += 1
+                self.metrics.inc('frames_skipped')
+            if frame_data is None:
+                if not due or self._last_frame_data is None or (now - self._last_frame_sent_at) * 1000 < FRAME_KEEPALIVE_MS:
+                    return
+                frame_data, stamp_at = self._last_frame_data, now
+                self._frames_keepalive += 1
+                self.metrics.inc('frames_keepalive')
+            else:
+                stamp_at = captured_at
+                self._last_frame_data = frame_data
+            latency = self._latency
+            self._send_frame(web_server, clients_snapshot, latency.stamp(frame_data, stamp_at) if latency.active else frame_data)
+            self._pacer.sent(now, captured_at)
+            self._last_frame_sent_at = now
         except Exception:
             pass
 
-    def OnHTTPRequest(self, request, response, server_type='frame'):
-        self.http.handle(request, response, server_type)
+    def _sourceChanged(self, stream_source):
+        cooks = getattr(stream_source, 'totalCooks', None)
+        if cooks is None:
+            return True
+        if cooks == self._capture_cooks and self._capture_settled:
+            return False
+        self._capture_settled = cooks == self._capture_cooks
+        self._capture_cooks = cooks
+        return True
+
+    def _resetFrameChangeTracking(self):
+        self._pacer.reset()
+        self._capture_cooks = None
+        self._capture_settled = False
+        self._last_frame_data = None
+        self._last_frame_sent_at = 0.0
+
+    def _applyFrameSettings(self):
+        p = self.params
+        self._skip_unchanged = p.Skipunchanged
+        if self._pacer.fps != p.Targetfps:
+            self._pacer.set_rate(p.Targetfps)
+        async_encode = self._frame_encoder is not None
+        self._quality.configure(
+            p.Adaptivequality, p.Framebudget, p.Jpegqualitymin, p.Jpegqualitymax,
+            p.Scalemin if async_encode else 1.0, p.Scalemax if async_encode else 1.0,
+        )
+        encoder = self._frame_encoder
+        if encoder:
+            encoder.change_threshold = self.params.Changethreshold if self._skip_unchanged else None
+            encoder.transport = self._transport
+
+    def _send_frame(self, web_server, clients, data):
+        dead_clients = []
+        start = time.perf_counter()
+        for client in clients:
+            try:
+                web_server.webSocketSendBinary(client, data)
+            except Exception:
+                dead_clients.append(client)
+        metrics = self.metrics
+        metrics.observe('ws_send', (time.perf_counter() - start) * 1000)
+        metrics.inc('frames_sent')
+        metrics.inc('frame_bytes', len(data))
+        self._frames_sent += 1
+        if dead_clients:
+            with self._ws_lock:
+                for client in dead_clients:
+                    self.ws_clients.discard(client)
+
+    def _startFrameEncoder(self):
+        self._resetFrameChangeTracking()
+        self._transport = self._resolveTransport()
+        if not self._frame_encoder and FrameEncoder.available(self._transport):
+            self._frame_encoder = FrameEncoder(self._quality, metrics=self.metrics, logger=self.log)
+            self._frame_encoder.start()
+        self._applyFrameSettings()
+
+    def _resolveTransport(self):
+        transport = self.params.Transport
+        if transport not in FRAME_TRANSPORTS:
+            return 'jpeg'
+        if transport == 'raw' and not FrameEncoder.available('raw'):
+            self.log.warning("Raw frame transport needs numpy, falling back to JPEG")
+            return 'jpeg'
+        if transport == 'raw' and 'raw_frames' not in self._relay_features:
+            self.log.debug("Relay has not announced raw frames yet, sending JPEG")
+            return 'jpeg'
+        return transport
+
+    def _stopFrameEncoder(self):
+        encoder, self._frame_encoder = self._frame_encoder, None
+        if encoder:
+            encoder.stop()
+
+    def GetFrameStats(self):
+        encoder = self._frame_encoder
+        stats = {
+            'mode': 'async' if encoder else 'inline',
+            'transport': self._transport,
+            'sent': self._frames_sent,
+            'skipped_unchanged_cook': self._frames_skipped,
+            'keepalive': self._frames_keepalive,
+            'quality': self._quality.snapshot(),
+            'pacing': self._pacer.snapshot(),
+            'relay_decode': self._relay_decode,
+        }
+        if encoder:
+            stats.update(encoder.snapshot())
+        else:
+            stats.update({
+                'queue_depth': 0,
+                'dropped': 0,
+                'skipped_unchanged_pixels': 0,
+                'encode_ms': self._inline_encode_ms.snapshot(),
+            })
+        return stats
+
+    def OnHTTPRequest(self, request, response, server_type=None):
+        self.http.handle(request, response)
 
     def _scheduleParamsUpdate(self, par_name):
         self._pending_changes.add(par_name)
-        self._emit('params_update_scheduled', {'param': par_name, 'pending': list(self._pending_changes)})
+        self._param_limits.touch(par_name, time.monotonic())
+        self._emit('params_update_scheduled', lambda: {'param': par_name, 'pending': list(self._pending_changes)})
         if self._params_update_scheduled:
             return
         self._params_update_scheduled = True
         run(f"op('{self.ownerComp.path}').ext.Daydream._doParamsUpdate()", delayMilliSeconds=PARAMS_UPDATE_DELAY_MS)
 
+    def _onStyleImageReady(self):
+        style = self.params.style_images.snapshot()
+        self.log.info("Style image ready (%s bytes, %s)", style['bytes'], style['hash'])
+        if self.state == "STREAMING" and self.stream_id and self.params.style_changed_since_sent():
+            self._scheduleParamsUpdate('Styleimage')
+
     def _sanitize_params_for_emit(self, params):
         sanitized = dict(params)
         if 'ip_adapter_style_image_url' in sanitized:
@@ -1421,52 +4543,240 @@ class DaydreamExt:
 
     def _doParamsUpdate(self):
         self._params_update_scheduled = False
+        self._sendParamsUpdate()
+
+    def _flushParamsUpdate(self):
+        self._params_flush_at = None
+        self._sendParamsUpdate()
+
+    def _scheduleParamsFlush(self, delay_s):
+        flush_at = time.monotonic() + delay_s
+        if self._params_flush_at is not None and self._params_flush_at <= flush_at:
+            return
+        self._params_flush_at = flush_at
+        run(f"op('{self.ownerComp.path}').ext.Daydream._flushParamsUpdate()", delayMilliSeconds=max(1, round(delay_s * 1000)))
+
+    def _limitParamChanges(self, changed):
+        limits = self._param_limits
+        if not limits.policies.keys() & changed:
+            return changed
+        now = time.monotonic()
+        held_s = None
+        for name in [name for name in changed if name in limits.policies]:
+            delay = limits.admit(name, getattr(self.params, name), now)
+            if delay is None:
+                changed.discard(name)
+            elif delay > 0:
+                changed.discard(name)
+                self._pending_changes.add(name)
+                held_s = delay if held_s is None else min(held_s, delay)
+                self.metrics.inc('params_held')
+        if held_s is not None:
+            self._scheduleParamsFlush(held_s)
+        return changed
+
+    def _recordParamsSent(self, changed, params):
+        limits = self._param_limits
+        now = time.monotonic()
+        for name in limits.policies:
+            if name in changed:
+                limits.record(name, getattr(self.params, name), now)
+            elif (name in CN_PARAMS_SET and 'controlnets' in params) or (name in IP_PARAMS_SET and 'ip_adapter' in params):
+                limits.record(name, getattr(self.params, name), now, sent=False)
+
+    def _sendParamsUpdate(self):
         if self.state != "STREAMING" or not self.stream_id:
             return
         if not self._pending_changes:
             return
         changed = self._pending_changes.copy()
         self._pending_changes.clear()
+        changed = self._limitParamChanges(changed)
+        if changed & MODEL_PARAMS_SET and (self._swap or self._swap_scheduled):
+            self._swap_held |= changed & MODEL_PARAMS_SET
+            changed -= MODEL_PARAMS_SET
+            self.log.debug("Holding %s until the stream swap settles", sorted(self._swap_held))
+        if not changed:
+            return
         params = self.params.build_changed_params(changed)
         if not params:
             return
-        stream_id = self.stream_id
-        model_id = self.model_id
-        sanitized = self._sanitize_params_for_emit(params)
-        print(f"Daydream: Updating params (changed: {changed}): {sanitized}")
-        self._emit('params_update_sent', {'changed': list(changed), 'params': sanitized})
-        api = self.api
-        owner_path = self.ownerComp.path
-        def update_async():
-            error = None
-            try:
-                api.update_stream(stream_id, model_id=model_id, **params)
-            except Exception as e:
-                error = str(e)
-                print(f"Daydream Warning: Update failed. {e}")
-            run(f"op('{owner_path}').ext.Daydream._onParamsUpdateResult({repr(error)})", delayFrames=1)
-        self._executor.submit(update_async)
+        self._recordParamsSent(changed, params)
+        seq, queued = self._updates.submit(self.stream_id, self.model_id, params)
+        if self.log.enabled('debug'):
+            self.log.debug("Updating params #%s (changed: %s): %s", seq, changed, self._sanitize_params_for_emit(params))
+        self._emit('params_update_sent', lambda: {
+            'seq': seq, 'queued': queued, 'changed': list(changed), 'params': self._sanitize_params_for_emit(params),
+        })
+
+    def SetParamPolicy(self, par_name, policy=None, **fields):
+        if policy is not None or fields:
+            policy = {**(policy or {}), **fields}
+        self._param_limits.set_policy(par_name, policy)
+
+    def GetParamPolicies(self):
+        return self._param_limits.snapshot()
 
-    def _onParamsUpdateResult(self, error):
-        payload = {'success': error is None}
+    def _onParamsUpdateComplete(self, seq, merged, rtt_ms, error):
+        if error:
+            self.metrics.inc('errors', stage='update_stream')
+        else:
+            self.metrics.observe('update_stream', rtt_ms)
+        self.metrics.inc('params_updates')
+        if merged:
+            self.metrics.inc('params_updates_merged', len(merged))
+        self._callOnMain('_onParamsUpdateResult', seq, merged, round(rtt_ms, 2), error, time.perf_counter())
+
+    def _onParamsUpdateResult(self, seq, merged, rtt_ms, error, acked_at=None):
+        if self.state != "STREAMING":
+            return
+        if acked_at is not None and self._cues.in_flight:
+            self._onCuesAcked([*merged, seq], acked_at, error)
+        payload = {'success': error is None, 'seq': seq, 'merged': merged, 'rtt_ms': rtt_ms}
         if error:
             payload['error'] = error
+            self.log.warning("Update #%s failed. %s", seq, error)
         self._emit('params_update_result', payload)
         if error:
             self._emit('error', {'error': error, 'context': 'params_update'})
 
+    def SaveCue(self, name, values=None, **params):
+        values = {**(values or {}), **params}
+        if not values:
+            values = {par_name: getattr(self.params, par_name) for par_name in HOT_PARAMS}
+        unsupported = [par_name for par_name in values if par_name not in HOT_PARAMS]
+        if unsupported:
+            self.log.warning("Cue %s not saved, unsupported parameters: %s", name, ', '.join(unsupported))
+            return False
+        self._cues.save(name, values)
+        self._prepareCue(name, values, self._cueModel())
+        return True
+
+    def DeleteCue(self, name):
+        return self._cues.delete(name)
+
+    def GetCues(self):
+        return {name: dict(values) for name, values in self._cues.cues.items()}
+
+    def PrepareCues(self):
+        self._cues.styles.clear()
+        self._cues.invalidate()
+        self._prepareCues()
+        return self._cues.snapshot()['prepared']
+
+    def GetCueStats(self):
+        return self._cues.snapshot()
+
+    def _cueModel(self):
+        return self.model_id or self.params.Model
+
+    def _scheduleCuePrepare(self):
+        if self._cue_prepare_scheduled or not self._cues.cues:
+            return
+        self._cue_prepare_scheduled = True
+        run(f"op('{self.ownerComp.path}').ext.Daydream._prepareCues()", delayFrames=1)
+
+    def _prepareCues(self):
+        self._cue_prepare_scheduled = False
+        model_id = self._cueModel()
+        for name, values in self._cues.cues.items():
+            if self._cues.prepared(name, model_id) is None:
+                self._prepareCue(name, values, model_id)
+
+    def _prepareCue(self, name, values, model_id):
+        start = time.perf_counter()
+        style = None
+        source = values.get('Styleimage')
+        if source and not source.startswith(('http://', 'https://')) and IP_ADAPTER_SUPPORT.get(self.params.update_model()):
+            styles = self._cues.styles
+            if source not in styles:
+                self._encodeCueStyle(source)
+            style = styles.get(source)
+            if style is None:
+                return None
+            params = self.params.build_cue_params(values, style[1])
+        else:
+            params = self.params.build_cue_params(values, source or None)
+        return self._cues.put(name, model_id, params, style, (time.perf_counter() - start) * 1000)
+
+    def _encodeCueStyle(self, source):
+        style_top = op(source)
+        if not style_top or not hasattr(style_top, 'saveByteArray') or style_top.width == 0:
+            self.log.warning("Cue style image %s not found", source)
+            self._cues.styles[source] = (None, None)
+            return
+        self._cues.styles[source] = None
+        self.params.style_images.prepare(source, style_top, (self.params.Width, self.params.Height), self._onCueStyleEncoded)
+
+    def _onCueStyleEncoded(self, source, digest, data_url):
+        self._cues.styles[source] = (digest, data_url)
+        self._callOnMain('_prepareCues')
+
+    def _invalidateCues(self, names):
+        if self._cues.invalidate(names):
+            self._scheduleCuePrepare()
+
+    def FireCue(self, name):
+        values = self._cues.cues.get(name)
+        if values is None:
+            self.log.warning("Unknown cue: %s", name)
+            return None
+        if self.state != "STREAMING" or not self.stream_id:
+            self.log.warning("Cue %s not fired, not streaming", name)
+            return None
+        fired_at = time.perf_counter()
+        entry = self._cues.prepared(name, self.model_id)
+        prepared = entry is not None
+        if not prepared:
+            entry = self._prepareCue(name, values, self.model_id)
+        for par_name, value in values.items():
+            if getattr(self.params, par_name) != value:
+                self._cue_applied[par_name] = value
+                self.params.set(par_name, value)
+        self._pending_changes.difference_update(values)
+        changed = set(values)
+        if entry is not None:
+            params, body = entry['params'], entry['body']
+            if entry['style'] and entry['style'][1]:
+                self.params.adopt_style(values['Styleimage'], *entry['style'])
+        else:
+            self.params.invalidate_style_cache()
+            params, body = self.params.build_changed_params(changed), None
+        self._recordParamsSent(changed, params)
+        seq, queued = self._updates.submit(self.stream_id, self.model_id, params, body)
+        self._cues.on_fire(name, seq, fired_at, prepared, queued)
+        self.metrics.observe('cue_fire', (time.perf_counter() - fired_at) * 1000)
+        self.metrics.inc('cues_fired')
+        self.log.info("Cue %s fired #%s%s", name, seq, '' if prepared else ' (not prepared)')
+        self._emit('cue_fired', lambda: {
+            'name': name, 'seq': seq, 'prepared': prepared, 'queued': queued, 'changed': list(changed),
+        })
+        self._invalidateCues(changed)
+        return seq
+
+    def _onCuesAcked(self, seqs, acked_at, error):
+        for name, seq, ack_ms in self._cues.on_ack(seqs, acked_at, error):
+            if not error:
+                self.metrics.observe('cue_ack', ack_ms)
+            self._emit('cue_acked', {'name': name, 'seq': seq, 'success': error is None, 'ack_ms': ack_ms})
+
+    def _callOnMain(self, method, *args):
+        run(f"op('{self.ownerComp.path}').ext.Daydream._dispatchOnMain({method!r}, {time.perf_counter()!r}, *{args!r})", delayFrames=1)
+
+    def _dispatchOnMain(self, method, queued_at, *args):
+        self.metrics.observe('main_thread_delay', (time.perf_counter() - queued_at) * 1000)
+        getattr(self, method)(*args)
+
     def UpdateStatusText(self, text):
         text_op = self.ownerComp.op('text_overlay')
         if text_op:
             text_op.par.text = f"Daydream\n{text}"
 
     def OnParameterChange(self, par):
-        print(f"Daydream: Parameter changed: {par.name} = {par.eval()}")
-        hot_params = [
-            'Prompt', 'Negprompt', 'Seed', 'Guidance', 'Delta',
-            'Depth', 'Canny', 'Tile', 'Hed', 'Openpose', 'Color',
-            'Ipadapter', 'Ipadapterscale', 'Styleimage',
-        ]
+        self.log.debug("Parameter changed: %s = %s", par.name, par.val)
+        self.params.on_change(par)
+        if par.name in self._cue_applied and self._cue_applied.pop(par.name) == par.eval():
+            return
         is_stepschedule = par.name.lower().startswith('stepschedule') and par.name.lower().endswith('step')
         if par.name == "Login":
             self.Login()
@@ -1478,25 +4788,58 @@ class DaydreamExt:
                 self.params.update_cold_states(True)
             else:
                 self.Stop()
+        elif par.name == "Stylecachesize":
+            self.params.style_images.cache.set_limit(self.params.Stylecachesize)
+        elif par.name == "Loglevel":
+            self.log.set_level(self.params.Loglevel)
+        elif par.name == "Sharedruntime":
+            self._applyRuntime()
+        elif par.name == "Calibratelatency":
+            self._applyLatencyCalibration()
+        elif par.name == "Hotswap":
+            self.params.update_cold_states(self.Active)
         elif par.name == "Model":
+            if self.state == "STREAMING" and self.params.Hotswap:
+                self._scheduleHotSwap()
             self.params.update_controlnet_states()
             self.params.update_ipadapter_states()
-        elif par.name in hot_params or is_stepschedule:
+            self._scheduleStandbyRefresh()
+            self._scheduleCuePrepare()
+        elif par.name in STANDBY_PARAMS or par.name == "Standby":
+            self._scheduleStandbyRefresh()
+        elif par.name == "Transport":
+            if self.state == "STREAMING":
+                self._stopFrameEncoder()
+                self._startFrameEncoder()
+        elif par.name == "Targetfps":
+            self._relay_html_cache = None
+            self._applyFrameSettings()
+        elif par.name in PERFORMANCE_PARAMS:
+            self._applyFrameSettings()
+        elif par.name in HOT_PARAMS or is_stepschedule:
             if par.name == 'Styleimage':
                 self.params.invalidate_style_cache()
+            if self._cues.cues:
+                self._invalidateCues({par.name})
             if self.state == "STREAMING" and self.stream_id:
                 self._scheduleParamsUpdate(par.name)
+        if par.name in HOTSWAP_PARAMS and self.state == "STREAMING" and self.params.Hotswap:
+            self._scheduleHotSwap()
 
     def _get_relay_html(self):
         if self._relay_html_cache is None:
-            self._relay_html_cache = RELAY_HTML_TEMPLATE.replace('{{SDP_PORT}}', str(self.sdp_port)).encode('utf-8')
+            html = RELAY_HTML_TEMPLATE.replace('{{FRAME_RATE}}', str(self.params.Targetfps))
+            self._relay_html_cache = html.encode('utf-8')
         return self._relay_html_cache
 
     def Message(self, msg):
-        print(f"Daydream Message: {msg}")
+        self.log.info("Message: %s", msg)
 
     def Destroy(self):
-        self._executor.shutdown(wait=False)
+        self._stopFrameEncoder()
+        self.params.style_images.close()
+        self.api.close()
+        self._lease.close()
 
 
 # RELAY_HTML_BEGIN
@@ -1560,9 +4903,9 @@ RELAY_HTML_TEMPLATE = '''<!DOCTYPE html>
         text-shadow: 0 2px 6px rgba(0, 0, 0, 0.5);
       }
     </style>
-    <script type="module" crossorigin>(function(){const e=document.createElement("link").relList;if(e&&e.supports&&e.supports("modulepreload"))return;for(const i of document.querySelectorAll('link[rel="modulepreload"]'))r(i);new MutationObserver(i=>{for(const a of i)if(a.type==="childList")for(const n of a.addedNodes)n.tagName==="LINK"&&n.rel==="modulepreload"&&r(n)}).observe(document,{childList:!0,subtree:!0});function t(i){const a={};return i.integrity&&(a.integrity=i.integrity),i.referrerPolicy&&(a.referrerPolicy=i.referrerPolicy),i.crossOrigin==="use-credentials"?a.credentials="include":i.crossOrigin==="anonymous"?a.credentials="omit":a.credentials="same-origin",a}function r(i){if(i.ep)return;i.ep=!0;const a=t(i);fetch(i.href,a)}})();let f,w,y,p=null,R=null;function U(s){if(f=s,y=!!f.getContext("bitmaprenderer"),w=y?f.getContext("bitmaprenderer"):f.getContext("2d"),!y){const e=w;e.fillStyle="#000",e.fillRect(0,0,512,512)}}function A(s){p=s,k()}function k(){if(!p||R)return;const s=p;p=null,R=createImageBitmap(new Blob([s],{type:"image/jpeg"})).then(e=>{y?w.transferFromImageBitmap(e):(w.drawImage(e,0,0,512,512),e.close())}).catch(()=>{}).finally(()=>{R=null,p&&k()})}const O="{{SDP_PORT}}",M=window.location.origin,g=`${window.location.protocol}//${window.location.hostname}:${O}`,_=M.replace("http","ws")+"/ws",P=g+"/whip",b=g+"/whep";let u=null;function W(){u=new WebSocket(_),u.binaryType="arraybuffer",u.onopen=()=>console.log("[Relay] WebSocket connected"),u.onmessage=s=>{s.data instanceof ArrayBuffer&&A(s.data)},u.onclose=()=>{console.log("[Relay] WebSocket closed, reconnecting..."),setTimeout(W,1e3)}}const T=[{urls:"stun:stun.l.google.com:19302"},{urls:"stun:stun1.l.google.com:19302"}],V=3e5,N=64e3;class h extends Error{constructor(e){super(e),this.name="ConnectionError"}}class S extends Error{cause;constructor(e,t){super(e),this.name="NetworkError",this.cause=t}}const v={create:s=>new RTCPeerConnection(s)},L=fetch.bind(globalThis),C={setTimeout:(s,e)=>window.setTimeout(s,e),clearTimeout:s=>window.clearTimeout(s),setInterval:(s,e)=>window.setInterval(s,e),clearInterval:s=>window.clearInterval(s)},x=/([/+])([^/+?]+)$/,I="__PLAYBACK_ID__";class ${cache=new Map;maxSize;constructor(e=10){this.maxSize=e}get(e){const t=this.cache.get(e);return t&&(this.cache.delete(e),this.cache.set(e,t)),t}set(e,t){if(this.cache.has(e))this.cache.delete(e);else if(this.cache.size>=this.maxSize){const r=this.cache.keys().next().value;r&&this.cache.delete(r)}this.cache.set(e,t)}}const j=new $;function z(s){const e=s.split(`\r
-`),t=e.findIndex(l=>l.startsWith("m=video"));if(t===-1)return s;const r=/a=rtpmap:(\d+) H264(\/\d+)+/,i=e.find(l=>r.test(l));if(!i)return s;const n=r.exec(i)?.[1];if(!n)return s;const c=e[t];if(!c)return s;const o=c.split(" "),m=[...o.slice(0,3),n,...o.slice(3).filter(l=>l!==n)];return e[t]=m.join(" "),e.join(`\r
-`)}class K{url;iceServers;videoBitrate;audioBitrate;onStats;statsIntervalMs;onResponse;pcFactory;fetch;timers;redirectCache;skipIceGathering;maxFramerate;pc=null;resourceUrl=null;abortController=null;statsTimer=null;videoSender=null;audioSender=null;videoTransceiver=null;audioTransceiver=null;iceGatheringTimer=null;constructor(e){this.url=e.url,this.iceServers=e.iceServers??T,this.videoBitrate=e.videoBitrate??V,this.audioBitrate=e.audioBitrate??N,this.maxFramerate=e.maxFramerate,this.onStats=e.onStats,this.statsIntervalMs=e.statsIntervalMs??5e3,this.onResponse=e.onResponse,this.pcFactory=e.peerConnectionFactory??v,this.fetch=e.fetch??L,this.timers=e.timers??C,this.redirectCache=e.redirectCache??j,this.skipIceGathering=e.skipIceGathering??!0}async connect(e){this.cleanup(),this.pc=this.pcFactory.create({iceServers:this.iceServers,iceCandidatePoolSize:10}),this.videoTransceiver=this.pc.addTransceiver("video",{direction:"sendonly"}),this.audioTransceiver=this.pc.addTransceiver("audio",{direction:"sendonly"}),this.videoSender=this.videoTransceiver.sender,this.audioSender=this.audioTransceiver.sender;const t=e.getVideoTracks()[0],r=e.getAudioTracks()[0];t&&(t.contentHint===""&&(t.contentHint="motion"),await this.videoSender.replaceTrack(t)),r&&await this.audioSender.replaceTrack(r),this.setCodecPreferences(),await this.applyBitrateConstraints();const i=await this.pc.createOffer({offerToReceiveAudio:!1,offerToReceiveVideo:!1}),a=z(i.sdp??"");await this.pc.setLocalDescription({type:"offer",sdp:a}),this.skipIceGathering||await this.waitForIceGathering(),this.abortController=new AbortController;const n=this.timers.setTimeout(()=>this.abortController?.abort(),1e4);try{const c=this.getUrlWithCachedRedirect(),o=await this.fetch(c,{method:"POST",headers:{"Content-Type":"application/sdp"},body:this.pc.localDescription.sdp,signal:this.abortController.signal});if(this.timers.clearTimeout(n),!o.ok){const B=await o.text().catch(()=>"");throw new h(`WHIP connection failed: ${o.status} ${o.statusText} ${B}`)}this.cacheRedirectIfNeeded(c,o.url);const m=o.headers.get("location");m&&(this.resourceUrl=new URL(m,this.url).toString());const l=this.onResponse?.(o),F=await o.text();return await this.pc.setRemoteDescription({type:"answer",sdp:F}),await this.applyBitrateConstraints(),this.startStatsTimer(),{whepUrl:l?.whepUrl??null}}catch(c){throw this.timers.clearTimeout(n),c instanceof h?c:c instanceof Error&&c.name==="AbortError"?new S("Connection timeout"):new S("Failed to establish connection",c)}}setCodecPreferences(){if(this.videoTransceiver?.setCodecPreferences)try{const e=RTCRtpSender.getCapabilities("video");if(!e?.codecs?.length)return;const t=e.codecs.filter(r=>r.mimeType.toLowerCase().includes("h264"));t.length&&this.videoTransceiver.setCodecPreferences(t)}catch{}}async applyBitrateConstraints(){if(!this.pc)return;const e=this.pc.getSenders();for(const t of e){if(!t.track)continue;const r=t.getParameters();r.encodings||(r.encodings=[{}]);const i=r.encodings[0];if(i){t.track.kind==="video"?(i.maxBitrate=this.videoBitrate,this.maxFramerate&&this.maxFramerate>0&&(i.maxFramerate=this.maxFramerate),i.scaleResolutionDownBy=1,i.priority="high",i.networkPriority="high",r.degradationPreference="maintain-resolution"):t.track.kind==="audio"&&(i.maxBitrate=this.audioBitrate,i.priority="medium",i.networkPriority="medium");try{await t.setParameters(r)}catch{}}}}waitForIceGathering(){return new Promise(e=>{if(!this.pc){e();return}if(this.pc.iceGatheringState==="complete"){e();return}const t=()=>{this.pc?.iceGatheringState==="complete"&&(this.pc.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer!==null&&(this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null),e())};this.pc.addEventListener("icegatheringstatechange",t),this.iceGatheringTimer=this.timers.setTimeout(()=>{this.pc?.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer=null,e()},1e3)})}startStatsTimer(){!this.onStats||!this.pc||(this.stopStatsTimer(),this.statsTimer=this.timers.setInterval(async()=>{if(this.pc)try{const e=await this.pc.getStats();this.onStats?.(e)}catch{}},this.statsIntervalMs))}stopStatsTimer(){this.statsTimer!==null&&(this.timers.clearInterval(this.statsTimer),this.statsTimer=null)}async replaceTrack(e){if(!this.pc)throw new h("Not connected");const t=e.kind==="video"?this.videoSender:this.audioSender;if(!t)throw new h(`No sender found for track kind: ${e.kind}`);await t.replaceTrack(e),await this.applyBitrateConstraints()}setMaxFramerate(e){this.maxFramerate=e,this.applyBitrateConstraints()}cleanup(){if(this.stopStatsTimer(),this.iceGatheringTimer!==null&&(this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null),this.abortController){try{this.abortController.abort()}catch{}this.abortController=null}if(this.pc){try{this.pc.getTransceivers().forEach(e=>{try{e.stop()}catch{}})}catch{}try{this.pc.close()}catch{}this.pc=null}this.videoSender=null,this.audioSender=null,this.videoTransceiver=null,this.audioTransceiver=null}async disconnect(){if(this.resourceUrl)try{await this.fetch(this.resourceUrl,{method:"DELETE"})}catch{}this.cleanup(),this.resourceUrl=null}getPeerConnection(){return this.pc}restartIce(){if(this.pc)try{this.pc.restartIce()}catch{}}isConnected(){return this.pc!==null&&this.pc.connectionState==="connected"}getUrlWithCachedRedirect(){const r=new URL(this.url).pathname.match(x)?.[2],i=this.redirectCache.get(this.url);if(!i||!r)return this.url;const a=new URL(i);return a.pathname=i.pathname.replace(I,r),a.toString()}cacheRedirectIfNeeded(e,t){if(e!==t)try{const r=new URL(t),i=new URL(r);i.pathname=i.pathname.replace(x,`$1${I}`),this.redirectCache.set(this.url,i)}catch{}}}class Y{url;iceServers;onTrack;pcFactory;fetch;timers;skipIceGathering;maxRetries;retryDelayMs;pc=null;resourceUrl=null;abortController=null;iceGatheringTimer=null;retryCount=0;retryTimer=null;constructor(e){this.url=e.url,this.iceServers=e.iceServers??T,this.onTrack=e.onTrack,this.pcFactory=v,this.fetch=L,this.timers=C,this.skipIceGathering=e.skipIceGathering??!0,this.maxRetries=e.maxRetries??30,this.retryDelayMs=e.retryDelayMs??100}async connect(){this.cleanup(),this.pc=this.pcFactory.create({iceServers:this.iceServers,iceCandidatePoolSize:10}),this.onTrack&&(this.pc.ontrack=this.onTrack),this.pc.addTransceiver("video",{direction:"recvonly"}),this.pc.addTransceiver("audio",{direction:"recvonly"});const e=await this.pc.createOffer();await this.pc.setLocalDescription(e),this.skipIceGathering||await this.waitForIceGathering(),this.abortController=new AbortController;const t=this.timers.setTimeout(()=>this.abortController?.abort(),1e4);try{const r=await this.fetch(this.url,{method:"POST",headers:{"Content-Type":"application/sdp"},body:this.pc.localDescription.sdp,signal:this.abortController.signal});if(this.timers.clearTimeout(t),!r.ok){if(this.retryCount<this.maxRetries){this.retryCount++,this.scheduleRetry();return}throw new h(`WHEP connection failed: ${r.status} ${r.statusText}`)}const i=r.headers.get("location");i&&(this.resourceUrl=new URL(i,this.url).toString());const a=await r.text();await this.pc.setRemoteDescription({type:"answer",sdp:a}),this.retryCount=0}catch(r){if(this.timers.clearTimeout(t),this.retryCount<this.maxRetries){this.retryCount++,this.scheduleRetry();return}throw r instanceof h?r:r instanceof Error&&r.name==="AbortError"?new S("Connection timeout"):new S("Failed to establish WHEP connection",r)}}scheduleRetry(){this.retryTimer=this.timers.setTimeout(()=>{this.retryTimer=null,this.connect()},this.retryDelayMs)}waitForIceGathering(){return new Promise(e=>{if(!this.pc){e();return}if(this.pc.iceGatheringState==="complete"){e();return}const t=()=>{this.pc?.iceGatheringState==="complete"&&(this.pc.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer!==null&&(this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null),e())};this.pc.addEventListener("icegatheringstatechange",t),this.iceGatheringTimer=this.timers.setTimeout(()=>{this.pc?.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer=null,e()},1e3)})}cleanup(){if(this.retryTimer!==null&&(this.timers.clearTimeout(this.retryTimer),this.retryTimer=null),this.iceGatheringTimer!==null&&(this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null),this.abortController){try{this.abortController.abort()}catch{}this.abortController=null}if(this.pc){try{this.pc.getTransceivers().forEach(e=>{try{e.stop()}catch{}})}catch{}try{this.pc.close()}catch{}this.pc=null}}async disconnect(){if(this.resourceUrl)try{await this.fetch(this.resourceUrl,{method:"DELETE"})}catch{}this.cleanup(),this.resourceUrl=null,this.retryCount=0}getPeerConnection(){return this.pc}isConnected(){return this.pc!==null&&this.pc.connectionState==="connected"}}class q{canvas;video;onVideoStarted;log;frameRate;whipClient=null;whepClient=null;canvasStream=null;videoStarted=!1;pollTimer=null;constructor(e){this.canvas=e.inputCanvas,this.video=e.outputVideo,this.onVideoStarted=e.onVideoStarted,this.log=e.onLog??console.log,this.frameRate=e.frameRate??30,this.video.onplaying=()=>this.handleVideoPlaying()}warmup(){console.log("[Relay] Warming up WebRTC..."),this.canvasStream=this.canvas.captureStream(this.frameRate),console.log("[Relay] WebRTC warmed up")}async start(){this.pollForStatus()}pollForStatus(){(async()=>{try{const t=await fetch(window.location.origin+"/status");if(!t.ok){this.scheduleStatusPoll();return}const r=await t.json();r.state==="STREAMING"&&r.whip_url?(console.log("[Relay] Stream ready, starting WHIP"),await this.startWHIP()):this.scheduleStatusPoll()}catch{this.scheduleStatusPoll()}})()}scheduleStatusPoll(){this.pollTimer=C.setTimeout(()=>{this.pollTimer=null,this.pollForStatus()},100)}async startWHIP(){this.log("Connecting to server...");try{this.canvasStream||(this.canvasStream=this.canvas.captureStream(this.frameRate));const e=this.canvasStream.getVideoTracks()[0];if(!e)throw new Error("No video track from canvas");this.whipClient=new K({url:P,skipIceGathering:!0});const t=await this.setupWHIPWithPolling(e);t.oniceconnectionstatechange=()=>{console.log("[Relay] WHIP ICE:",t.iceConnectionState),t.iceConnectionState==="connected"?this.log("Connected, waiting for AI..."):t.iceConnectionState==="failed"&&this.log("Connection failed")},await this.startWHEP()}catch(e){console.error("[Relay] WHIP error:",e),this.log("Connection error")}}async setupWHIPWithPolling(e){const t=v.create({iceServers:T,iceCandidatePoolSize:10}),r=t.addTransceiver(e,{direction:"sendonly"});this.setH264Preference(r);const i=await t.createOffer();await t.setLocalDescription(i);const a=await fetch(P,{method:"POST",headers:{"Content-Type":"application/sdp"},body:t.localDescription.sdp});if(a.status===202){const{id:n}=await a.json();await this.pollWHIPResult(n,t)}else if(a.ok){const n=await a.text();console.log("[Relay] Got WHIP answer"),await t.setRemoteDescription({type:"answer",sdp:n})}else throw new Error("WHIP proxy error: "+a.status);return t}async pollWHIPResult(e,t){const r=async()=>{const i=await fetch(g+"/whip/result/"+e);if(i.status===202)return await new Promise(n=>setTimeout(n,100)),r();if(!i.ok)throw new Error("WHIP proxy error: "+i.status);const a=await i.text();console.log("[Relay] Got WHIP answer"),await t.setRemoteDescription({type:"answer",sdp:a})};await r()}setH264Preference(e){if(e.setCodecPreferences)try{const t=RTCRtpSender.getCapabilities("video");if(!t?.codecs?.length)return;const r=t.codecs.filter(i=>i.mimeType.toLowerCase().includes("h264"));r.length&&e.setCodecPreferences(r)}catch{}}async startWHEP(){this.log("Waiting for AI stream...");try{this.whepClient=new Y({url:b,skipIceGathering:!0,maxRetries:30,retryDelayMs:100,onTrack:e=>{console.log("[Relay] WHEP track:",e.track.kind),e.track.kind==="video"&&(this.video.srcObject=e.streams[0]||new MediaStream([e.track]),this.videoStarted||this.log("Starting stream..."))}}),await this.setupWHEPWithPolling()}catch(e){console.error("[Relay] WHEP error:",e)}}async setupWHEPWithPolling(){const e=v.create({iceServers:T,iceCandidatePoolSize:10});e.ontrack=n=>{console.log("[Relay] WHEP track:",n.track.kind),n.track.kind==="video"&&(this.video.srcObject=n.streams[0]||new MediaStream([n.track]),this.videoStarted||this.log("Starting stream..."))},e.addTransceiver("video",{direction:"recvonly"}),e.addTransceiver("audio",{direction:"recvonly"});const t=await e.createOffer();await e.setLocalDescription(t);let r=0;const i=30,a=async()=>{const n=await fetch(b,{method:"POST",headers:{"Content-Type":"application/sdp"},body:e.localDescription.sdp});if(n.status===202){const{id:o}=await n.json();await this.pollWHEPResult(o,e);return}if(!n.ok){if(r<i)return r++,await new Promise(o=>setTimeout(o,100)),a();throw new Error("WHEP failed after retries")}const c=await n.text();await e.setRemoteDescription({type:"answer",sdp:c})};await a()}async pollWHEPResult(e,t){let r=0;const i=30,a=async()=>{const n=await fetch(g+"/whep/result/"+e);if(n.status===202)return await new Promise(o=>setTimeout(o,0)),a();if(!n.ok)return r<i?(r++,await new Promise(o=>setTimeout(o,100)),this.setupWHEPWithPolling()):void 0;const c=await n.text();await t.setRemoteDescription({type:"answer",sdp:c})};await a()}handleVideoPlaying(){this.videoStarted||(this.videoStarted=!0,console.log("[Relay] Video playing"),this.onVideoStarted?.())}async stop(){this.pollTimer!==null&&(C.clearTimeout(this.pollTimer),this.pollTimer=null),this.whipClient&&(await this.whipClient.disconnect(),this.whipClient=null),this.whepClient&&(await this.whepClient.disconnect(),this.whepClient=null),this.canvasStream&&(this.canvasStream.getTracks().forEach(e=>e.stop()),this.canvasStream=null),this.videoStarted=!1}}const X=`
+    <script type="module" crossorigin>var S,W,F,T=null,te=0,G=null,V=null,f=0,E=0,N=0,j=0;function re(e){if(S=e,F=!!S.getContext("bitmaprenderer"),W=F?S.getContext("bitmaprenderer"):S.getContext("2d"),!F){let t=W;t.fillStyle="#000",t.fillRect(0,0,512,512)}}function ie(e){if(T)E++;T=e,te=performance.now(),ae()}function q(e){V=e}function ne(){if(f===0&&E===0)return null;let e={frames:f,dropped:E,decodeMs:f?N/f:0,lagMs:f?j/f:0};return f=0,E=0,N=0,j=0,e}function je(e){if(e.byteLength<16)return null;let t=new DataView(e);if(t.getUint32(0)!==1145328465)return null;return{seq:t.getUint32(4,!0),capturedMs:t.getFloat64(8,!0)}}function qe(e,t){let r=new DataView(e,t);if(r.byteLength<8||r.getUint32(0)!==1145328198)return new Blob([new Uint8Array(e,t)],{type:"image/jpeg"});let i=r.getUint16(4,!0),n=r.getUint16(6,!0),s=i*n*4;if(!i||!n||r.byteLength<8+s)return null;let a=new Uint8ClampedArray(e,t+8,s);return new ImageData(a,i,n)}function ae(){if(!T||G)return;let e=T,t=te;T=null;let r=performance.now(),i=je(e),n=V&&V(i)||qe(e,i?16:0);if(!n){E++;return}G=createImageBitmap(n,{resizeWidth:S.width,resizeHeight:S.height,resizeQuality:"low"}).then((s)=>{if(F)W.transferFromImageBitmap(s);else W.drawImage(s,0,0,512,512),s.close();let a=performance.now();f++,N+=a-r,j+=a-t}).catch(()=>{}).finally(()=>{if(G=null,T)ae()})}var x=window.location.origin,se=x.replace("http","ws")+"/ws",L=x+"/whip",D=x+"/whep",oe=Number("{{FRAME_RATE}}")||30,le=["raw_frames","frame_stamps","stream_swap"];var ze=500,h=null,I=null,H=new Map,ce=new Map;function U(){return h!==null&&h.readyState===WebSocket.OPEN}function u(e){if(h&&h.readyState===WebSocket.OPEN)h.send(JSON.stringify(e))}function de(e,t){H.set(e,t)}function pe(e){H.delete(e)}function B(e,t){ce.set(e,t)}function Ye(e){let t;try{t=JSON.parse(e)}catch{return}if(t.type==="sdp_result"&&t.id){let i=H.get(t.id);if(i)H.delete(t.id),i(t);return}let r=t.type?ce.get(t.type):void 0;if(r)r(t)}function Ke(){let e=ne();if(!e)return;u({type:"decode_stats",frames:e.frames,dropped:e.dropped,decode_ms:Math.round(e.decodeMs*100)/100,lag_ms:Math.round(e.lagMs*100)/100})}function z(){h=new WebSocket(se),h.binaryType="arraybuffer",h.onopen=()=>{if(console.log("[Relay] WebSocket connected"),u({type:"hello",features:le}),I===null)I=window.setInterval(Ke,ze)},h.onmessage=(e)=>{if(e.data instanceof ArrayBuffer)ie(e.data);else if(typeof e.data==="string")Ye(e.data)},h.onclose=()=>{if(console.log("[Relay] WebSocket closed, reconnecting..."),I!==null)window.clearInterval(I),I=null;setTimeout(z,1000)}}var ue=512,g=16,$e=1000,Qe=5000,Xe=64,_,k=null,ve=null,ye=null,Y=!1,ge=3000,C="idle",R=null,he=0,c=null,K=!1;function me(e){let t=new ImageData(ue,ue);return new Uint32Array(t.data.buffer).fill(4278190080|e<<16|e<<8|e),t}function Je(){if(!k||_.readyState<HTMLMediaElement.HAVE_CURRENT_DATA)return null;k.drawImage(_,0,0,g,g);let e=k.getImageData(0,0,g,g).data,t=0;for(let r=0;r<e.length;r+=4)t+=0.299*e[r]+0.587*e[r+1]+0.114*e[r+2];return t/(g*g)}function we(){if(K)return;if(K=!0,"requestVideoFrameCallback"in _)_.requestVideoFrameCallback(fe);else requestAnimationFrame(fe)}function fe(){if(K=!1,C==="idle")return;let e=Je();if(e!==null){if(C==="dark")he=e;else if(c&&e>=he+Xe){u({type:"latency_marker",seq:c.seq,captured_ms:c.capturedMs,relay_ms:Math.round((performance.now()-c.drawnAt)*10)/10}),Te();return}}we()}function Q(e,t,r){if(C=e,R!==null)window.clearTimeout(R);R=window.setTimeout(r,t)}function Se(){if(!Y)return;c=null,Q("dark",$e,()=>Q("marker",Qe,Ze)),we()}function Ze(){if(c)u({type:"latency_marker",seq:c.seq,captured_ms:c.capturedMs,timeout:!0});Te()}function Te(){c=null,Q("idle",ge,Se)}function et(e){if(C==="dark")return ve;if(C!=="marker"||!e)return null;if(!c)c={seq:e.seq,capturedMs:e.capturedMs,drawnAt:performance.now()};return ye}function Re(e){_=e}function Ce(e,t){if(t&&t>0)ge=t;if(e===Y)return;if(Y=e,!e){if(R!==null)window.clearTimeout(R);R=null,C="idle",c=null,q(null),console.log("[Relay] Latency calibration stopped");return}if(!k){let r=document.createElement("canvas");r.width=r.height=g,k=r.getContext("2d",{willReadFrequently:!0}),ve=me(0),ye=me(255)}q(et),console.log("[Relay] Latency calibration started"),Se()}var M=[{urls:"stun:stun.l.google.com:19302"},{urls:"stun:stun1.l.google.com:19302"}],be=300000,Pe=64000;class v extends Error{constructor(e){super(e);this.name="ConnectionError"}}class b extends Error{cause;constructor(e,t){super(e);this.name="NetworkError",this.cause=t}}function y(e,t=1){let r=10**t;return Math.round(e*r)/r}function d(e,t,r){if(!e||!t)return null;let i=e[r],n=t[r];if(typeof i!=="number"||typeof n!=="number"||i<n)return null;return i-n}function X(e){return typeof e==="number"?y(e*1000):null}function J(e,t){let r=null,i=null;for(let a of e.values())if(a.type===t&&a.kind==="video")r=a;else if(a.type==="candidate-pair"&&a.state==="succeeded"&&(a.nominated||!i))i=a;let n=r?.remoteId,s=n?e.get(n)??null:null;return{at:performance.now(),rtp:r,remote:s,pair:i}}function Ee(e,t,r,i){let n=t?(e.at-t.at)/1000:0,s=t?d(e.rtp,t.rtp,r):null,a=t?d(e.rtp,t.rtp,i):null;return{seconds:n,frames:a,summary:{fps:a!==null&&n>0?y(a/n):e.rtp?.framesPerSecond??null,bitrate_kbps:s!==null&&n>0?y(s*8/n/1000):null,rtt_ms:X(e.pair?.currentRoundTripTime)}}}function xe(e,t){if(e===null||t===null||e+t===0)return null;return y(e/(e+t)*100,2)}function Ie(e,t){let{frames:r,summary:i}=Ee(e,t,"bytesSent","framesEncoded"),n=t?d(e.rtp,t.rtp,"totalEncodeTime"):null,s=t?d(e.remote,t.remote,"packetsLost"):null,a=t?d(e.rtp,t.rtp,"packetsSent"):null;return{...i,encode_ms:n!==null&&r?y(n/r*1000,2):null,jitter_ms:X(e.remote?.jitter),loss_pct:s!==null&&a!==null?xe(s,a-s):null,available_kbps:typeof e.pair?.availableOutgoingBitrate==="number"?y(e.pair.availableOutgoingBitrate/1000):null,quality_limit:e.rtp?.qualityLimitationReason??null}}function ke(e,t){let{frames:r,summary:i}=Ee(e,t,"bytesReceived","framesDecoded"),n=t?d(e.rtp,t.rtp,"totalDecodeTime"):null,s=t?d(e.rtp,t.rtp,"jitterBufferDelay"):null,a=t?d(e.rtp,t.rtp,"jitterBufferEmittedCount"):null;return{...i,decode_ms:n!==null&&r?y(n/r*1000,2):null,jitter_ms:X(e.rtp?.jitter),jitter_buffer_ms:s!==null&&a?y(s/a*1000):null,loss_pct:xe(t?d(e.rtp,t.rtp,"packetsLost"):null,t?d(e.rtp,t.rtp,"packetsReceived"):null),frames_dropped:t?d(e.rtp,t.rtp,"framesDropped"):null,freezes:t?d(e.rtp,t.rtp,"freezeCount"):null}}var A={create:(e)=>new RTCPeerConnection(e)},Z=fetch.bind(globalThis),w={setTimeout:(e,t)=>window.setTimeout(e,t),clearTimeout:(e)=>window.clearTimeout(e),setInterval:(e,t)=>window.setInterval(e,t),clearInterval:(e)=>window.clearInterval(e)};var tt=100,rt=1000,_e=30,Me="?slot=next",it=30000,nt=1000,Ae=/([/+])([^/+?]+)$/,Fe="__PLAYBACK_ID__";class We{cache=new Map;maxSize;constructor(e=10){this.maxSize=e}get(e){let t=this.cache.get(e);if(t)this.cache.delete(e),this.cache.set(e,t);return t}set(e,t){if(this.cache.has(e))this.cache.delete(e);else if(this.cache.size>=this.maxSize){let r=this.cache.keys().next().value;if(r)this.cache.delete(r)}this.cache.set(e,t)}}var at=new We;function st(e){let t=e.split(`\\r
+`),r=t.findIndex((p)=>p.startsWith("m=video"));if(r===-1)return e;let i=/a=rtpmap:(\\d+) H264(\\/\\d+)+/,n=t.find((p)=>i.test(p));if(!n)return e;let a=i.exec(n)?.[1];if(!a)return e;let o=t[r];if(!o)return e;let l=o.split(" "),m=[...l.slice(0,3),a,...l.slice(3).filter((p)=>p!==a)];return t[r]=m.join(" "),t.join(`\\r
+`)}class Le{url;iceServers;videoBitrate;audioBitrate;onStats;statsIntervalMs;onResponse;pcFactory;fetch;timers;redirectCache;skipIceGathering;maxFramerate;pc=null;resourceUrl=null;abortController=null;statsTimer=null;videoSender=null;audioSender=null;videoTransceiver=null;audioTransceiver=null;iceGatheringTimer=null;constructor(e){this.url=e.url,this.iceServers=e.iceServers??M,this.videoBitrate=e.videoBitrate??be,this.audioBitrate=e.audioBitrate??Pe,this.maxFramerate=e.maxFramerate,this.onStats=e.onStats,this.statsIntervalMs=e.statsIntervalMs??5000,this.onResponse=e.onResponse,this.pcFactory=e.peerConnectionFactory??A,this.fetch=e.fetch??Z,this.timers=e.timers??w,this.redirectCache=e.redirectCache??at,this.skipIceGathering=e.skipIceGathering??!0}async connect(e){this.cleanup(),this.pc=this.pcFactory.create({iceServers:this.iceServers,iceCandidatePoolSize:10}),this.videoTransceiver=this.pc.addTransceiver("video",{direction:"sendonly"}),this.audioTransceiver=this.pc.addTransceiver("audio",{direction:"sendonly"}),this.videoSender=this.videoTransceiver.sender,this.audioSender=this.audioTransceiver.sender;let t=e.getVideoTracks()[0],r=e.getAudioTracks()[0];if(t){if(t.contentHint==="")t.contentHint="motion";await this.videoSender.replaceTrack(t)}if(r)await this.audioSender.replaceTrack(r);this.setCodecPreferences(),await this.applyBitrateConstraints();let i=await this.pc.createOffer({offerToReceiveAudio:!1,offerToReceiveVideo:!1}),n=st(i.sdp??"");if(await this.pc.setLocalDescription({type:"offer",sdp:n}),!this.skipIceGathering)await this.waitForIceGathering();this.abortController=new AbortController;let s=this.timers.setTimeout(()=>this.abortController?.abort(),1e4);try{let a=this.getUrlWithCachedRedirect(),o=await this.fetch(a,{method:"POST",headers:{"Content-Type":"application/sdp"},body:this.pc.localDescription.sdp,signal:this.abortController.signal});if(this.timers.clearTimeout(s),!o.ok){let Ne=await o.text().catch(()=>"");throw new v(`WHIP connection failed: ${o.status} ${o.statusText} ${Ne}`)}this.cacheRedirectIfNeeded(a,o.url);let l=o.headers.get("location");if(l)this.resourceUrl=new URL(l,this.url).toString();let m=this.onResponse?.(o),p=await o.text();return await this.pc.setRemoteDescription({type:"answer",sdp:p}),await this.applyBitrateConstraints(),this.startStatsTimer(),{whepUrl:m?.whepUrl??null}}catch(a){if(this.timers.clearTimeout(s),a instanceof v)throw a;if(a instanceof Error&&a.name==="AbortError")throw new b("Connection timeout");throw new b("Failed to establish connection",a)}}setCodecPreferences(){if(!this.videoTransceiver?.setCodecPreferences)return;try{let e=RTCRtpSender.getCapabilities("video");if(!e?.codecs?.length)return;let t=e.codecs.filter((r)=>r.mimeType.toLowerCase().includes("h264"));if(t.length)this.videoTransceiver.setCodecPreferences(t)}catch{}}async applyBitrateConstraints(){if(!this.pc)return;let e=this.pc.getSenders();for(let t of e){if(!t.track)continue;let r=t.getParameters();if(!r.encodings)r.encodings=[{}];let i=r.encodings[0];if(!i)continue;if(t.track.kind==="video"){if(i.maxBitrate=this.videoBitrate,this.maxFramerate&&this.maxFramerate>0)i.maxFramerate=this.maxFramerate;i.scaleResolutionDownBy=1,i.priority="high",i.networkPriority="high",r.degradationPreference="maintain-resolution"}else if(t.track.kind==="audio")i.maxBitrate=this.audioBitrate,i.priority="medium",i.networkPriority="medium";try{await t.setParameters(r)}catch{}}}waitForIceGathering(){return new Promise((e)=>{if(!this.pc){e();return}if(this.pc.iceGatheringState==="complete"){e();return}let t=()=>{if(this.pc?.iceGatheringState==="complete"){if(this.pc.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer!==null)this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null;e()}};this.pc.addEventListener("icegatheringstatechange",t),this.iceGatheringTimer=this.timers.setTimeout(()=>{this.pc?.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer=null,e()},1000)})}startStatsTimer(){if(!this.onStats||!this.pc)return;this.stopStatsTimer(),this.statsTimer=this.timers.setInterval(async()=>{if(!this.pc)return;try{let e=await this.pc.getStats();this.onStats?.(e)}catch{}},this.statsIntervalMs)}stopStatsTimer(){if(this.statsTimer!==null)this.timers.clearInterval(this.statsTimer),this.statsTimer=null}async replaceTrack(e){if(!this.pc)throw new v("Not connected");let t=e.kind==="video"?this.videoSender:this.audioSender;if(!t)throw new v(`No sender found for track kind: ${e.kind}`);await t.replaceTrack(e),await this.applyBitrateConstraints()}setMaxFramerate(e){this.maxFramerate=e,this.applyBitrateConstraints()}cleanup(){if(this.stopStatsTimer(),this.iceGatheringTimer!==null)this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null;if(this.abortController){try{this.abortController.abort()}catch{}this.abortController=null}if(this.pc){try{this.pc.getTransceivers().forEach((e)=>{try{e.stop()}catch{}})}catch{}try{this.pc.close()}catch{}this.pc=null}this.videoSender=null,this.audioSender=null,this.videoTransceiver=null,this.audioTransceiver=null}async disconnect(){if(this.resourceUrl)try{await this.fetch(this.resourceUrl,{method:"DELETE"})}catch{}this.cleanup(),this.resourceUrl=null}getPeerConnection(){return this.pc}restartIce(){if(this.pc)try{this.pc.restartIce()}catch{}}isConnected(){return this.pc!==null&&this.pc.connectionState==="connected"}getUrlWithCachedRedirect(){let r=new URL(this.url).pathname.match(Ae)?.[2],i=this.redirectCache.get(this.url);if(!i||!r)return this.url;let n=new URL(i);return n.pathname=i.pathname.replace(Fe,r),n.toString()}cacheRedirectIfNeeded(e,t){if(e===t)return;try{let r=new URL(t),i=new URL(r);i.pathname=i.pathname.replace(Ae,`$1${Fe}`),this.redirectCache.set(this.url,i)}catch{}}}class De{url;iceServers;onTrack;pcFactory;fetch;timers;skipIceGathering;maxRetries;retryDelayMs;pc=null;resourceUrl=null;abortController=null;iceGatheringTimer=null;retryCount=0;retryTimer=null;constructor(e){this.url=e.url,this.iceServers=e.iceServers??M,this.onTrack=e.onTrack,this.pcFactory=A,this.fetch=Z,this.timers=w,this.skipIceGathering=e.skipIceGathering??!0,this.maxRetries=e.maxRetries??30,this.retryDelayMs=e.retryDelayMs??100}async connect(){if(this.cleanup(),this.pc=this.pcFactory.create({iceServers:this.iceServers,iceCandidatePoolSize:10}),this.onTrack)this.pc.ontrack=this.onTrack;this.pc.addTransceiver("video",{direction:"recvonly"}),this.pc.addTransceiver("audio",{direction:"recvonly"});let e=await this.pc.createOffer();if(await this.pc.setLocalDescription(e),!this.skipIceGathering)await this.waitForIceGathering();this.abortController=new AbortController;let t=this.timers.setTimeout(()=>this.abortController?.abort(),1e4);try{let r=await this.fetch(this.url,{method:"POST",headers:{"Content-Type":"application/sdp"},body:this.pc.localDescription.sdp,signal:this.abortController.signal});if(this.timers.clearTimeout(t),!r.ok){if(this.retryCount<this.maxRetries){this.retryCount++,this.scheduleRetry();return}throw new v(`WHEP connection failed: ${r.status} ${r.statusText}`)}let i=r.headers.get("location");if(i)this.resourceUrl=new URL(i,this.url).toString();let n=await r.text();await this.pc.setRemoteDescription({type:"answer",sdp:n}),this.retryCount=0}catch(r){if(this.timers.clearTimeout(t),this.retryCount<this.maxRetries){this.retryCount++,this.scheduleRetry();return}if(r instanceof v)throw r;if(r instanceof Error&&r.name==="AbortError")throw new b("Connection timeout");throw new b("Failed to establish WHEP connection",r)}}scheduleRetry(){this.retryTimer=this.timers.setTimeout(()=>{this.retryTimer=null,this.connect()},this.retryDelayMs)}waitForIceGathering(){return new Promise((e)=>{if(!this.pc){e();return}if(this.pc.iceGatheringState==="complete"){e();return}let t=()=>{if(this.pc?.iceGatheringState==="complete"){if(this.pc.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer!==null)this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null;e()}};this.pc.addEventListener("icegatheringstatechange",t),this.iceGatheringTimer=this.timers.setTimeout(()=>{this.pc?.removeEventListener("icegatheringstatechange",t),this.iceGatheringTimer=null,e()},1000)})}cleanup(){if(this.retryTimer!==null)this.timers.clearTimeout(this.retryTimer),this.retryTimer=null;if(this.iceGatheringTimer!==null)this.timers.clearTimeout(this.iceGatheringTimer),this.iceGatheringTimer=null;if(this.abortController){try{this.abortController.abort()}catch{}this.abortController=null}if(this.pc){try{this.pc.getTransceivers().forEach((e)=>{try{e.stop()}catch{}})}catch{}try{this.pc.close()}catch{}this.pc=null}}async disconnect(){if(this.resourceUrl)try{await this.fetch(this.resourceUrl,{method:"DELETE"})}catch{}this.cleanup(),this.resourceUrl=null,this.retryCount=0}getPeerConnection(){return this.pc}isConnected(){return this.pc!==null&&this.pc.connectionState==="connected"}}function ot(e,t){return new Promise((r,i)=>{let n=setTimeout(()=>{e.removeEventListener("playing",s),i(Error("Timed out waiting for swap video"))},t),s=()=>{clearTimeout(n),r()};e.addEventListener("playing",s,{once:!0})})}class ee{canvas;video;onVideoStarted;log;frameRate;whipClient=null;whepClient=null;canvasStream=null;videoStarted=!1;pollTimer=null;whipPc=null;whepPc=null;swapId=null;statsTimer=null;whipSample=null;whepSample=null;constructor(e){this.canvas=e.inputCanvas,this.video=e.outputVideo,this.onVideoStarted=e.onVideoStarted,this.log=e.onLog??console.log,this.frameRate=e.frameRate??30,this.video.onplaying=()=>this.handleVideoPlaying()}warmup(){console.log("[Relay] Warming up WebRTC..."),this.canvasStream=this.canvas.captureStream(this.frameRate),console.log("[Relay] WebRTC warmed up")}async start(){this.pollForStatus()}pollForStatus(){(async()=>{try{let t=await fetch(window.location.origin+"/status");if(!t.ok){this.scheduleStatusPoll();return}let r=await t.json();if(r.state==="STREAMING"&&r.whip_url)console.log("[Relay] Stream ready, starting WHIP"),await this.startWHIP();else this.scheduleStatusPoll()}catch{this.scheduleStatusPoll()}})()}scheduleStatusPoll(){this.pollTimer=w.setTimeout(()=>{this.pollTimer=null,this.pollForStatus()},100)}async startWHIP(){this.log("Connecting to server...");try{if(!this.canvasStream)this.canvasStream=this.canvas.captureStream(this.frameRate);let e=this.canvasStream.getVideoTracks()[0];if(!e)throw Error("No video track from canvas");this.whipClient=new Le({url:L,skipIceGathering:!0});let t=await this.setupWHIPWithPolling(e);this.whipPc=t,t.oniceconnectionstatechange=()=>{if(console.log("[Relay] WHIP ICE:",t.iceConnectionState),t.iceConnectionState==="connected")this.log("Connected, waiting for AI...");else if(t.iceConnectionState==="failed")this.log("Connection failed")},await this.startWHEP(),this.startStatsReporting()}catch(e){console.error("[Relay] WHIP error:",e),this.log("Connection error")}}async setupWHIPWithPolling(e,t=L){let r=A.create({iceServers:M,iceCandidatePoolSize:10}),i=r.addTransceiver(e,{direction:"sendonly"});this.setH264Preference(i);let n=await r.createOffer();await r.setLocalDescription(n);let s=performance.now(),a=await fetch(t,{method:"POST",headers:{"Content-Type":"application/sdp"},body:r.localDescription.sdp});if(a.status===202){let{id:o}=await a.json();await this.pollWHIPResult(o,r,s)}else if(a.ok){let o=await a.text();console.log("[Relay] Got WHIP answer"),await r.setRemoteDescription({type:"answer",sdp:o})}else throw Error("WHIP proxy error: "+a.status);return r}async pollWHIPResult(e,t,r){let i=await this.awaitSdpResult("whip",e,r);if(!i.ok)throw Error("WHIP proxy error: "+i.status);console.log("[Relay] Got WHIP answer"),await t.setRemoteDescription({type:"answer",sdp:i.sdp})}awaitSdpResult(e,t,r){return new Promise((i)=>{let n=!1,s=(l,m)=>{if(n)return;n=!0,pe(t),u({type:"sdp_timing",kind:e,mode:m,setup_ms:Math.round((performance.now()-r)*100)/100}),i(l)},a=()=>{let l=U()?rt:tt;setTimeout(()=>void o(),l)},o=async()=>{if(n)return;try{let l=await fetch(`${x}/${e}/result/${t}`);if(n)return;if(l.status===202)a();else if(!l.ok)s({ok:!1,status:l.status},"poll");else s({ok:!0,sdp:await l.text()},"poll")}catch{a()}};if(de(t,(l)=>{if(l.status==="ready"&&l.sdp)s({ok:!0,sdp:l.sdp},"push");else s({ok:!1,status:500},"push")}),U())a();else o()})}setH264Preference(e){if(!e.setCodecPreferences)return;try{let t=RTCRtpSender.getCapabilities("video");if(!t?.codecs?.length)return;let r=t.codecs.filter((i)=>i.mimeType.toLowerCase().includes("h264"));if(r.length)e.setCodecPreferences(r)}catch{}}async startWHEP(){this.log("Waiting for AI stream...");try{this.whepClient=new De({url:D,skipIceGathering:!0,maxRetries:30,retryDelayMs:100,onTrack:(e)=>{if(console.log("[Relay] WHEP track:",e.track.kind),e.track.kind==="video"){if(this.video.srcObject=e.streams[0]||new MediaStream([e.track]),!this.videoStarted)this.log("Starting stream...")}}}),this.whepPc=await this.setupWHEPWithPolling()}catch(e){console.error("[Relay] WHEP error:",e)}}async setupWHEPWithPolling(e=D,t=this.video,r=0){let i=A.create({iceServers:M,iceCandidatePoolSize:10});i.ontrack=(o)=>{if(console.log("[Relay] WHEP track:",o.track.kind),o.track.kind==="video"){if(t.srcObject=o.streams[0]||new MediaStream([o.track]),!this.videoStarted)this.log("Starting stream...")}},i.addTransceiver("video",{direction:"recvonly"}),i.addTransceiver("audio",{direction:"recvonly"});let n=await i.createOffer();await i.setLocalDescription(n);let s=0,a=async()=>{let o=performance.now(),l=await fetch(e,{method:"POST",headers:{"Content-Type":"application/sdp"},body:i.localDescription.sdp});if(l.status===202){let{id:p}=await l.json();return this.pollWHEPResult(p,i,o,e,t,r)}if(!l.ok){if(s<_e)return s++,await new Promise((p)=>setTimeout(p,100)),a();throw i.close(),Error("WHEP failed after retries")}let m=await l.text();return await i.setRemoteDescription({type:"answer",sdp:m}),i};return a()}async pollWHEPResult(e,t,r,i,n,s){let a=await this.awaitSdpResult("whep",e,r);if(!a.ok){if(t.close(),s<_e)return await new Promise((o)=>setTimeout(o,100)),this.setupWHEPWithPolling(i,n,s+1);return null}return await t.setRemoteDescription({type:"answer",sdp:a.sdp}),t}async prepareSwap(e){let t=this.canvasStream?.getVideoTracks()[0];if(!t||!this.whipPc){u({type:"swap_failed",id:e,error:"Relay not streaming"});return}this.swapId=e,console.log("[Relay] Preparing stream swap",e);let r=this.video.cloneNode();r.removeAttribute("id"),r.style.position="absolute",r.style.inset="0",r.style.visibility="hidden",this.video.after(r);let i=null,n=null;try{i=await this.setupWHIPWithPolling(t,L+Me);let s=performance.now();if(n=await this.setupWHEPWithPolling(D+Me,r),!n)throw Error("WHEP failed for swap stream");if(await ot(r,it),this.swapId!==e)throw Error("Swap superseded");let a=this.video,o=this.whipPc,l=this.whepPc;r.style.visibility="visible",a.remove(),r.id="output-video",r.onplaying=()=>this.handleVideoPlaying(),this.video=r,this.whipPc=i,this.whepPc=n,this.whipSample=null,this.whepSample=null,o?.close(),l?.close();let m=performance.now()-s;console.log("[Relay] Stream swap complete",e),u({type:"swap_complete",id:e,overlap_ms:Math.round(m*100)/100})}catch(s){console.error("[Relay] Swap error:",s),i?.close(),n?.close(),r.remove(),u({type:"swap_failed",id:e,error:String(s)})}finally{if(this.swapId===e)this.swapId=null}}cancelSwap(){this.swapId=null}startStatsReporting(){if(this.statsTimer!==null)return;this.statsTimer=w.setInterval(()=>void this.reportStats(),nt)}stopStatsReporting(){if(this.statsTimer!==null)w.clearInterval(this.statsTimer),this.statsTimer=null;this.whipSample=null,this.whepSample=null}async reportStats(){if(!U())return;let e=this.whipPc,t=this.whepPc;try{let[r,i]=await Promise.all([e?.getStats()??null,t?.getStats()??null]),n={type:"webrtc_stats"};if(r&&e===this.whipPc){let s=J(r,"outbound-rtp");n.whip=Ie(s,this.whipSample),this.whipSample=s}if(i&&t===this.whepPc){let s=J(i,"inbound-rtp");n.whep=ke(s,this.whepSample),this.whepSample=s}if(n.whip||n.whep)u(n)}catch{}}handleVideoPlaying(){if(!this.videoStarted)this.videoStarted=!0,console.log("[Relay] Video playing"),this.onVideoStarted?.()}async stop(){if(this.pollTimer!==null)w.clearTimeout(this.pollTimer),this.pollTimer=null;if(this.whipClient)await this.whipClient.disconnect(),this.whipClient=null;if(this.whepClient)await this.whepClient.disconnect(),this.whepClient=null;if(this.whipPc?.close(),this.whipPc=null,this.whepPc?.close(),this.whepPc=null,this.swapId=null,this.stopStatsReporting(),this.canvasStream)this.canvasStream.getTracks().forEach((e)=>e.stop()),this.canvasStream=null;this.videoStarted=!1}}var P=null;function He(e){let t=e.transferControlToOffscreen(),r=new Blob([`
 let canvas, ctx;
 let t = Math.random() * 100;
 let running = true;
@@ -1619,7 +4962,7 @@ self.onmessage = (e) => {
         running = false;
     }
 };
-`;let d=null;function J(s){const e=s.transferControlToOffscreen(),t=new Blob([X],{type:"application/javascript"});d=new Worker(URL.createObjectURL(t)),d.postMessage({type:"init",canvas:e},[e]),console.log("[Relay] Aurora worker started")}function Q(){d&&(d.postMessage({type:"stop"}),d.terminate(),d=null)}const G=document.getElementById("input-canvas"),Z=document.getElementById("output-video"),D=document.getElementById("aurora"),ee=document.getElementById("status"),te=document.getElementById("status-text");function H(s){console.log("[Relay]",s),te.textContent=s}function ie(){D.classList.add("hidden"),ee.classList.add("hidden"),setTimeout(Q,300)}const E=new q({inputCanvas:G,outputVideo:Z,onVideoStarted:ie,onLog:H,frameRate:30});function re(){H("Starting..."),U(G),J(D),W(),setTimeout(()=>E.warmup(),100),E.start()}re();</script>
+`],{type:"application/javascript"});P=new Worker(URL.createObjectURL(r)),P.postMessage({type:"init",canvas:t},[t]),console.log("[Relay] Aurora worker started")}function Ue(){if(P)P.postMessage({type:"stop"}),P.terminate(),P=null}var Be=document.getElementById("input-canvas"),Oe=document.getElementById("output-video"),Ge=document.getElementById("aurora"),lt=document.getElementById("status"),ct=document.getElementById("status-text");function Ve(e){console.log("[Relay]",e),ct.textContent=e}function dt(){Ge.classList.add("hidden"),lt.classList.add("hidden"),setTimeout(Ue,300)}var O=new ee({inputCanvas:Be,outputVideo:Oe,onVideoStarted:dt,onLog:Ve,frameRate:oe});function pt(){Ve("Starting..."),re(Be),Re(Oe),He(Ge),B("swap_prepare",(e)=>O.prepareSwap(e.id)),B("swap_cancel",()=>O.cancelSwap()),B("latency_calibration",(e)=>Ce(!!e.enabled,e.interval_ms)),z(),setTimeout(()=>O.warmup(),100),O.start()}pt();</script>
   </head>
   <body>
     <video id="output-video" autoplay playsinline muted></video>
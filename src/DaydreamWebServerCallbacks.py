@@ -1,19 +1,10 @@
 def onHTTPRequest(webServerDAT, request, response):
-	print(f"Daydream WebServer: {webServerDAT.name} received request: {request.get('uri', '/')}")
 	ext = getattr(webServerDAT.parent().ext, 'Daydream', None)
 	if not ext:
 		ext = getattr(webServerDAT.parent().ext, 'DaydreamExt', None)
 	
 	if ext:
-		name = webServerDAT.name.lower()
-		if 'auth' in name:
-			server_type = 'auth'
-		elif 'sdp' in name:
-			server_type = 'sdp'
-		else:
-			server_type = 'frame'
-		print(f"Daydream WebServer: routing to {server_type}")
-		ext.OnHTTPRequest(request, response, server_type)
+		ext.OnHTTPRequest(request, response)
 	else:
 		print("Daydream WebServer: Extension not found!")
 		response['statusCode'] = 500
@@ -44,7 +44,7 @@ def inject_html(html_content):
         print(f'  Expected: {BEGIN_MARKER} and {END_MARKER}')
         sys.exit(1)
 
-    escaped = html_content.replace("'''", r"\'\'\'")
+    escaped = html_content.replace('\\', '\\\\').replace("'''", r"\'\'\'")
     new_section = f"{BEGIN_MARKER}\nRELAY_HTML_TEMPLATE = '''{escaped}'''\n{END_MARKER}"
 
     new_content = ext_content[:begin_idx] + new_section + ext_content[end_idx + len(END_MARKER):]
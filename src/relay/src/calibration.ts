@@ -0,0 +1,158 @@
+import { type FrameStamp, setFrameOverride } from "./decoder";
+import { sendMessage } from "./websocket";
+
+const CANVAS_SIZE = 512;
+const SAMPLE_SIZE = 16;
+const DARK_MS = 1000;
+const MARKER_TIMEOUT_MS = 5000;
+const MARKER_DELTA = 64;
+
+type Phase = "idle" | "dark" | "marker";
+
+interface Marker {
+  seq: number;
+  capturedMs: number;
+  drawnAt: number;
+}
+
+let video: HTMLVideoElement;
+let sampleCtx: CanvasRenderingContext2D | null = null;
+let darkFrame: ImageData | null = null;
+let markerFrame: ImageData | null = null;
+
+let enabled = false;
+let intervalMs = 3000;
+let phase: Phase = "idle";
+let phaseTimer: number | null = null;
+let baseline = 0;
+let marker: Marker | null = null;
+let sampling = false;
+
+function solidFrame(value: number): ImageData {
+  const frame = new ImageData(CANVAS_SIZE, CANVAS_SIZE);
+  const pixels = new Uint32Array(frame.data.buffer);
+  pixels.fill(0xff000000 | (value << 16) | (value << 8) | value);
+  return frame;
+}
+
+function sampleLuma(): number | null {
+  if (!sampleCtx || video.readyState < HTMLMediaElement.HAVE_CURRENT_DATA) {
+    return null;
+  }
+  sampleCtx.drawImage(video, 0, 0, SAMPLE_SIZE, SAMPLE_SIZE);
+  const data = sampleCtx.getImageData(0, 0, SAMPLE_SIZE, SAMPLE_SIZE).data;
+  let sum = 0;
+  for (let i = 0; i < data.length; i += 4) {
+    sum += 0.299 * data[i] + 0.587 * data[i + 1] + 0.114 * data[i + 2];
+  }
+  return sum / (SAMPLE_SIZE * SAMPLE_SIZE);
+}
+
+function scheduleSample(): void {
+  if (sampling) return;
+  sampling = true;
+  if ("requestVideoFrameCallback" in video) {
+    video.requestVideoFrameCallback(onSample);
+  } else {
+    requestAnimationFrame(onSample);
+  }
+}
+
+function onSample(): void {
+  sampling = false;
+  if (phase === "idle") return;
+  const luma = sampleLuma();
+  if (luma !== null) {
+    if (phase === "dark") {
+      baseline = luma;
+    } else if (marker && luma >= baseline + MARKER_DELTA) {
+      sendMessage({
+        type: "latency_marker",
+        seq: marker.seq,
+        captured_ms: marker.capturedMs,
+        relay_ms: Math.round((performance.now() - marker.drawnAt) * 10) / 10,
+      });
+      endCycle();
+      return;
+    }
+  }
+  scheduleSample();
+}
+
+function setPhase(next: Phase, delayMs: number, then: () => void): void {
+  phase = next;
+  if (phaseTimer !== null) window.clearTimeout(phaseTimer);
+  phaseTimer = window.setTimeout(then, delayMs);
+}
+
+function startCycle(): void {
+  if (!enabled) return;
+  marker = null;
+  setPhase("dark", DARK_MS, () =>
+    setPhase("marker", MARKER_TIMEOUT_MS, onTimeout),
+  );
+  scheduleSample();
+}
+
+function onTimeout(): void {
+  if (marker) {
+    sendMessage({
+      type: "latency_marker",
+      seq: marker.seq,
+      captured_ms: marker.capturedMs,
+      timeout: true,
+    });
+  }
+  endCycle();
+}
+
+function endCycle(): void {
+  marker = null;
+  setPhase("idle", intervalMs, startCycle);
+}
+
+function overrideFrame(stamp: FrameStamp | null): ImageData | null {
+  if (phase === "dark") {
+    return darkFrame;
+  }
+  if (phase !== "marker" || !stamp) {
+    return null;
+  }
+  if (!marker) {
+    marker = {
+      seq: stamp.seq,
+      capturedMs: stamp.capturedMs,
+      drawnAt: performance.now(),
+    };
+  }
+  return markerFrame;
+}
+
+export function initCalibration(outputVideo: HTMLVideoElement): void {
+  video = outputVideo;
+}
+
+export function setCalibration(on: boolean, interval?: number): void {
+  if (interval && interval > 0) intervalMs = interval;
+  if (on === enabled) return;
+  enabled = on;
+  if (!on) {
+    if (phaseTimer !== null) window.clearTimeout(phaseTimer);
+    phaseTimer = null;
+    phase = "idle";
+    marker = null;
+    setFrameOverride(null);
+    console.log("[Relay] Latency calibration stopped");
+    return;
+  }
+  if (!sampleCtx) {
+    const sampleCanvas = document.createElement("canvas");
+    sampleCanvas.width = sampleCanvas.height = SAMPLE_SIZE;
+    sampleCtx = sampleCanvas.getContext("2d", { willReadFrequently: true });
+    darkFrame = solidFrame(0);
+    markerFrame = solidFrame(255);
+  }
+  setFrameOverride(overrideFrame);
+  console.log("[Relay] Latency calibration started");
+  startCycle();
+}
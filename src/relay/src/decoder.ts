@@ -1,10 +1,36 @@
 type CanvasContext = ImageBitmapRenderingContext | CanvasRenderingContext2D;
 
+const RAW_FRAME_MAGIC = 0x44445246; // "DDRF"
+const RAW_FRAME_HEADER_BYTES = 8;
+const SEQ_FRAME_MAGIC = 0x44445351; // "DDSQ"
+const SEQ_FRAME_HEADER_BYTES = 16;
+
+export interface FrameStamp {
+  seq: number;
+  capturedMs: number;
+}
+
+export type FrameOverride = (stamp: FrameStamp | null) => ImageData | null;
+
+export interface DecodeStats {
+  frames: number;
+  dropped: number;
+  decodeMs: number;
+  lagMs: number;
+}
+
 let canvas: HTMLCanvasElement;
 let ctx: CanvasContext;
 let useBitmapRenderer: boolean;
 let latestFrame: ArrayBuffer | null = null;
+let latestReceivedAt = 0;
 let pendingDecode: Promise<void> | null = null;
+let frameOverride: FrameOverride | null = null;
+
+let statFrames = 0;
+let statDropped = 0;
+let statDecodeMs = 0;
+let statLagMs = 0;
 
 export function initDecoder(canvasEl: HTMLCanvasElement): void {
   canvas = canvasEl;
@@ -21,17 +47,87 @@ export function initDecoder(canvasEl: HTMLCanvasElement): void {
 }
 
 export function queueFrame(frame: ArrayBuffer): void {
+  if (latestFrame) statDropped++;
   latestFrame = frame;
+  latestReceivedAt = performance.now();
   decodeLoop();
 }
 
+export function setFrameOverride(override: FrameOverride | null): void {
+  frameOverride = override;
+}
+
+export function takeDecodeStats(): DecodeStats | null {
+  if (statFrames === 0 && statDropped === 0) return null;
+  const stats = {
+    frames: statFrames,
+    dropped: statDropped,
+    decodeMs: statFrames ? statDecodeMs / statFrames : 0,
+    lagMs: statFrames ? statLagMs / statFrames : 0,
+  };
+  statFrames = 0;
+  statDropped = 0;
+  statDecodeMs = 0;
+  statLagMs = 0;
+  return stats;
+}
+
+function readStamp(frame: ArrayBuffer): FrameStamp | null {
+  if (frame.byteLength < SEQ_FRAME_HEADER_BYTES) return null;
+  const view = new DataView(frame);
+  if (view.getUint32(0) !== SEQ_FRAME_MAGIC) return null;
+  return {
+    seq: view.getUint32(4, true),
+    capturedMs: view.getFloat64(8, true),
+  };
+}
+
+function toImageSource(
+  frame: ArrayBuffer,
+  offset: number,
+): ImageBitmapSource | null {
+  const view = new DataView(frame, offset);
+  if (
+    view.byteLength < RAW_FRAME_HEADER_BYTES ||
+    view.getUint32(0) !== RAW_FRAME_MAGIC
+  ) {
+    return new Blob([new Uint8Array(frame, offset)], { type: "image/jpeg" });
+  }
+  const width = view.getUint16(4, true);
+  const height = view.getUint16(6, true);
+  const length = width * height * 4;
+  if (!width || !height || view.byteLength < RAW_FRAME_HEADER_BYTES + length) {
+    return null;
+  }
+  const pixels = new Uint8ClampedArray(
+    frame,
+    offset + RAW_FRAME_HEADER_BYTES,
+    length,
+  );
+  return new ImageData(pixels, width, height);
+}
+
 function decodeLoop(): void {
   if (!latestFrame || pendingDecode) return;
 
   const frame = latestFrame;
+  const receivedAt = latestReceivedAt;
   latestFrame = null;
+  const decodeStart = performance.now();
+  const stamp = readStamp(frame);
+  const source =
+    (frameOverride && frameOverride(stamp)) ||
+    toImageSource(frame, stamp ? SEQ_FRAME_HEADER_BYTES : 0);
+  if (!source) {
+    statDropped++;
+    return;
+  }
 
-  pendingDecode = createImageBitmap(new Blob([frame], { type: "image/jpeg" }))
+  pendingDecode = createImageBitmap(source, {
+    resizeWidth: canvas.width,
+    resizeHeight: canvas.height,
+    resizeQuality: "low",
+  })
     .then((bitmap) => {
       if (useBitmapRenderer) {
         (ctx as ImageBitmapRenderingContext).transferFromImageBitmap(bitmap);
@@ -39,6 +135,10 @@ function decodeLoop(): void {
         (ctx as CanvasRenderingContext2D).drawImage(bitmap, 0, 0, 512, 512);
         bitmap.close();
       }
+      const now = performance.now();
+      statFrames++;
+      statDecodeMs += now - decodeStart;
+      statLagMs += now - receivedAt;
     })
     .catch(() => {})
     .finally(() => {
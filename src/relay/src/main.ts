@@ -1,5 +1,7 @@
+import { initCalibration, setCalibration } from "./calibration";
+import { FRAME_RATE } from "./config";
 import { initDecoder } from "./decoder";
-import { connectWebSocket } from "./websocket";
+import { connectWebSocket, onMessage } from "./websocket";
 import { RelayManager } from "./webrtc";
 import { startAuroraWorker, stopAuroraWorker } from "./aurora";
 
@@ -25,15 +27,21 @@ const relay = new RelayManager({
   outputVideo: outputVideo,
   onVideoStarted: hideStatus,
   onLog: log,
-  frameRate: 30,
+  frameRate: FRAME_RATE,
 });
 
 function init(): void {
   log("Starting...");
 
   initDecoder(canvas);
+  initCalibration(outputVideo);
   startAuroraWorker(auroraCanvas);
 
+  onMessage("swap_prepare", (message) => relay.prepareSwap(message.id));
+  onMessage("swap_cancel", () => relay.cancelSwap());
+  onMessage("latency_calibration", (message) =>
+    setCalibration(!!message.enabled, message.interval_ms),
+  );
   connectWebSocket();
   setTimeout(() => relay.warmup(), 100);
   relay.start();
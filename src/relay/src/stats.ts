@@ -0,0 +1,159 @@
+type StatsEntry = Record<string, any>;
+
+export interface StatsSample {
+  at: number;
+  rtp: StatsEntry | null;
+  remote: StatsEntry | null;
+  pair: StatsEntry | null;
+}
+
+export type StatsSummary = Record<string, number | string | null>;
+
+function round(value: number, digits = 1): number {
+  const scale = 10 ** digits;
+  return Math.round(value * scale) / scale;
+}
+
+function delta(
+  current: StatsEntry | null,
+  previous: StatsEntry | null,
+  key: string,
+): number | null {
+  if (!current || !previous) return null;
+  const a = current[key];
+  const b = previous[key];
+  if (typeof a !== "number" || typeof b !== "number" || a < b) return null;
+  return a - b;
+}
+
+function ms(value: unknown): number | null {
+  return typeof value === "number" ? round(value * 1000) : null;
+}
+
+export function sampleStats(
+  report: RTCStatsReport,
+  rtpType: "outbound-rtp" | "inbound-rtp",
+): StatsSample {
+  let rtp: StatsEntry | null = null;
+  let pair: StatsEntry | null = null;
+  for (const entry of report.values() as Iterable<StatsEntry>) {
+    if (entry.type === rtpType && entry.kind === "video") {
+      rtp = entry;
+    } else if (
+      entry.type === "candidate-pair" &&
+      entry.state === "succeeded" &&
+      (entry.nominated || !pair)
+    ) {
+      pair = entry;
+    }
+  }
+  const remoteId = rtp?.remoteId;
+  const remote = remoteId ? (report.get(remoteId) ?? null) : null;
+  return { at: performance.now(), rtp, remote, pair };
+}
+
+function rates(
+  current: StatsSample,
+  previous: StatsSample | null,
+  bytesKey: string,
+  framesKey: string,
+): { seconds: number; frames: number | null; summary: StatsSummary } {
+  const seconds = previous ? (current.at - previous.at) / 1000 : 0;
+  const bytes = previous ? delta(current.rtp, previous.rtp, bytesKey) : null;
+  const frames = previous ? delta(current.rtp, previous.rtp, framesKey) : null;
+  return {
+    seconds,
+    frames,
+    summary: {
+      fps:
+        frames !== null && seconds > 0
+          ? round(frames / seconds)
+          : (current.rtp?.framesPerSecond ?? null),
+      bitrate_kbps:
+        bytes !== null && seconds > 0
+          ? round((bytes * 8) / seconds / 1000)
+          : null,
+      rtt_ms: ms(current.pair?.currentRoundTripTime),
+    },
+  };
+}
+
+function lossPct(lost: number | null, received: number | null): number | null {
+  if (lost === null || received === null || lost + received === 0) return null;
+  return round((lost / (lost + received)) * 100, 2);
+}
+
+export function summarizeOutbound(
+  current: StatsSample,
+  previous: StatsSample | null,
+): StatsSummary {
+  const { frames, summary } = rates(
+    current,
+    previous,
+    "bytesSent",
+    "framesEncoded",
+  );
+  const encodeS = previous
+    ? delta(current.rtp, previous.rtp, "totalEncodeTime")
+    : null;
+  const lost = previous
+    ? delta(current.remote, previous.remote, "packetsLost")
+    : null;
+  const sent = previous
+    ? delta(current.rtp, previous.rtp, "packetsSent")
+    : null;
+  return {
+    ...summary,
+    encode_ms:
+      encodeS !== null && frames
+        ? round((encodeS / frames) * 1000, 2)
+        : null,
+    jitter_ms: ms(current.remote?.jitter),
+    loss_pct:
+      lost !== null && sent !== null ? lossPct(lost, sent - lost) : null,
+    available_kbps:
+      typeof current.pair?.availableOutgoingBitrate === "number"
+        ? round(current.pair.availableOutgoingBitrate / 1000)
+        : null,
+    quality_limit: current.rtp?.qualityLimitationReason ?? null,
+  };
+}
+
+export function summarizeInbound(
+  current: StatsSample,
+  previous: StatsSample | null,
+): StatsSummary {
+  const { frames, summary } = rates(
+    current,
+    previous,
+    "bytesReceived",
+    "framesDecoded",
+  );
+  const decodeS = previous
+    ? delta(current.rtp, previous.rtp, "totalDecodeTime")
+    : null;
+  const bufferS = previous
+    ? delta(current.rtp, previous.rtp, "jitterBufferDelay")
+    : null;
+  const emitted = previous
+    ? delta(current.rtp, previous.rtp, "jitterBufferEmittedCount")
+    : null;
+  return {
+    ...summary,
+    decode_ms:
+      decodeS !== null && frames
+        ? round((decodeS / frames) * 1000, 2)
+        : null,
+    jitter_ms: ms(current.rtp?.jitter),
+    jitter_buffer_ms:
+      bufferS !== null && emitted ? round((bufferS / emitted) * 1000) : null,
+    loss_pct: lossPct(
+      previous ? delta(current.rtp, previous.rtp, "packetsLost") : null,
+      previous ? delta(current.rtp, previous.rtp, "packetsReceived") : null,
+    ),
+    frames_dropped: previous
+      ? delta(current.rtp, previous.rtp, "framesDropped")
+      : null,
+    freezes: previous ? delta(current.rtp, previous.rtp, "freezeCount") : null,
+  };
+}
@@ -1,4 +1,10 @@
-import { SDP_ORIGIN, WHIP_PROXY, WHEP_PROXY } from "./config";
+import { ORIGIN, WHIP_PROXY, WHEP_PROXY } from "./config";
+import {
+  cancelSdpPush,
+  isWebSocketOpen,
+  sendMessage,
+  waitForSdpPush,
+} from "./websocket";
 import {
   DEFAULT_ICE_SERVERS,
   DEFAULT_VIDEO_BITRATE,
@@ -8,6 +14,12 @@ import {
   type WHIPResponseResult,
 } from "./types";
 import { ConnectionError, NetworkError } from "./errors";
+import {
+  type StatsSample,
+  sampleStats,
+  summarizeInbound,
+  summarizeOutbound,
+} from "./stats";
 import {
   type PeerConnectionFactory,
   type FetchFn,
@@ -17,6 +29,16 @@ import {
   defaultTimerProvider,
 } from "./dependencies";
 
+const SDP_POLL_MS = 100;
+const SDP_FALLBACK_POLL_MS = 1000;
+const WHEP_MAX_RETRIES = 30;
+const SWAP_SLOT = "?slot=next";
+const SWAP_TIMEOUT_MS = 30000;
+const WEBRTC_STATS_INTERVAL_MS = 1000;
+
+type SdpKind = "whip" | "whep";
+type SdpResult = { ok: true; sdp: string } | { ok: false; status: number };
+
 const PLAYBACK_ID_PATTERN = /([/+])([^/+?]+)$/;
 const PLAYBACK_ID_PLACEHOLDER = "__PLAYBACK_ID__";
 
@@ -676,6 +698,23 @@ export class WHEPClient {
   }
 }
 
+function waitForPlaying(
+  video: HTMLVideoElement,
+  timeoutMs: number,
+): Promise<void> {
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      video.removeEventListener("playing", onPlaying);
+      reject(new Error("Timed out waiting for swap video"));
+    }, timeoutMs);
+    const onPlaying = () => {
+      clearTimeout(timer);
+      resolve();
+    };
+    video.addEventListener("playing", onPlaying, { once: true });
+  });
+}
+
 export interface RelayManagerConfig {
   inputCanvas: HTMLCanvasElement;
   outputVideo: HTMLVideoElement;
@@ -686,7 +725,7 @@ export interface RelayManagerConfig {
 
 export class RelayManager {
   private readonly canvas: HTMLCanvasElement;
-  private readonly video: HTMLVideoElement;
+  private video: HTMLVideoElement;
   private readonly onVideoStarted?: () => void;
   private readonly log: (message: string) => void;
   private readonly frameRate: number;
@@ -696,6 +735,12 @@ export class RelayManager {
   private canvasStream: MediaStream | null = null;
   private videoStarted = false;
   private pollTimer: number | null = null;
+  private whipPc: RTCPeerConnection | null = null;
+  private whepPc: RTCPeerConnection | null = null;
+  private swapId: number | null = null;
+  private statsTimer: number | null = null;
+  private whipSample: StatsSample | null = null;
+  private whepSample: StatsSample | null = null;
 
   constructor(config: RelayManagerConfig) {
     this.canvas = config.inputCanvas;
@@ -766,6 +811,7 @@ export class RelayManager {
       });
 
       const pc = await this.setupWHIPWithPolling(videoTrack);
+      this.whipPc = pc;
 
       pc.oniceconnectionstatechange = () => {
         console.log("[Relay] WHIP ICE:", pc.iceConnectionState);
@@ -777,6 +823,7 @@ export class RelayManager {
       };
 
       await this.startWHEP();
+      this.startStatsReporting();
     } catch (e) {
       console.error("[Relay] WHIP error:", e);
       this.log("Connection error");
@@ -785,6 +832,7 @@ export class RelayManager {
 
   private async setupWHIPWithPolling(
     videoTrack: MediaStreamTrack,
+    url = WHIP_PROXY,
   ): Promise<RTCPeerConnection> {
     const pc = defaultPeerConnectionFactory.create({
       iceServers: DEFAULT_ICE_SERVERS,
@@ -799,7 +847,8 @@ export class RelayManager {
     const offer = await pc.createOffer();
     await pc.setLocalDescription(offer);
 
-    const response = await fetch(WHIP_PROXY, {
+    const startedAt = performance.now();
+    const response = await fetch(url, {
       method: "POST",
       headers: { "Content-Type": "application/sdp" },
       body: pc.localDescription!.sdp,
@@ -807,7 +856,7 @@ export class RelayManager {
 
     if (response.status === 202) {
       const { id } = await response.json();
-      await this.pollWHIPResult(id, pc);
+      await this.pollWHIPResult(id, pc, startedAt);
     } else if (response.ok) {
       const answerSdp = await response.text();
       console.log("[Relay] Got WHIP answer");
@@ -822,22 +871,73 @@ export class RelayManager {
   private async pollWHIPResult(
     id: string,
     pc: RTCPeerConnection,
+    startedAt: number,
   ): Promise<void> {
-    const poll = async (): Promise<void> => {
-      const response = await fetch(SDP_ORIGIN + "/whip/result/" + id);
-      if (response.status === 202) {
-        await new Promise((r) => setTimeout(r, 100));
-        return poll();
-      }
-      if (!response.ok) {
-        throw new Error("WHIP proxy error: " + response.status);
-      }
-      const answerSdp = await response.text();
-      console.log("[Relay] Got WHIP answer");
-      await pc.setRemoteDescription({ type: "answer", sdp: answerSdp });
-    };
+    const result = await this.awaitSdpResult("whip", id, startedAt);
+    if (!result.ok) {
+      throw new Error("WHIP proxy error: " + result.status);
+    }
+    console.log("[Relay] Got WHIP answer");
+    await pc.setRemoteDescription({ type: "answer", sdp: result.sdp });
+  }
 
-    await poll();
+  private awaitSdpResult(
+    kind: SdpKind,
+    id: string,
+    startedAt: number,
+  ): Promise<SdpResult> {
+    return new Promise((resolve) => {
+      let settled = false;
+
+      const finish = (result: SdpResult, mode: "push" | "poll") => {
+        if (settled) return;
+        settled = true;
+        cancelSdpPush(id);
+        sendMessage({
+          type: "sdp_timing",
+          kind,
+          mode,
+          setup_ms: Math.round((performance.now() - startedAt) * 100) / 100,
+        });
+        resolve(result);
+      };
+
+      const schedulePoll = () => {
+        const delay = isWebSocketOpen() ? SDP_FALLBACK_POLL_MS : SDP_POLL_MS;
+        setTimeout(() => void poll(), delay);
+      };
+
+      const poll = async (): Promise<void> => {
+        if (settled) return;
+        try {
+          const response = await fetch(`${ORIGIN}/${kind}/result/${id}`);
+          if (settled) return;
+          if (response.status === 202) {
+            schedulePoll();
+          } else if (!response.ok) {
+            finish({ ok: false, status: response.status }, "poll");
+          } else {
+            finish({ ok: true, sdp: await response.text() }, "poll");
+          }
+        } catch {
+          schedulePoll();
+        }
+      };
+
+      waitForSdpPush(id, (result) => {
+        if (result.status === "ready" && result.sdp) {
+          finish({ ok: true, sdp: result.sdp }, "push");
+        } else {
+          finish({ ok: false, status: 500 }, "push");
+        }
+      });
+
+      if (isWebSocketOpen()) {
+        schedulePoll();
+      } else {
+        void poll();
+      }
+    });
   }
 
   private setH264Preference(transceiver: RTCRtpTransceiver): void {
@@ -874,13 +974,17 @@ export class RelayManager {
         },
       });
 
-      await this.setupWHEPWithPolling();
+      this.whepPc = await this.setupWHEPWithPolling();
     } catch (e) {
       console.error("[Relay] WHEP error:", e);
     }
   }
 
-  private async setupWHEPWithPolling(): Promise<void> {
+  private async setupWHEPWithPolling(
+    url = WHEP_PROXY,
+    video = this.video,
+    attempt = 0,
+  ): Promise<RTCPeerConnection | null> {
     const pc = defaultPeerConnectionFactory.create({
       iceServers: DEFAULT_ICE_SERVERS,
       iceCandidatePoolSize: 10,
@@ -889,7 +993,7 @@ export class RelayManager {
     pc.ontrack = (e) => {
       console.log("[Relay] WHEP track:", e.track.kind);
       if (e.track.kind === "video") {
-        this.video.srcObject = e.streams[0] || new MediaStream([e.track]);
+        video.srcObject = e.streams[0] || new MediaStream([e.track]);
         if (!this.videoStarted) {
           this.log("Starting stream...");
         }
@@ -903,10 +1007,10 @@ export class RelayManager {
     await pc.setLocalDescription(offer);
 
     let retries = 0;
-    const maxRetries = 30;
 
-    const attemptConnect = async (): Promise<void> => {
-      const response = await fetch(WHEP_PROXY, {
+    const attemptConnect = async (): Promise<RTCPeerConnection | null> => {
+      const startedAt = performance.now();
+      const response = await fetch(url, {
         method: "POST",
         headers: { "Content-Type": "application/sdp" },
         body: pc.localDescription!.sdp,
@@ -914,52 +1018,162 @@ export class RelayManager {
 
       if (response.status === 202) {
         const { id } = await response.json();
-        await this.pollWHEPResult(id, pc);
-        return;
+        return this.pollWHEPResult(id, pc, startedAt, url, video, attempt);
       }
 
       if (!response.ok) {
-        if (retries < maxRetries) {
+        if (retries < WHEP_MAX_RETRIES) {
           retries++;
           await new Promise((r) => setTimeout(r, 100));
           return attemptConnect();
         }
+        pc.close();
         throw new Error("WHEP failed after retries");
       }
 
       const answerSdp = await response.text();
       await pc.setRemoteDescription({ type: "answer", sdp: answerSdp });
+      return pc;
     };
 
-    await attemptConnect();
+    return attemptConnect();
   }
 
   private async pollWHEPResult(
     id: string,
     pc: RTCPeerConnection,
-  ): Promise<void> {
-    let retries = 0;
-    const maxRetries = 30;
+    startedAt: number,
+    url: string,
+    video: HTMLVideoElement,
+    attempt: number,
+  ): Promise<RTCPeerConnection | null> {
+    const result = await this.awaitSdpResult("whep", id, startedAt);
+    if (!result.ok) {
+      pc.close();
+      if (attempt < WHEP_MAX_RETRIES) {
+        await new Promise((r) => setTimeout(r, 100));
+        return this.setupWHEPWithPolling(url, video, attempt + 1);
+      }
+      return null;
+    }
+    await pc.setRemoteDescription({ type: "answer", sdp: result.sdp });
+    return pc;
+  }
 
-    const poll = async (): Promise<void> => {
-      const response = await fetch(SDP_ORIGIN + "/whep/result/" + id);
-      if (response.status === 202) {
-        await new Promise((r) => setTimeout(r, 0));
-        return poll();
+  async prepareSwap(id: number): Promise<void> {
+    const videoTrack = this.canvasStream?.getVideoTracks()[0];
+    if (!videoTrack || !this.whipPc) {
+      sendMessage({ type: "swap_failed", id, error: "Relay not streaming" });
+      return;
+    }
+    this.swapId = id;
+    console.log("[Relay] Preparing stream swap", id);
+
+    const nextVideo = this.video.cloneNode() as HTMLVideoElement;
+    nextVideo.removeAttribute("id");
+    nextVideo.style.position = "absolute";
+    nextVideo.style.inset = "0";
+    nextVideo.style.visibility = "hidden";
+    this.video.after(nextVideo);
+
+    let whipPc: RTCPeerConnection | null = null;
+    let whepPc: RTCPeerConnection | null = null;
+    try {
+      whipPc = await this.setupWHIPWithPolling(
+        videoTrack,
+        WHIP_PROXY + SWAP_SLOT,
+      );
+      const publishingAt = performance.now();
+      whepPc = await this.setupWHEPWithPolling(
+        WHEP_PROXY + SWAP_SLOT,
+        nextVideo,
+      );
+      if (!whepPc) {
+        throw new Error("WHEP failed for swap stream");
       }
-      if (!response.ok) {
-        if (retries < maxRetries) {
-          retries++;
-          await new Promise((r) => setTimeout(r, 100));
-          return this.setupWHEPWithPolling();
-        }
-        return;
+      await waitForPlaying(nextVideo, SWAP_TIMEOUT_MS);
+      if (this.swapId !== id) {
+        throw new Error("Swap superseded");
       }
-      const answerSdp = await response.text();
-      await pc.setRemoteDescription({ type: "answer", sdp: answerSdp });
-    };
 
-    await poll();
+      const oldVideo = this.video;
+      const oldWhip = this.whipPc;
+      const oldWhep = this.whepPc;
+      nextVideo.style.visibility = "visible";
+      oldVideo.remove();
+      nextVideo.id = "output-video";
+      nextVideo.onplaying = () => this.handleVideoPlaying();
+      this.video = nextVideo;
+      this.whipPc = whipPc;
+      this.whepPc = whepPc;
+      this.whipSample = null;
+      this.whepSample = null;
+      oldWhip?.close();
+      oldWhep?.close();
+
+      const overlapMs = performance.now() - publishingAt;
+      console.log("[Relay] Stream swap complete", id);
+      sendMessage({
+        type: "swap_complete",
+        id,
+        overlap_ms: Math.round(overlapMs * 100) / 100,
+      });
+    } catch (e) {
+      console.error("[Relay] Swap error:", e);
+      whipPc?.close();
+      whepPc?.close();
+      nextVideo.remove();
+      sendMessage({ type: "swap_failed", id, error: String(e) });
+    } finally {
+      if (this.swapId === id) this.swapId = null;
+    }
+  }
+
+  cancelSwap(): void {
+    this.swapId = null;
+  }
+
+  private startStatsReporting(): void {
+    if (this.statsTimer !== null) return;
+    this.statsTimer = defaultTimerProvider.setInterval(
+      () => void this.reportStats(),
+      WEBRTC_STATS_INTERVAL_MS,
+    );
+  }
+
+  private stopStatsReporting(): void {
+    if (this.statsTimer !== null) {
+      defaultTimerProvider.clearInterval(this.statsTimer);
+      this.statsTimer = null;
+    }
+    this.whipSample = null;
+    this.whepSample = null;
+  }
+
+  private async reportStats(): Promise<void> {
+    if (!isWebSocketOpen()) return;
+    const whipPc = this.whipPc;
+    const whepPc = this.whepPc;
+    try {
+      const [whipReport, whepReport] = await Promise.all([
+        whipPc?.getStats() ?? null,
+        whepPc?.getStats() ?? null,
+      ]);
+      const message: Record<string, unknown> = { type: "webrtc_stats" };
+      if (whipReport && whipPc === this.whipPc) {
+        const sample = sampleStats(whipReport, "outbound-rtp");
+        message.whip = summarizeOutbound(sample, this.whipSample);
+        this.whipSample = sample;
+      }
+      if (whepReport && whepPc === this.whepPc) {
+        const sample = sampleStats(whepReport, "inbound-rtp");
+        message.whep = summarizeInbound(sample, this.whepSample);
+        this.whepSample = sample;
+      }
+      if (message.whip || message.whep) sendMessage(message);
+    } catch {
+      // Stats collection failed
+    }
   }
 
   private handleVideoPlaying(): void {
@@ -986,6 +1200,13 @@ export class RelayManager {
       this.whepClient = null;
     }
 
+    this.whipPc?.close();
+    this.whipPc = null;
+    this.whepPc?.close();
+    this.whepPc = null;
+    this.swapId = null;
+    this.stopStatsReporting();
+
     if (this.canvasStream) {
       this.canvasStream.getTracks().forEach((t) => t.stop());
       this.canvasStream = null;
@@ -1,22 +1,106 @@
-import { WS_URL } from "./config";
-import { queueFrame } from "./decoder";
+import { RELAY_FEATURES, WS_URL } from "./config";
+import { queueFrame, takeDecodeStats } from "./decoder";
+
+const STATS_INTERVAL_MS = 500;
+
+export interface SdpPushResult {
+  status: "ready" | "error";
+  sdp?: string;
+  error?: string;
+}
 
 let ws: WebSocket | null = null;
+let statsTimer: number | null = null;
+const sdpWaiters = new Map<string, (result: SdpPushResult) => void>();
+const messageHandlers = new Map<string, (message: any) => void>();
+
+export function isWebSocketOpen(): boolean {
+  return ws !== null && ws.readyState === WebSocket.OPEN;
+}
+
+export function sendMessage(message: object): void {
+  if (ws && ws.readyState === WebSocket.OPEN) {
+    ws.send(JSON.stringify(message));
+  }
+}
+
+export function waitForSdpPush(
+  id: string,
+  onResult: (result: SdpPushResult) => void,
+): void {
+  sdpWaiters.set(id, onResult);
+}
+
+export function cancelSdpPush(id: string): void {
+  sdpWaiters.delete(id);
+}
+
+export function onMessage(
+  type: string,
+  handler: (message: any) => void,
+): void {
+  messageHandlers.set(type, handler);
+}
+
+function handleTextMessage(data: string): void {
+  let message: { type?: string; id?: string } & SdpPushResult;
+  try {
+    message = JSON.parse(data);
+  } catch {
+    return;
+  }
+  if (message.type === "sdp_result" && message.id) {
+    const waiter = sdpWaiters.get(message.id);
+    if (waiter) {
+      sdpWaiters.delete(message.id);
+      waiter(message);
+    }
+    return;
+  }
+  const handler = message.type ? messageHandlers.get(message.type) : undefined;
+  if (handler) {
+    handler(message);
+  }
+}
+
+function reportDecodeStats(): void {
+  const stats = takeDecodeStats();
+  if (!stats) return;
+  sendMessage({
+    type: "decode_stats",
+    frames: stats.frames,
+    dropped: stats.dropped,
+    decode_ms: Math.round(stats.decodeMs * 100) / 100,
+    lag_ms: Math.round(stats.lagMs * 100) / 100,
+  });
+}
 
 export function connectWebSocket(): void {
   ws = new WebSocket(WS_URL);
   ws.binaryType = "arraybuffer";
 
-  ws.onopen = () => console.log("[Relay] WebSocket connected");
+  ws.onopen = () => {
+    console.log("[Relay] WebSocket connected");
+    sendMessage({ type: "hello", features: RELAY_FEATURES });
+    if (statsTimer === null) {
+      statsTimer = window.setInterval(reportDecodeStats, STATS_INTERVAL_MS);
+    }
+  };
 
   ws.onmessage = (e) => {
     if (e.data instanceof ArrayBuffer) {
       queueFrame(e.data);
+    } else if (typeof e.data === "string") {
+      handleTextMessage(e.data);
     }
   };
 
   ws.onclose = () => {
     console.log("[Relay] WebSocket closed, reconnecting...");
+    if (statsTimer !== null) {
+      window.clearInterval(statsTimer);
+      statsTimer = null;
+    }
     setTimeout(connectWebSocket, 1000);
   };
 }